@@ -0,0 +1,304 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, insert, delete, func, literal, literal_column, or_
+import config
+from database import get_session, AnalyticsDaily, SystemState, User, Request, Vacation, Activity, Poll
+
+logger = logging.getLogger(__name__)
+
+# Ключ отметки последнего пересчёта в system_state
+WATERMARK_KEY = 'analytics_rollup_watermark'
+
+PERIOD_DAYS = {'week': 7, 'month': 30, 'quarter': 90, 'year': 365}
+
+MONTH_LABELS = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+
+def _empty():
+    return literal_column("''")
+
+def _daily_rollups(start, end):
+    """Запросы INSERT ... SELECT для событийных метрик за [start, end)"""
+    requests_day = func.date(Request.created_at)
+    vacations_day = func.date(Vacation.start_date)
+    activities_day = func.date(Activity.created_at)
+    users_day = func.date(User.created_at)
+    polls_day = func.date(Poll.created_at)
+
+    return [
+        select(requests_day.label('day'), literal('requests_status').label('metric'),
+               func.coalesce(Request.status, _empty()).label('dimension'), func.count().label('value'))
+        .where(Request.created_at >= start, Request.created_at < end)
+        .group_by('day', 'dimension'),
+
+        select(requests_day.label('day'), literal('requests_type').label('metric'),
+               func.coalesce(Request.request_type, _empty()).label('dimension'), func.count().label('value'))
+        .where(Request.created_at >= start, Request.created_at < end)
+        .group_by('day', 'dimension'),
+
+        select(vacations_day.label('day'), literal('vacation_days').label('metric'),
+               _empty().label('dimension'), func.coalesce(func.sum(Vacation.days_count), 0).label('value'))
+        .where(Vacation.start_date >= start, Vacation.start_date < end)
+        .group_by('day'),
+
+        select(vacations_day.label('day'), literal('vacations_status').label('metric'),
+               func.coalesce(Vacation.status, _empty()).label('dimension'), func.count().label('value'))
+        .where(Vacation.start_date >= start, Vacation.start_date < end)
+        .group_by('day', 'dimension'),
+
+        select(activities_day.label('day'), literal('activities').label('metric'),
+               _empty().label('dimension'), func.count().label('value'))
+        .where(Activity.created_at >= start, Activity.created_at < end)
+        .group_by('day'),
+
+        select(users_day.label('day'), literal('users_registered').label('metric'),
+               _empty().label('dimension'), func.count().label('value'))
+        .where(User.created_at >= start, User.created_at < end)
+        .group_by('day'),
+
+        select(polls_day.label('day'), literal('polls').label('metric'),
+               _empty().label('dimension'), func.count().label('value'))
+        .where(Poll.created_at >= start, Poll.created_at < end)
+        .group_by('day'),
+    ]
+
+DAILY_METRICS = ['requests_status', 'requests_type', 'vacation_days', 'vacations_status',
+                 'activities', 'users_registered', 'polls']
+
+def refresh_range(db_session, first_day, last_day):
+    """Пересчёт событийных метрик за дни [first_day, last_day] (идемпотентно)"""
+    start = datetime.combine(first_day, datetime.min.time())
+    end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+    columns = ['day', 'metric', 'dimension', 'value']
+
+    db_session.execute(
+        delete(AnalyticsDaily).where(
+            AnalyticsDaily.day >= first_day,
+            AnalyticsDaily.day <= last_day,
+            AnalyticsDaily.metric.in_(DAILY_METRICS),
+        )
+    )
+    for rollup in _daily_rollups(start, end):
+        db_session.execute(insert(AnalyticsDaily).from_select(columns, rollup))
+
+def snapshot_headcount(db_session, day):
+    """Снимок численности активных сотрудников по отделам на день"""
+    db_session.execute(
+        delete(AnalyticsDaily).where(AnalyticsDaily.day == day, AnalyticsDaily.metric == 'headcount_department')
+    )
+    db_session.execute(
+        insert(AnalyticsDaily).from_select(
+            ['day', 'metric', 'dimension', 'value'],
+            select(literal(day).label('day'), literal('headcount_department').label('metric'),
+                   func.coalesce(User.department, _empty()).label('dimension'), func.count().label('value'))
+            .where(or_(User.is_active.is_(True), User.is_active.is_(None)))
+            .group_by('dimension')
+        )
+    )
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+def _dirty_days(db_session, since):
+    """Дни, затронутые изменениями после отметки since"""
+    queries = [
+        select(func.date(Request.created_at)).where(or_(Request.created_at >= since, Request.updated_at >= since)),
+        select(func.date(Vacation.start_date)).where(or_(Vacation.created_at >= since, Vacation.updated_at >= since)),
+        select(func.date(Activity.created_at)).where(Activity.created_at >= since),
+        select(func.date(User.created_at)).where(User.created_at >= since),
+        select(func.date(Poll.created_at)).where(Poll.created_at >= since),
+    ]
+    days = set()
+    for query in queries:
+        days.update(_as_date(day) for day in db_session.execute(query.distinct()).scalars() if day)
+    return days
+
+def _contiguous_ranges(days):
+    """Группировка дней в непрерывные диапазоны"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+def update_rollups(rebuild_days=None):
+    """Инкрементальный пересчёт агрегатов
+
+    Пересчитываются только дни, затронутые изменениями после прошлого запуска
+    (при первом запуске — вся история). rebuild_days принудительно пересчитывает
+    последние N дней, чтобы учесть удаления и изменения без updated_at.
+    """
+    db_session = get_session()
+    started_at = datetime.utcnow()
+    today = started_at.date()
+
+    try:
+        state = db_session.query(SystemState).filter_by(key=WATERMARK_KEY).with_for_update().first()
+        if state is None:
+            state = SystemState(key=WATERMARK_KEY)
+            db_session.add(state)
+            db_session.flush()
+
+        if state.value:
+            days = _dirty_days(db_session, datetime.fromisoformat(state.value))
+        else:
+            columns = (Request.created_at, Vacation.start_date, Activity.created_at, User.created_at, Poll.created_at)
+            earliest = [db_session.execute(select(func.min(column))).scalar() for column in columns]
+            earliest = [_as_date(value) for value in earliest if value]
+            first = min(earliest) if earliest else today
+            days = {first + timedelta(days=i) for i in range((today - first).days + 1)}
+
+        if rebuild_days:
+            days.update(today - timedelta(days=i) for i in range(rebuild_days))
+        days.add(today)
+
+        ranges = _contiguous_ranges(days)
+        for first_day, last_day in ranges:
+            refresh_range(db_session, first_day, last_day)
+        snapshot_headcount(db_session, today)
+
+        state.value = started_at.isoformat()
+        db_session.commit()
+        logger.info(f"Агрегаты аналитики обновлены: {len(days)} дн. в {len(ranges)} диапазонах")
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка при обновлении агрегатов аналитики: {e}")
+    finally:
+        db_session.close()
+
+def rebuild_recent_rollups():
+    update_rollups(rebuild_days=config.ANALYTICS_ROLLUP_REBUILD_DAYS)
+
+def resolve_period(period=None, date_from=None, date_to=None):
+    """Диапазон дат из параметров запроса (period или date_from/date_to)"""
+    today = datetime.utcnow().date()
+
+    if date_from and date_to:
+        first_day = date.fromisoformat(date_from)
+        last_day = date.fromisoformat(date_to)
+        if first_day > last_day:
+            first_day, last_day = last_day, first_day
+        return first_day, last_day
+
+    days = PERIOD_DAYS.get(period or 'week', PERIOD_DAYS['week'])
+    return today - timedelta(days=days - 1), today
+
+def analytics_for_range(db_session, first_day, last_day):
+    """Метрики и данные графиков за диапазон — только из дневных агрегатов"""
+    rows = db_session.execute(
+        select(AnalyticsDaily.day, AnalyticsDaily.metric, AnalyticsDaily.dimension, AnalyticsDaily.value)
+        .where(AnalyticsDaily.day >= first_day, AnalyticsDaily.day <= last_day,
+               AnalyticsDaily.metric.in_(DAILY_METRICS))
+    ).all()
+
+    headcount_day = select(func.max(AnalyticsDaily.day)).where(
+        AnalyticsDaily.metric == 'headcount_department', AnalyticsDaily.day <= last_day
+    ).scalar_subquery()
+    headcount = db_session.execute(
+        select(AnalyticsDaily.dimension, AnalyticsDaily.value)
+        .where(AnalyticsDaily.metric == 'headcount_department', AnalyticsDaily.day == headcount_day)
+        .order_by(AnalyticsDaily.value.desc())
+    ).all()
+
+    by_day = defaultdict(lambda: defaultdict(int))
+    requests_by_status = defaultdict(int)
+    requests_by_type = defaultdict(int)
+    vacations_by_status = defaultdict(int)
+    vacation_days_by_month = defaultdict(int)
+    totals = defaultdict(int)
+
+    for day, metric, dimension, value in rows:
+        day = _as_date(day)
+        value = value or 0
+        totals[metric] += value
+        if metric == 'requests_status':
+            by_day[day]['requests'] += value
+            by_day[day][f'requests_{dimension}'] += value
+            requests_by_status[dimension] += value
+        elif metric == 'requests_type':
+            requests_by_type[dimension or 'Другое'] += value
+        elif metric == 'vacation_days':
+            vacation_days_by_month[(day.year, day.month)] += value
+        elif metric == 'vacations_status':
+            vacations_by_status[dimension] += value
+        elif metric == 'activities':
+            by_day[day]['activities'] += value
+
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    day_labels = [day.strftime('%d.%m') for day in days]
+
+    months = []
+    cursor = date(first_day.year, first_day.month, 1)
+    while cursor <= last_day:
+        months.append((cursor.year, cursor.month))
+        cursor = date(cursor.year + cursor.month // 12, cursor.month % 12 + 1, 1)
+
+    total_requests = totals['requests_status']
+    approved = requests_by_status.get('approved', 0)
+    approval_rate = round(approved / total_requests * 100, 1) if total_requests else 0
+
+    return {
+        'period': {'date_from': first_day.isoformat(), 'date_to': last_day.isoformat()},
+        'metrics': {
+            'total_users': sum(value for _, value in headcount),
+            'registered': totals['users_registered'],
+            'visitors_today': totals['users_registered'],
+            'total_requests': total_requests,
+            'approved_requests': approved,
+            'rejected_requests': requests_by_status.get('rejected', 0),
+            'pending_requests': requests_by_status.get('pending', 0),
+            'approval_rate': approval_rate,
+            'active_vacations': vacations_by_status.get('approved', 0),
+            'vacation_days_total': totals['vacation_days'],
+            'total_polls': totals['polls'],
+            'total_visits': totals['activities'],
+        },
+        'charts': {
+            'requests': {
+                'labels': day_labels,
+                'total': [by_day[day]['requests'] for day in days],
+                'approved': [by_day[day]['requests_approved'] for day in days],
+                'rejected': [by_day[day]['requests_rejected'] for day in days],
+            },
+            'vacations': {
+                'labels': [f"{MONTH_LABELS[month - 1]} {year}" for year, month in months],
+                'data': [vacation_days_by_month[key] for key in months],
+            },
+            'types': {
+                'labels': list(requests_by_type.keys()),
+                'data': list(requests_by_type.values()),
+            },
+            'departments': {
+                'labels': [dimension or 'Не указан' for dimension, _ in headcount],
+                'data': [value for _, value in headcount],
+            },
+            'activity': {
+                'labels': day_labels,
+                'data': [by_day[day]['activities'] for day in days],
+            },
+        },
+        'tables': {
+            'requests': [{
+                'period': f"{first_day.strftime('%d.%m.%Y')} — {last_day.strftime('%d.%m.%Y')}",
+                'total': total_requests,
+                'approved': approved,
+                'rejected': requests_by_status.get('rejected', 0),
+                'pending': requests_by_status.get('pending', 0),
+                'approval_rate': approval_rate,
+            }],
+        },
+    }
+
+def register_jobs(scheduler):
+    """Задачи пересчёта агрегатов: частый инкрементальный, ночной за последние дни и при старте"""
+    scheduler.add_job(update_rollups, 'interval', minutes=config.ANALYTICS_ROLLUP_INTERVAL_MINUTES,
+                      id='analytics_rollup', replace_existing=True)
+    scheduler.add_job(rebuild_recent_rollups, 'cron', hour=3, minute=0,
+                      id='analytics_rollup_rebuild', replace_existing=True)
+    scheduler.add_job(update_rollups, id='analytics_rollup_catch_up', replace_existing=True)
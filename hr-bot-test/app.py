@@ -1,48 +1,62 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, g, abort, send_file
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import config
-from database import get_session, User, Vacation, Request, News, Activity, Notification, Reminder, PurchaseExecutor, Broadcast, KnowledgeCategory, KnowledgeArticle, Poll, Onboarding, RequestTemplate, RequestFile, PollQuestion
+from database import get_session, get_pool_stats, connection_owner, User, Vacation, Request, News, Activity, Notification, Reminder, PurchaseExecutor, Broadcast, KnowledgeCategory, KnowledgeArticle, Poll, Onboarding, RequestTemplate, RequestFile, PollQuestion, PollVote, NotificationJob, SystemState
+from stats import collect_headline_stats, collect_employee_stats
+from analytics import analytics_for_range, resolve_period, WATERMARK_KEY as ANALYTICS_WATERMARK_KEY
+from search import search_all
+from pagination import ListSpec, keyset_page, PAGE_SIZE, MAX_PAGE_SIZE
+from employee_index import get_index
+from view_counter import record_view, pending_views
+from page_cache import render_cached, invalidate as invalidate_pages, cache_stats
+from file_storage import file_storage, get_file_info
+import media_worker
+from broadcast_sender import start_delivery, JOB_KIND as TELEGRAM_JOB_KIND
+import http_cache
+from http_cache import conditional, STATIC_MAX_AGE
+from fanout import start_fanout, submit_job, job_progress, job_as_dict, read_counts, visible_to, is_recipient, read_shared_ids, mark_read, AUDIENCE_FIELDS
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 import json
 import logging
+import os
+from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
+# Предел тела запроса проверяется по Content-Length до чтения; большие файлы грузятся частями
+app.config['MAX_CONTENT_LENGTH'] = config.UPLOAD_FORM_MAX_MB * 1024 * 1024
+http_cache.init_app(app)
 
-def auto_update_work_status():
-    """Автоматическое обновление статусов: Пн-Пт 9-18 = активный"""
-    from datetime import datetime
-
-    db_session = get_session()
-    now = datetime.now()
-
-    # Проверяем день недели (0 = Пн, 4 = Пт)
-    is_workday = now.weekday() < 5
-    # Проверяем время (9:00 - 18:00)
-    is_work_hours = 9 <= now.hour < 18
-
-    if is_workday and is_work_hours:
-        # Устанавливаем статус "активный" для пользователей без специального статуса
-        users = db_session.query(User).filter(
-            User.role.in_(['employee', 'manager']),
-            User.work_status.notin_(['vacation', 'sick'])
-        ).all()
-
-        for user in users:
-            user.work_status = 'active'
-
-        db_session.commit()
-
-    db_session.close()
+def get_db():
+    """Сессия БД текущего запроса (закрывается в teardown_appcontext)"""
+    if 'db_session' not in g:
+        g.db_session = get_session()
+    return g.db_session
 
 @app.before_request
-def before_request():
-    """Выполняется перед каждым запросом"""
-    auto_update_work_status()
-
+def bind_connection_owner():
+    """Помечаем соединения эндпоинтом для детектора утечек"""
+    connection_owner.set(request.endpoint)
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    """Гарантированное освобождение соединения после запроса"""
+    db_session = g.pop('db_session', None)
+    try:
+        if db_session is not None:
+            if exception is not None:
+                db_session.rollback()
+            db_session.close()
+    finally:
+        connection_owner.set(None)
 
+# Превью загруженных файлов: {{ media_url(file.file_url, 320) }}
+app.add_template_global(media_worker.media_url, 'media_url')
 
 @app.template_filter('from_json')
 def from_json_filter(value):
@@ -112,12 +126,11 @@ def register():
         last_name = request.form.get('last_name')
         phone = request.form.get('phone')
 
-        db_session = get_session()
+        db_session = get_db()
 
         # Проверяем существование пользователя
         if db_session.query(User).filter_by(email=email).first():
             flash('Пользователь с таким email уже существует', 'error')
-            db_session.close()
             return redirect(url_for('register'))
 
         # Создаем нового пользователя
@@ -138,7 +151,6 @@ def register():
         session['role'] = new_user.role
         session['email'] = new_user.email
 
-        db_session.close()
         flash('Регистрация успешна!', 'success')
         return redirect(url_for('onboarding'))
 
@@ -150,7 +162,7 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
 
-        db_session = get_session()
+        db_session = get_db()
         try:
             user = db_session.query(User).filter_by(email=email).first()
 
@@ -164,18 +176,14 @@ def login():
 
                 # Проверяем, завершен ли онбординг
                 if not user.onboarding_completed and user.role != 'developer':
-                    db_session.close()
                     return redirect(url_for('onboarding'))
 
-                db_session.close()
                 flash('Добро пожаловать!', 'success')
                 return redirect(url_for('dashboard'))
 
             flash('Неверный email или пароль', 'error')
         except Exception as e:
             flash(f'Ошибка при входе: {str(e)}', 'error')
-        finally:
-            db_session.close()
 
     return render_template('login.html')
 
@@ -222,7 +230,7 @@ def manage_roles():
         flash('У вас нет прав для управления ролями', 'error')
         return redirect(url_for('dashboard'))
 
-    db_session = get_session()
+    db_session = get_db()
 
     # Фильтруем пользователей в зависимости от роли текущего пользователя
     if current_role == 'developer':
@@ -237,7 +245,6 @@ def manage_roles():
     else:
         users = []
 
-    db_session.close()
     return render_template('manage_roles.html', users=users, current_role=current_role)
 
 @app.route('/assign-role/<int:user_id>', methods=['POST'])
@@ -282,14 +289,13 @@ def assign_role(user_id):
         flash('У вас нет прав для назначения ролей', 'error')
         return redirect(url_for('manage_roles'))
 
-    db_session = get_session()
+    db_session = get_db()
     user = db_session.query(User).get(user_id)
 
     if user:
         # Проверяем, не пытается ли пользователь изменить роль того, кто выше или равен ему
         if user.role_level >= current_user_level and current_user_role != 'developer':
             flash('Вы не можете изменять роль пользователя вашего уровня или выше', 'error')
-            db_session.close()
             return redirect(url_for('manage_roles'))
 
         user.role = role
@@ -297,7 +303,6 @@ def assign_role(user_id):
         db_session.commit()
         flash(f'Роль пользователя {user.first_name} изменена на {role}', 'success')
 
-    db_session.close()
     return redirect(url_for('manage_roles'))
 
 @app.route('/onboarding')
@@ -306,25 +311,23 @@ def onboarding():
     if is_admin():
         return redirect(url_for('dashboard'))
 
-    db_session = get_session()
+    db_session = get_db()
     user = db_session.query(User).filter_by(id=session.get('user_id')).first()
 
     if user.onboarding_completed:
         return redirect(url_for('dashboard'))
 
     onboarding_tasks = db_session.query(Onboarding).filter_by(user_id=user.id).all()
-    db_session.close()
 
     return render_template('onboarding.html', user=user, tasks=onboarding_tasks)
 
 @app.route('/complete-onboarding', methods=['POST'])
 @require_auth
 def complete_onboarding():
-    db_session = get_session()
+    db_session = get_db()
     user = db_session.query(User).filter_by(id=session.get('user_id')).first()
     user.onboarding_completed = True
     db_session.commit()
-    db_session.close()
 
     flash('Добро пожаловать! Онбординг завершен.', 'success')
     return redirect(url_for('dashboard'))
@@ -332,34 +335,22 @@ def complete_onboarding():
 @app.route('/dashboard')
 @require_auth
 def dashboard():
-    db_session = get_session()
+    db_session = get_db()
 
     from sqlalchemy.orm import joinedload
     
     if is_admin():
-        stats = {
-            'total_users': db_session.query(User).count(),
-            'pending_requests': db_session.query(Request).filter_by(status='pending').count(),
-            'active_vacations': db_session.query(Vacation).filter_by(status='approved').count(),
-            'total_news': db_session.query(News).count(),
-        }
+        stats = collect_headline_stats(db_session).as_dict()
         active_polls = db_session.query(Poll).options(joinedload(Poll.questions)).filter_by(is_active=True).limit(1).first()
         recent_news = db_session.query(News).order_by(News.created_at.desc()).limit(3).all()
     else:
         user_id = session.get('user_id')
-        user = db_session.query(User).filter_by(id=user_id).first()
-        stats = {
-            'my_requests': db_session.query(Request).filter_by(user_id=user_id).count(),
-            'my_vacations': db_session.query(Vacation).filter_by(user_id=user_id).count(),
-            'my_points': user.points if user else 0
-        }
+        stats = collect_employee_stats(db_session, user_id).as_dict()
         active_polls = db_session.query(Poll).options(joinedload(Poll.questions)).filter_by(is_active=True).limit(1).first()
         recent_news = db_session.query(News).order_by(News.created_at.desc()).limit(3).all()
         onboarding_tasks = db_session.query(Onboarding).filter_by(user_id=user_id, status='pending').all()
         stats['onboarding_tasks'] = onboarding_tasks
 
-    db_session.close()
-
     return render_template('dashboard.html', stats=stats, is_admin=is_admin(), 
                          active_poll=active_polls, recent_news=recent_news)
 
@@ -368,7 +359,7 @@ def dashboard():
 def polls():
     from sqlalchemy.orm import joinedload
     
-    db_session = get_session()
+    db_session = get_db()
 
     if is_admin():
         polls_list = db_session.query(Poll).options(joinedload(Poll.questions)).order_by(Poll.created_at.desc()).all()
@@ -377,16 +368,31 @@ def polls():
         polls_list = []
         active_polls = db_session.query(Poll).options(joinedload(Poll.questions)).filter_by(is_active=True).order_by(Poll.created_at.desc()).all()
 
-    # Подсчитываем общее количество ответов для каждого опроса
-    for poll in polls_list + active_polls:
-        if poll.questions:
-            # Берем максимальное количество голосов среди всех вопросов
-            total_responses = max([q.total_votes for q in poll.questions]) if poll.questions else 0
-            poll.total_responses = total_responses
+    # Версия страницы: опросы, их статусы и голоса
+    version = (
+        [(poll.id, poll.is_active, len(poll.questions)) for poll in polls_list + active_polls],
+        db_session.query(func.count(PollVote.id), func.max(PollVote.id)).one()
+    )
+
+    def render():
+        tallies = poll_tallies(db_session, {poll.id for poll in polls_list + active_polls})
+        return render_template('polls.html', polls=polls_list, active_polls=active_polls, tallies=tallies, is_admin=is_admin())
+
+    return conditional(version, render)
 
-    db_session.close()
+def poll_tallies(db_session, poll_ids):
+    """Количество голосов по вариантам: {question_id: {вариант: голосов}}"""
+    tallies = {}
+    if not poll_ids:
+        return tallies
 
-    return render_template('polls.html', polls=polls_list, active_polls=active_polls, is_admin=is_admin())
+    rows = db_session.query(PollVote.question_id, PollVote.option, func.count()).filter(
+        PollVote.poll_id.in_(poll_ids)
+    ).group_by(PollVote.question_id, PollVote.option).all()
+
+    for question_id, option, count in rows:
+        tallies.setdefault(question_id, {})[option] = count
+    return tallies
 
 @app.route('/polls/create', methods=['POST'])
 @require_admin
@@ -396,7 +402,7 @@ def create_poll():
     questions = request.form.getlist('questions[]')
     options_list = request.form.getlist('options[]')
 
-    db_session = get_session()
+    db_session = get_db()
 
     try:
         # Деактивируем все предыдущие опросы
@@ -420,44 +426,35 @@ def create_poll():
                         poll_id=new_poll.id,
                         question=question_text,
                         options=options_text.replace('\r\n', ',').replace('\n', ','),
-                        votes='{}',
                         total_votes=0,
                         order=idx
                     )
                     db_session.add(poll_question)
 
+        # Одно общее уведомление для всех пользователей (см. fanout.py)
+        job_id = start_fanout(
+            'poll',
+            '📊 Новый опрос',
+            f'Добавлен новый опрос: {title}. Пройдите его на главной странице!',
+            source_id=new_poll.id,
+            created_by=session.get('user_id'),
+            db_session=db_session
+        )
         db_session.commit()
+        submit_job(job_id)
         
-        # Отправляем уведомления всем пользователям о новом опросе
-        try:
-            all_users = db_session.query(User).filter_by(is_active=True).all()
-            for user in all_users:
-                notification = Notification(
-                    user_id=user.id,
-                    title='📊 Новый опрос',
-                    message=f'Добавлен новый опрос: {title}. Пройдите его на главной странице!',
-                    is_read=False
-                )
-                db_session.add(notification)
-            db_session.commit()
-            logger.info(f'Отправлено {len(all_users)} уведомлений о новом опросе')
-        except Exception as e:
-            logger.error(f'Ошибка при отправке уведомлений: {e}')
-        
-        flash('Опрос создан и опубликован! Уведомления отправлены всем пользователям.', 'success')
+        flash('Опрос создан и опубликован! Уведомление отправлено всем пользователям.', 'success')
     except Exception as e:
         db_session.rollback()
         logger.error(f'Ошибка при создании опроса: {str(e)}')
         flash(f'Ошибка при создании опроса: {str(e)}', 'error')
-    finally:
-        db_session.close()
 
     return redirect(url_for('polls'))
 
 @app.route('/polls/activate/<int:poll_id>', methods=['POST'])
 @require_admin
 def activate_poll(poll_id):
-    db_session = get_session()
+    db_session = get_db()
 
     # Деактивируем все опросы
     db_session.query(Poll).update({'is_active': False})
@@ -469,13 +466,12 @@ def activate_poll(poll_id):
         db_session.commit()
         flash('Опрос активирован!', 'success')
 
-    db_session.close()
     return redirect(url_for('polls'))
 
 @app.route('/polls/deactivate/<int:poll_id>', methods=['POST'])
 @require_admin
 def deactivate_poll(poll_id):
-    db_session = get_session()
+    db_session = get_db()
 
     poll = db_session.query(Poll).get(poll_id)
     if poll:
@@ -483,41 +479,58 @@ def deactivate_poll(poll_id):
         db_session.commit()
         flash('Опрос деактивирован!', 'success')
 
-    db_session.close()
     return redirect(url_for('polls'))
 
 @app.route('/polls/delete/<int:poll_id>', methods=['POST'])
 @require_admin
 def delete_poll(poll_id):
-    db_session = get_session()
+    db_session = get_db()
 
     poll = db_session.query(Poll).get(poll_id)
     if poll:
+        db_session.query(PollVote).filter_by(poll_id=poll_id).delete(synchronize_session=False)
         db_session.delete(poll)
         db_session.commit()
         flash('Опрос удален!', 'success')
 
-    db_session.close()
     return redirect(url_for('polls'))
 
 @app.route('/poll/vote/<int:poll_id>/<int:question_id>', methods=['POST'])
 @require_auth
 def vote_poll(poll_id, question_id):
-    option = request.form.get('option')
+    option = (request.form.get('option') or '').strip()
+    user_id = session.get('user_id')
 
-    db_session = get_session()
-    question = db_session.query(PollQuestion).get(question_id)
-    poll = db_session.query(Poll).get(poll_id)
+    db_session = get_db()
+    question = db_session.query(PollQuestion).filter_by(id=question_id, poll_id=poll_id).first()
 
-    if question and poll:
-        votes = json.loads(question.votes) if question.votes else {}
-        votes[option] = votes.get(option, 0) + 1
-        question.votes = json.dumps(votes)
-        question.total_votes += 1
-        poll.total_responses += 1
+    if not question or option not in [o.strip() for o in question.options.split(',')]:
+        flash('Неверный вариант ответа', 'error')
+        return redirect(url_for('dashboard'))
+
+    # Первый голос пользователя в опросе считается как новый ответ
+    first_in_poll = not db_session.query(
+        db_session.query(PollVote.id).filter_by(poll_id=poll_id, user_id=user_id).exists()
+    ).scalar()
+
+    try:
+        db_session.add(PollVote(poll_id=poll_id, question_id=question_id, option=option, user_id=user_id))
+        db_session.flush()
+
+        # Счётчики увеличиваются в БД, без чтения-изменения-записи в Python
+        db_session.query(PollQuestion).filter_by(id=question_id).update(
+            {PollQuestion.total_votes: func.coalesce(PollQuestion.total_votes, 0) + 1}, synchronize_session=False
+        )
+        if first_in_poll:
+            db_session.query(Poll).filter_by(id=poll_id).update(
+                {Poll.total_responses: func.coalesce(Poll.total_responses, 0) + 1}, synchronize_session=False
+            )
         db_session.commit()
+    except IntegrityError:
+        db_session.rollback()
+        flash('Вы уже ответили на этот вопрос', 'error')
+        return redirect(url_for('dashboard'))
 
-    db_session.close()
     flash('Спасибо за ваш голос!', 'success')
     return redirect(url_for('dashboard'))
 
@@ -529,9 +542,8 @@ def profile():
         flash('Профиль доступен только для пользователей', 'error')
         return redirect(url_for('dashboard'))
 
-    db_session = get_session()
+    db_session = get_db()
     user = db_session.query(User).filter_by(email=email).first()
-    db_session.close()
 
     return render_template('profile.html', user=user)
 
@@ -542,7 +554,7 @@ def update_profile():
     if not email:
         return jsonify({'success': False}), 401
 
-    db_session = get_session()
+    db_session = get_db()
     user = db_session.query(User).filter_by(email=email).first()
 
     if user:
@@ -553,7 +565,6 @@ def update_profile():
         db_session.commit()
         flash('Профиль обновлен', 'success')
 
-    db_session.close()
     return redirect(url_for('profile'))
 
 @app.route('/user/status/<int:user_id>', methods=['POST'])
@@ -568,7 +579,7 @@ def update_user_status(user_id):
 
     work_status = request.form.get('work_status')
 
-    db_session = get_session()
+    db_session = get_db()
     user = db_session.query(User).get(user_id)
 
     if user:
@@ -576,46 +587,31 @@ def update_user_status(user_id):
         db_session.commit()
         flash(f'Статус пользователя {user.first_name} изменен на: {work_status}', 'success')
 
-    db_session.close()
     return redirect(url_for('profile'))
 
 @app.route('/company')
 @require_auth
 def company():
-    return render_template('company.html', companies=config.COMPANIES)
+    return render_cached('info', 'company.html', lambda: {'companies': config.COMPANIES})
 
 @app.route('/search')
 @require_auth
 def search():
     query = request.args.get('q', '')
-    db_session = get_session()
-
-    # Поиск по новостям, сотрудникам, заявкам
-    news_results = db_session.query(News).filter(
-        News.title.ilike(f'%{query}%')
-    ).limit(5).all()
-
-    employees_results = db_session.query(User).filter(
-        User.first_name.ilike(f'%{query}%') | User.last_name.ilike(f'%{query}%')
-    ).limit(5).all()
+    db_session = get_db()
 
-    requests_results = db_session.query(Request).filter(
-        Request.title.ilike(f'%{query}%')
-    ).limit(5).all()
+    # Полнотекстовый поиск по новостям, базе знаний, сотрудникам; заявки - только для админов
+    results = search_all(db_session, query, include_requests=is_admin())
 
-    results = {
-        'news': news_results,
-        'employees': employees_results,
-        'requests': requests_results
-    }
-
-    db_session.close()
-    return render_template('search.html', query=query, results=results)
+    return render_template('search.html', query=query, results=results, is_admin=is_admin())
 
 @app.route('/knowledge')
 @require_auth
 def knowledge():
-    db_session = get_session()
+    return render_cached('knowledge', 'knowledge.html', knowledge_context)
+
+def knowledge_context():
+    db_session = get_db()
 
     # Загружаем категории с предзагрузкой статей
     from sqlalchemy.orm import joinedload
@@ -643,13 +639,12 @@ def knowledge():
             'created_at': article.created_at.strftime('%d.%m.%Y') if article.created_at else ''
         })
 
-    db_session.close()
-    return render_template('knowledge.html', categories=categories_data, recent_articles=recent_articles_data, is_admin=is_admin())
+    return {'categories': categories_data, 'recent_articles': recent_articles_data, 'is_admin': is_admin()}
 
 @app.route('/knowledge/category/add', methods=['POST'])
 @require_admin
 def add_knowledge_category():
-    db_session = get_session()
+    db_session = get_db()
     category = KnowledgeCategory(
         name=request.form.get('name'),
         description=request.form.get('description'),
@@ -657,14 +652,14 @@ def add_knowledge_category():
     )
     db_session.add(category)
     db_session.commit()
-    db_session.close()
+    invalidate_pages('knowledge')
     flash('Категория создана!', 'success')
     return redirect(url_for('knowledge'))
 
 @app.route('/knowledge/category/delete/<int:category_id>', methods=['POST'])
 @require_admin
 def delete_knowledge_category(category_id):
-    db_session = get_session()
+    db_session = get_db()
     category = db_session.query(KnowledgeCategory).get(category_id)
     if category:
         # Удаляем все статьи категории
@@ -672,14 +667,14 @@ def delete_knowledge_category(category_id):
         # Удаляем категорию
         db_session.delete(category)
         db_session.commit()
+        invalidate_pages('knowledge')
         flash('Категория и все её статьи удалены!', 'success')
-    db_session.close()
     return redirect(url_for('knowledge'))
 
 @app.route('/knowledge/article/add', methods=['POST'])
 @require_admin
 def add_knowledge_article():
-    db_session = get_session()
+    db_session = get_db()
     article = KnowledgeArticle(
         category_id=request.form.get('category_id'),
         title=request.form.get('title'),
@@ -688,89 +683,90 @@ def add_knowledge_article():
     )
     db_session.add(article)
     db_session.commit()
-    db_session.close()
+    invalidate_pages('knowledge')
     flash('Статья создана!', 'success')
     return redirect(url_for('knowledge'))
 
 @app.route('/knowledge/article/edit/<int:article_id>', methods=['POST'])
 @require_admin
 def edit_knowledge_article(article_id):
-    db_session = get_session()
+    db_session = get_db()
     article = db_session.query(KnowledgeArticle).get(article_id)
     if article:
         article.title = request.form.get('title')
         article.content = request.form.get('content')
         article.updated_at = datetime.utcnow()
         db_session.commit()
+        invalidate_pages('knowledge')
         flash('Статья обновлена!', 'success')
-    db_session.close()
     return redirect(url_for('knowledge_article', article_id=article_id))
 
 @app.route('/knowledge/article/delete/<int:article_id>', methods=['POST'])
 @require_admin
 def delete_knowledge_article(article_id):
-    db_session = get_session()
+    db_session = get_db()
     article = db_session.query(KnowledgeArticle).get(article_id)
     category_id = article.category_id if article else None
     if article:
         db_session.delete(article)
         db_session.commit()
+        invalidate_pages('knowledge')
         flash('Статья удалена!', 'success')
-    db_session.close()
     return redirect(url_for('knowledge_category', category_id=category_id) if category_id else url_for('knowledge'))
 
 @app.route('/knowledge/category/<int:category_id>')
 @require_auth
 def knowledge_category(category_id):
-    db_session = get_session()
-    category = db_session.query(KnowledgeCategory).get(category_id)
-    articles = db_session.query(KnowledgeArticle).filter_by(category_id=category_id).all()
-    db_session.close()
-    return render_template('knowledge_category.html', category=category, articles=articles, is_admin=is_admin())
+    def load():
+        db_session = get_db()
+        category = db_session.query(KnowledgeCategory).get(category_id)
+        articles = db_session.query(KnowledgeArticle).filter_by(category_id=category_id).all()
+        return {'category': category, 'articles': articles, 'is_admin': is_admin()}
+
+    return render_cached('knowledge', 'knowledge_category.html', load)
 
 @app.route('/knowledge/article/<int:article_id>')
 @require_auth
 def knowledge_article(article_id):
-    db_session = get_session()
-    article = db_session.query(KnowledgeArticle).get(article_id)
+    def load():
+        db_session = get_db()
+        article = db_session.query(KnowledgeArticle).get(article_id)
 
-    if not article:
-        db_session.close()
-        flash('Статья не найдена', 'error')
-        return redirect(url_for('knowledge'))
+        if not article:
+            flash('Статья не найдена', 'error')
+            return redirect(url_for('knowledge'))
 
-    # Увеличиваем просмотры
-    article.views += 1
-    db_session.commit()
+        # Получаем категорию
+        category = db_session.query(KnowledgeCategory).get(article.category_id)
 
-    # Получаем категорию
-    category = db_session.query(KnowledgeCategory).get(article.category_id)
-
-    # Создаем словарь с данными перед закрытием сессии
-    article_data = {
-        'id': article.id,
-        'title': article.title,
-        'content': article.content,
-        'author': article.author,
-        'views': article.views,
-        'created_at': article.created_at,
-        'updated_at': article.updated_at,
-        'category_id': article.category_id,
-        'category': {
-            'id': category.id,
-            'name': category.name
-        } if category else None
-    }
+        # Создаем словарь с данными перед закрытием сессии
+        article_data = {
+            'id': article.id,
+            'title': article.title,
+            'content': article.content,
+            'author': article.author,
+            'views': (article.views or 0) + pending_views('knowledge_articles', article.id),
+            'created_at': article.created_at,
+            'updated_at': article.updated_at,
+            'category_id': article.category_id,
+            'category': {
+                'id': category.id,
+                'name': category.name
+            } if category else None
+        }
+        return {'article': article_data, 'is_admin': is_admin()}
 
-    db_session.close()
-    return render_template('knowledge_article.html', article=article_data, is_admin=is_admin())
+    page = render_cached('knowledge', 'knowledge_article.html', load)
+    # Просмотр считается и при ответе из кэша или 304; redirect - статьи нет
+    if page.status_code in (200, 304):
+        record_view('knowledge_articles', article_id, session.get('user_id'))
+    return page
 
 @app.route('/gamification')
 @require_auth
 def gamification():
-    db_session = get_session()
+    db_session = get_db()
     users = db_session.query(User).order_by(User.points.desc()).limit(10).all()
-    db_session.close()
     return render_template('gamification.html', users=users)
 
 @app.route('/mascot')
@@ -781,102 +777,268 @@ def mascot():
 @app.route('/status_info')
 @require_auth
 def status_info():
-    return render_template('status_info.html')
+    return render_cached('info', 'status_info.html', dict)
 
 @app.route('/executors')
 @require_admin
 def executors():
-    db_session = get_session()
+    db_session = get_db()
     executors = db_session.query(PurchaseExecutor).all()
-    db_session.close()
     return render_template('executors.html', executors=executors)
 
+# Списки с постраничной выдачей: имя -> модель, ключ сортировки, фильтры
+PAGINATED_LISTS = {
+    'requests': ListSpec(Request, Request.created_at, {'status': Request.status, 'type': Request.request_type, 'user': Request.user_id}),
+    'vacations': ListSpec(Vacation, Vacation.created_at, {'status': Vacation.status, 'user': Vacation.user_id}),
+    'news': ListSpec(News, News.created_at, {'category': News.category}),
+    'activities': ListSpec(Activity, Activity.created_at, {'type': Activity.activity_type, 'user': Activity.user_id}),
+    'notifications': ListSpec(Notification, Notification.created_at, {'user': Notification.user_id, 'audience': Notification.audience}),
+    'reminders': ListSpec(Reminder, Reminder.reminder_date, {'user': Reminder.user_id}),
+    'broadcasts': ListSpec(Broadcast, Broadcast.created_at),
+}
+
+# Списки, где сотрудник видит только свои записи (уведомления - ещё и общие, см. fanout.visible_to)
+OWN_ROWS_LISTS = {'requests', 'vacations'}
+ADMIN_ONLY_LISTS = {'activities', 'reminders', 'broadcasts'}
+LIST_PARTIALS = {'news': 'partials/news_cards.html'}
+
+def list_query(db_session, name):
+    """Базовый запрос списка с учётом прав текущего пользователя"""
+    spec = PAGINATED_LISTS[name]
+    query = db_session.query(spec.model)
+
+    if hasattr(spec.model, 'user') and name != 'notifications':
+        query = query.options(joinedload(spec.model.user))
+
+    if name in OWN_ROWS_LISTS and not is_admin():
+        query = query.filter(spec.model.user_id == session.get('user_id'))
+
+    if name == 'notifications' and not is_admin():
+        user = db_session.query(User).get(session.get('user_id'))
+        query = query.filter(visible_to(user))
+
+    return query
+
+def load_page(db_session, name, args=None):
+    """Страница списка по параметрам запроса (фильтры, cursor, limit)"""
+    args = request.args if args is None else args
+    spec = PAGINATED_LISTS[name]
+    return keyset_page(list_query(db_session, name), spec, args)
+
+@app.route('/api/list/<name>')
+@require_auth
+def list_page(name):
+    """Следующая страница списка для кнопки «Показать ещё»"""
+    if name not in PAGINATED_LISTS:
+        return jsonify({'error': 'Неизвестный список'}), 404
+    if name in ADMIN_ONLY_LISTS and not is_admin():
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    db_session = get_db()
+    try:
+        page = load_page(db_session, name)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    extra = LIST_CONTEXT[name](db_session, page.items) if name in LIST_CONTEXT else {}
+    html = render_template(LIST_PARTIALS.get(name, f'partials/{name}_rows.html'),
+                           items=page.items, is_admin=is_admin(), **extra)
+    return jsonify({'html': html, 'next_cursor': page.next_cursor, 'count': len(page.items)})
+
+def broadcast_jobs(db_session, broadcasts, kind='broadcast'):
+    """Прогресс задач kind для каждой рассылки: {broadcast_id: прогресс}
+
+    kind='broadcast' - уведомления на сайте, TELEGRAM_JOB_KIND - сообщения в Telegram.
+    """
+    ids = [b.id for b in broadcasts]
+    if not ids:
+        return {}
+    jobs = db_session.query(NotificationJob).filter(
+        NotificationJob.kind == kind, NotificationJob.source_id.in_(ids)
+    ).all()
+    reads = read_counts(db_session, [job.notification_id for job in jobs])
+    return {job.source_id: job_as_dict(job, reads.get(job.notification_id, 0)) for job in jobs}
+
+def notifications_context(db_session, items):
+    """Состояние прочтения показанных уведомлений; после показа они отмечаются прочитанными"""
+    user = db_session.query(User).get(session.get('user_id'))
+    read_ids = read_shared_ids(db_session, user.id, items)
+    # Чужие уведомления (админ видит все) не подсвечиваются и не отмечаются
+    unread_ids = {
+        n.id for n in items
+        if is_recipient(user, n) and (n.id not in read_ids if n.audience == 'shared' else not n.is_read)
+    }
+    mark_read(db_session, user, items, read_ids)
+    return {'unread_ids': unread_ids}
+
+# Дополнительный контекст для строк списка (страница и /api/list/<name>)
+LIST_CONTEXT = {
+    'broadcasts': lambda db_session, items: {
+        'jobs': broadcast_jobs(db_session, items),
+        'telegram_jobs': broadcast_jobs(db_session, items, TELEGRAM_JOB_KIND),
+    },
+    'notifications': notifications_context,
+}
+
 @app.route('/broadcast')
 @require_admin
 def broadcast():
-    db_session = get_session()
-    broadcasts = db_session.query(Broadcast).order_by(Broadcast.created_at.desc()).all()
-    db_session.close()
-    return render_template('broadcast.html', broadcasts=broadcasts)
+    db_session = get_db()
+    try:
+        page = load_page(db_session, 'broadcasts')
+    except ValueError as e:
+        flash(f'Неверные параметры фильтра: {e}', 'error')
+        return redirect(url_for('broadcast'))
+    return render_template('broadcast.html', broadcasts=page.items, page=page,
+                           jobs=broadcast_jobs(db_session, page.items),
+                           telegram_jobs=broadcast_jobs(db_session, page.items, TELEGRAM_JOB_KIND),
+                           companies=config.COMPANIES)
+
+@app.route('/broadcast/send', methods=['POST'])
+@require_admin
+def send_broadcast():
+    """Рассылка уведомления всем или выбранной аудитории"""
+    title = request.form.get('title')
+    message = request.form.get('message')
+    audience = {key: request.form.get(key) for key in AUDIENCE_FIELDS if request.form.get(key)}
+
+    db_session = get_db()
+    try:
+        item = Broadcast(title=title, message=message, sent_to=json.dumps(audience or 'all', ensure_ascii=False))
+        db_session.add(item)
+        db_session.flush()
+
+        job_id = start_fanout('broadcast', title, message, source_id=item.id, audience=audience,
+                              created_by=session.get('user_id'), db_session=db_session)
+        if request.form.get('telegram'):
+            # Отправку в Telegram выполнит планировщик (broadcast_sender.py)
+            start_delivery(item.id, title, message, audience=audience,
+                           created_by=session.get('user_id'), db_session=db_session)
+        db_session.commit()
+        submit_job(job_id)
+
+        flash('Рассылка запущена', 'success')
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f'Ошибка при создании рассылки: {e}')
+        flash(f'Ошибка при создании рассылки: {str(e)}', 'error')
+
+    return redirect(url_for('broadcast'))
+
+@app.route('/api/notification-jobs/<int:job_id>')
+@require_admin
+def notification_job_status(job_id):
+    """Прогресс массовой рассылки уведомлений"""
+    progress = job_progress(get_db(), job_id)
+    if progress is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(progress)
 
 @app.route('/notifications')
 @require_auth
 def notifications():
-    db_session = get_session()
+    db_session = get_db()
 
-    if is_admin():
-        # Админы видят все уведомления
-        notifications = db_session.query(Notification).order_by(Notification.created_at.desc()).all()
-    else:
-        # Обычные пользователи видят только свои уведомления
-        user_id = session.get('user_id')
-        notifications = db_session.query(Notification).filter_by(user_id=user_id).order_by(Notification.created_at.desc()).all()
+    # Админы видят все уведомления, остальные - свои и общие для своей аудитории (см. list_query)
+    try:
+        page = load_page(db_session, 'notifications')
+    except ValueError as e:
+        flash(f'Неверные параметры фильтра: {e}', 'error')
+        return redirect(url_for('notifications'))
 
-    db_session.close()
-    return render_template('notifications.html', notifications=notifications, is_admin=is_admin())
+    # Состояние прочтения берётся до отметки, чтобы новые подсветились
+    context = notifications_context(db_session, page.items)
+    return render_template('notifications.html', notifications=page.items, page=page, is_admin=is_admin(), **context)
 
 @app.route('/reminders')
 @require_admin
 def reminders():
-    db_session = get_session()
-    reminders = db_session.query(Reminder).order_by(Reminder.reminder_date.desc()).all()
-    db_session.close()
-    return render_template('reminders.html', reminders=reminders)
+    db_session = get_db()
+    try:
+        page = load_page(db_session, 'reminders')
+    except ValueError as e:
+        flash(f'Неверные параметры фильтра: {e}', 'error')
+        return redirect(url_for('reminders'))
+    return render_template('reminders.html', reminders=page.items, page=page)
 
 @app.route('/activities')
 @require_admin
 def activities():
-    db_session = get_session()
-    activities = db_session.query(Activity).order_by(Activity.created_at.desc()).all()
-    db_session.close()
-    return render_template('activities.html', activities=activities)
+    db_session = get_db()
+    try:
+        page = load_page(db_session, 'activities')
+    except ValueError as e:
+        flash(f'Неверные параметры фильтра: {e}', 'error')
+        return redirect(url_for('activities'))
+    return render_template('activities.html', activities=page.items, page=page)
+
+def employee_page(args):
+    """Страница справочника сотрудников из индекса в памяти: (карточки, всего, смещение следующей)"""
+    offset = max(0, int(args.get('offset') or 0))
+    limit = max(1, min(int(args.get('limit') or PAGE_SIZE), MAX_PAGE_SIZE))
+    cards, total = get_index().listing(
+        query=args.get('q'),
+        company=args.get('company') or None,
+        role=args.get('role') or None,
+        sort=args.get('sort') or 'name',
+        offset=offset,
+        limit=limit
+    )
+    next_offset = offset + len(cards) if offset + len(cards) < total else None
+    return cards, total, next_offset
 
 @app.route('/employees')
 @require_auth
 def employees():
-    db_session = get_session()
-    users = db_session.query(User).all()
-
-    # Конвертируем объекты User в словари для JSON сериализации
-    employees_data = []
-    for user in users:
-        employees_data.append({
-            'id': user.id,
-            'first_name': user.first_name,
-            'last_name': user.last_name or '',
-            'email': user.email,
-            'phone': user.phone or '',
-            'company': user.company or '',
-            'position': user.position or '',
-            'department': user.department or '',
-            'role': user.role,
-            'work_status': user.work_status or 'active',
-            'points': user.points or 0,
-            'level': user.level or 1,
-            'is_active': user.is_active
-        })
+    cards, total, next_offset = employee_page({})
+    return render_template('employees.html', employees=cards, total=total, next_offset=next_offset,
+                           stats=get_index().stats(), is_admin=is_admin())
+
+@app.route('/api/employees')
+@require_auth
+def employees_list():
+    """Страница справочника по фильтрам (q, company, role, sort, offset, limit)"""
+    try:
+        cards, total, next_offset = employee_page(request.args)
+    except ValueError:
+        return jsonify({'error': 'Неверные параметры страницы'}), 400
+
+    html = render_template('partials/employee_cards.html', employees=cards)
+    return jsonify({'html': html, 'items': cards, 'total': total, 'next_offset': next_offset})
 
-    db_session.close()
-    return render_template('employees.html', employees=employees_data, is_admin=is_admin())
+@app.route('/api/employees/suggest')
+@require_auth
+def employees_suggest():
+    """Подсказки сотрудников по началу ФИО, email, должности, отдела или компании"""
+    try:
+        limit = max(1, min(int(request.args.get('limit') or 10), 50))
+    except ValueError:
+        return jsonify({'error': 'Неверный limit'}), 400
+
+    items = get_index().suggest(
+        request.args.get('q', ''),
+        limit=limit,
+        company=request.args.get('company') or None,
+        role=request.args.get('role') or None
+    )
+    return jsonify({'items': items})
 
 @app.route('/employee/delete/<int:user_id>', methods=['POST'])
 @require_admin
 def delete_employee(user_id):
     """Удаление учетной записи сотрудника (кроме разработчика)"""
-    db_session = get_session()
+    db_session = get_db()
 
     try:
         user = db_session.query(User).get(user_id)
 
         if not user:
             flash('Пользователь не найден', 'error')
-            db_session.close()
             return redirect(url_for('employees'))
 
         # Проверяем, что это не разработчик
         if user.role == 'developer':
             flash('Нельзя удалить учетную запись разработчика', 'error')
-            db_session.close()
             return redirect(url_for('employees'))
 
         # Сохраняем имя для сообщения
@@ -890,6 +1052,8 @@ def delete_employee(user_id):
             db_session.query(Notification).filter_by(user_id=user_id).delete(synchronize_session=False)
             db_session.query(Reminder).filter_by(user_id=user_id).delete(synchronize_session=False)
             db_session.query(Onboarding).filter_by(user_id=user_id).delete(synchronize_session=False)
+            # Голоса остаются в итогах опросов, но обезличиваются
+            db_session.query(PollVote).filter_by(user_id=user_id).update({'user_id': None}, synchronize_session=False)
 
             # Удаляем пользователя
             db_session.delete(user)
@@ -903,8 +1067,6 @@ def delete_employee(user_id):
     except Exception as e:
         db_session.rollback()
         flash(f'Ошибка при удалении сотрудника: {str(e)}', 'error')
-    finally:
-        db_session.close()
 
     return redirect(url_for('employees'))
 
@@ -915,7 +1077,7 @@ def my_status():
         flash('Эта страница доступна только для пользователей', 'error')
         return redirect(url_for('dashboard'))
 
-    db_session = get_session()
+    db_session = get_db()
     user_id = session.get('user_id')
     user = db_session.query(User).filter_by(id=user_id).first()
 
@@ -923,8 +1085,6 @@ def my_status():
     my_requests = db_session.query(Request).filter_by(user_id=user_id).order_by(Request.created_at.desc()).all()
     my_activities = db_session.query(Activity).filter_by(user_id=user_id).order_by(Activity.created_at.desc()).limit(10).all()
 
-    db_session.close()
-
     return render_template('my_status.html', 
                          user=user,
                          vacations=my_vacations,
@@ -934,28 +1094,39 @@ def my_status():
 @app.route('/news')
 @require_auth
 def news():
-    db_session = get_session()
-    news_list = db_session.query(News).order_by(News.created_at.desc()).all()
-    db_session.close()
-
-    return render_template('news.html', news=news_list, is_admin=is_admin())
+    def load():
+        db_session = get_db()
+        try:
+            page = load_page(db_session, 'news')
+        except ValueError as e:
+            flash(f'Неверные параметры фильтра: {e}', 'error')
+            return redirect(url_for('news'))
+
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        total, today_count, views = db_session.query(
+            func.count(News.id),
+            func.count(News.id).filter(News.created_at >= today),
+            func.coalesce(func.sum(News.views), 0)
+        ).one()
+        news_stats = {'total': total, 'today': today_count, 'views': views}
+        return {'news': page.items, 'page': page, 'news_stats': news_stats, 'is_admin': is_admin()}
+
+    return render_cached('news', 'news.html', load)
 
 @app.route('/news/view/<int:id>')
 @require_auth
 def view_news(id):
-    db_session = get_session()
+    db_session = get_db()
     news_item = db_session.query(News).get(id)
     if news_item:
-        news_item.views += 1
-        db_session.commit()
-    db_session.close()
+        record_view('news', news_item.id, session.get('user_id'))
 
     return render_template('news_detail.html', news=news_item, is_admin=is_admin())
 
 @app.route('/news/add', methods=['POST'])
 @require_admin
 def add_news():
-    db_session = get_session()
+    db_session = get_db()
     news_item = News(
         title=request.form.get('title'),
         content=request.form.get('content'),
@@ -965,7 +1136,7 @@ def add_news():
     )
     db_session.add(news_item)
     db_session.commit()
-    db_session.close()
+    invalidate_pages('news')
 
     flash('Новость добавлена', 'success')
     return redirect(url_for('news'))
@@ -973,17 +1144,16 @@ def add_news():
 @app.route('/requests')
 @require_auth
 def requests_page():
-    db_session = get_session()
-
-    if is_admin():
-        reqs = db_session.query(Request).order_by(Request.created_at.desc()).all()
-    else:
-        user_id = session.get('user_id')
-        reqs = db_session.query(Request).filter_by(user_id=user_id).order_by(Request.created_at.desc()).all()
+    db_session = get_db()
 
-    db_session.close()
+    # Админы видят все заявки, сотрудники - только свои (см. list_query)
+    try:
+        page = load_page(db_session, 'requests')
+    except ValueError as e:
+        flash(f'Неверные параметры фильтра: {e}', 'error')
+        return redirect(url_for('requests_page'))
 
-    return render_template('requests.html', requests=reqs, is_admin=is_admin())
+    return render_template('requests.html', requests=page.items, page=page, is_admin=is_admin())
 
 @app.route('/requests/add', methods=['POST'])
 @require_auth
@@ -992,7 +1162,7 @@ def add_request():
         flash('Админ не может создавать заявки', 'error')
         return redirect(url_for('requests_page'))
 
-    db_session = get_session()
+    db_session = get_db()
     req = Request(
         user_id=session.get('user_id'),
         request_type=request.form.get('request_type'),
@@ -1001,7 +1171,6 @@ def add_request():
     )
     db_session.add(req)
     db_session.commit()
-    db_session.close()
 
     flash('Заявка создана', 'success')
     return redirect(url_for('requests_page'))
@@ -1009,102 +1178,52 @@ def add_request():
 @app.route('/vacations')
 @require_auth
 def vacations():
-    db_session = get_session()
+    db_session = get_db()
 
-    if is_admin():
-        vacs = db_session.query(Vacation).order_by(Vacation.created_at.desc()).all()
-    else:
-        user_id = session.get('user_id')
-        vacs = db_session.query(Vacation).filter_by(user_id=user_id).order_by(Vacation.created_at.desc()).all()
-
-    db_session.close()
+    try:
+        page = load_page(db_session, 'vacations')
+    except ValueError as e:
+        flash(f'Неверные параметры фильтра: {e}', 'error')
+        return redirect(url_for('vacations'))
 
-    return render_template('vacations.html', vacations=vacs, is_admin=is_admin())
+    return render_template('vacations.html', vacations=page.items, page=page, is_admin=is_admin())
 
 @app.route('/hr-analytics')
 @require_admin
 def hr_analytics():
-    db_session = get_session()
+    db_session = get_db()
 
-    from database import Candidate, EmployeeMetrics
-    from datetime import datetime, timedelta
+    # Основные метрики одним запросом
+    stats = collect_headline_stats(db_session).as_dict()
 
-    # Основные метрики
-    total_users = db_session.query(User).count()
-    total_requests = db_session.query(Request).count()
-    approved_requests = db_session.query(Request).filter_by(status='approved').count()
-    pending_requests = db_session.query(Request).filter_by(status='pending').count()
-    active_vacations = db_session.query(Vacation).filter_by(status='approved').count()
-
-    # Статистика опросов
-    total_polls = db_session.query(Poll).count()
-    active_polls = db_session.query(Poll).filter_by(is_active=True).count()
-
-    # Подсчет общего количества ответов на опросы
-    polls_responses = db_session.query(Poll.total_responses).all()
-    total_poll_responses = sum([p[0] or 0 for p in polls_responses])
-
-    # Подсчет посетителей сегодня
-    today = datetime.now().date()
-    visitors_today = db_session.query(User).filter(
-        User.created_at >= today
-    ).count()
-
-    # Общее количество просмотров
-    total_visits = db_session.query(Activity).filter(
-        Activity.created_at >= today
-    ).count()
-
-    # Зарегистрировано сегодня
-    registered_today = db_session.query(User).filter(
-        User.created_at >= today
-    ).count()
-
-    # Процент одобрения заявок
-    approval_rate = round((approved_requests / total_requests * 100) if total_requests > 0 else 0, 1)
-
-    # Общее количество дней отпуска
-    vacation_days = db_session.query(Vacation.days_count).all()
-    vacation_days_total = sum([v[0] or 0 for v in vacation_days])
-
-    stats = {
-        'total_users': total_users,
-        'registered_today': registered_today,
-        'total_requests': total_requests,
-        'pending_requests': pending_requests,
-        'approved_requests': approved_requests,
-        'approval_rate': approval_rate,
-        'active_vacations': active_vacations,
-        'vacation_days_total': vacation_days_total,
-        'visitors_today': visitors_today,
-        'total_visits_today': total_visits,
-        'total_polls': total_polls,
-        'active_polls_count': active_polls,
-        'total_poll_responses': total_poll_responses
-    }
+    # Графики строятся из дневных агрегатов: меняются вместе с отметкой пересчёта
+    first_day, last_day = resolve_period('week')
+    rollup = db_session.query(SystemState.value).filter_by(key=ANALYTICS_WATERMARK_KEY).scalar()
+    return conditional((stats, first_day, rollup), lambda: render_hr_analytics(db_session, stats, first_day, last_day))
 
-    # Данные для графиков (заглушки, можно улучшить)
-    requests_chart_labels = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-    requests_chart_total = [12, 19, 15, 20, 18, 10, 8]
-    requests_chart_approved = [10, 15, 12, 16, 14, 8, 6]
-    requests_chart_rejected = [2, 4, 3, 4, 4, 2, 2]
+def render_hr_analytics(db_session, stats, first_day, last_day):
+    analytics = analytics_for_range(db_session, first_day, last_day)
+    charts = analytics['charts']
 
-    vacations_chart_labels = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн']
-    vacations_chart_data = [120, 150, 180, 140, 200, 160]
+    requests_chart_labels = charts['requests']['labels']
+    requests_chart_total = charts['requests']['total']
+    requests_chart_approved = charts['requests']['approved']
+    requests_chart_rejected = charts['requests']['rejected']
 
-    request_types_labels = ['Отпуск', 'Больничный', 'Удаленка', 'Справка', 'Другое']
-    request_types_data = [45, 20, 15, 12, 8]
+    vacations_chart_labels = charts['vacations']['labels']
+    vacations_chart_data = charts['vacations']['data']
 
-    departments_labels = ['IT', 'HR', 'Продажи', 'Маркетинг', 'Финансы']
-    departments_data = [35, 25, 30, 20, 15]
+    request_types_labels = charts['types']['labels']
+    request_types_data = charts['types']['data']
 
-    activity_labels = ['1', '5', '10', '15', '20', '25', '30']
-    activity_data = [45, 52, 48, 55, 60, 58, 62]
+    departments_labels = charts['departments']['labels']
+    departments_data = charts['departments']['data']
 
-    requests_stats = []
-    employee_stats = []
+    activity_labels = charts['activity']['labels']
+    activity_data = charts['activity']['data']
 
-    db_session.close()
+    requests_stats = analytics['tables']['requests']
+    employee_stats = []
 
     return render_template('hr_analytics.html', 
                          stats=stats,
@@ -1123,6 +1242,21 @@ def hr_analytics():
                          requests_stats=requests_stats,
                          employee_stats=employee_stats)
 
+@app.route('/api/analytics/data')
+@require_admin
+def analytics_data():
+    """Данные HR-аналитики за период (period=week|month|quarter|year или date_from/date_to)"""
+    try:
+        first_day, last_day = resolve_period(
+            request.args.get('period'),
+            request.args.get('date_from'),
+            request.args.get('date_to')
+        )
+    except ValueError:
+        return jsonify({'error': 'Неверный формат даты, ожидается YYYY-MM-DD'}), 400
+
+    return jsonify(analytics_for_range(get_db(), first_day, last_day))
+
 @app.route('/lms')
 @require_auth
 def lms():
@@ -1132,7 +1266,7 @@ def lms():
 @app.route('/requests-catalog')
 @require_auth
 def requests_catalog():
-    db_session = get_session()
+    db_session = get_db()
 
     user_id = session.get('user_id')
     user = db_session.query(User).filter_by(id=user_id).first()
@@ -1159,16 +1293,25 @@ def requests_catalog():
             files_by_template[template_key] = []
         files_by_template[template_key].append(file)
 
-    db_session.close()
+    # У шаблонов нет updated_at: версия - показываемые поля
+    version = (
+        [(t.id, t.title, t.description, t.company, t.icon, t.color) for t in templates],
+        [(f.id, f.template_id, f.filename, f.file_url, f.file_type,
+          media_worker.media_url(f.file_url, 160, fallback=False)) for f in all_files],
+        [(r.id, r.status, r.updated_at) for r in my_requests],
+        total_requests,
+        user_company
+    )
 
-    return render_template('requests_catalog.html',
+    return conditional(version, lambda: render_template('requests_catalog.html',
                          templates=templates,
                          files_by_template=files_by_template,
                          my_requests=my_requests,
                          total_requests=total_requests,
                          companies=config.COMPANIES,
                          user_company=user_company,
-                         is_admin=is_admin()) 
+                         upload_form_max=config.UPLOAD_FORM_MAX_MB * 1024 * 1024,
+                         is_admin=is_admin()))
 
 
 @app.route('/template/add', methods=['POST'])
@@ -1181,7 +1324,7 @@ def add_template():
         flash('У вас нет прав для добавления шаблонов', 'error')
         return redirect(url_for('requests_catalog'))
 
-    db_session = get_session()
+    db_session = get_db()
     user_id = session.get('user_id')
     user = db_session.query(User).filter_by(id=user_id).first()
 
@@ -1194,7 +1337,6 @@ def add_template():
     # Модератор может добавлять только для своей компании
     if current_role == 'moderator' and company != user.company:
         flash('Вы можете добавлять шаблоны только для своей компании', 'error')
-        db_session.close()
         return redirect(url_for('requests_catalog'))
 
     template = RequestTemplate(
@@ -1207,7 +1349,6 @@ def add_template():
     )
     db_session.add(template)
     db_session.commit()
-    db_session.close()
 
     flash('Шаблон успешно добавлен!', 'success')
     return redirect(url_for('requests_catalog'))
@@ -1222,7 +1363,7 @@ def edit_template(template_id):
         flash('У вас нет прав для редактирования шаблонов', 'error')
         return redirect(url_for('requests_catalog'))
 
-    db_session = get_session()
+    db_session = get_db()
     template = db_session.query(RequestTemplate).get(template_id)
 
     if template:
@@ -1231,7 +1372,6 @@ def edit_template(template_id):
             user = db_session.query(User).filter_by(id=session.get('user_id')).first()
             if template.company != user.company:
                 flash('Вы можете редактировать только шаблоны своей компании', 'error')
-                db_session.close()
                 return redirect(url_for('requests_catalog'))
 
         template.title = request.form.get('title')
@@ -1243,7 +1383,6 @@ def edit_template(template_id):
         db_session.commit()
         flash('Шаблон обновлен!', 'success')
 
-    db_session.close()
     return redirect(url_for('requests_catalog'))
 
 @app.route('/template/delete/<int:template_id>', methods=['POST'])
@@ -1256,7 +1395,7 @@ def delete_template(template_id):
         flash('У вас нет прав для удаления шаблонов', 'error')
         return redirect(url_for('requests_catalog'))
 
-    db_session = get_session()
+    db_session = get_db()
     template = db_session.query(RequestTemplate).get(template_id)
 
     if template:
@@ -1265,19 +1404,18 @@ def delete_template(template_id):
             user = db_session.query(User).filter_by(id=session.get('user_id')).first()
             if template.company != user.company:
                 flash('Вы можете удалять только шаблоны своей компании', 'error')
-                db_session.close()
                 return redirect(url_for('requests_catalog'))
 
         # Удаляем связанные файлы
         files = db_session.query(RequestFile).filter_by(template_id=template_id).all()
         for file in files:
+            file_storage.release_blob(db_session, file.content_hash)
             db_session.delete(file)
 
         db_session.delete(template)
         db_session.commit()
         flash('Шаблон удален!', 'success')
 
-    db_session.close()
     return redirect(url_for('requests_catalog'))
 
 @app.route('/file/add', methods=['POST'])
@@ -1290,7 +1428,7 @@ def add_file_link():
         flash('У вас нет прав для добавления файлов', 'error')
         return redirect(url_for('requests_catalog'))
 
-    db_session = get_session()
+    db_session = get_db()
     try:
         template_id = request.form.get('template_id')
         file_name = request.form.get('file_name')
@@ -1328,11 +1466,119 @@ def add_file_link():
         db_session.rollback()
         logger.error(f'Ошибка при добавлении файла: {str(e)}')
         flash(f'Ошибка при добавлении файла: {str(e)}', 'error')
-    finally:
-        db_session.close()
 
     return redirect(url_for('requests_catalog'))
 
+@app.route('/file/upload', methods=['POST'])
+@require_auth
+def upload_file():
+    """Загрузка файла к шаблону: из формы или завершённой загрузки частями (upload_id)"""
+    current_role = session.get('role')
+
+    if current_role not in ['developer', 'admin', 'moderator']:
+        flash('У вас нет прав для добавления файлов', 'error')
+        return redirect(url_for('requests_catalog'))
+
+    db_session = get_db()
+    template_id = request.form.get('template_id')
+    company = request.form.get('company')
+
+    user = db_session.query(User).filter_by(id=session.get('user_id')).first()
+    if current_role == 'moderator' and company != user.company:
+        flash('Вы можете добавлять файлы только для своей компании', 'error')
+        return redirect(url_for('requests_catalog'))
+
+    upload_id = request.form.get('upload_id')
+    if upload_id:
+        stored, error = file_storage.finish_upload(upload_id, owner=session.get('user_id'))
+    else:
+        file = request.files.get('file')
+        category = get_file_info(file.filename)['type'] if file else 'documents'
+        stored, error = file_storage.save_file(file, category)
+    if error:
+        flash(error, 'error')
+        return redirect(url_for('requests_catalog'))
+
+    try:
+        request_file = RequestFile(
+            template_id=int(template_id) if template_id else None,
+            filename=request.form.get('file_name') or stored['original_name'],
+            original_name=stored['original_name'],
+            file_path=stored['file_path'],
+            file_url=stored['file_url'],
+            file_type=stored['file_info']['extension'],
+            company=company,
+            content_hash=stored['content_hash'],
+            uploaded_by=session.get('user_id')
+        )
+        db_session.add(request_file)
+        file_storage.acquire_blob(db_session, stored)
+        db_session.commit()
+        file_storage.commit_blob(stored)
+        media_worker.submit(stored['content_hash'], stored['file_info']['extension'])
+        flash('Файл успешно загружен!', 'success')
+    except Exception as e:
+        db_session.rollback()
+        file_storage.discard(stored)
+        logger.error(f'Ошибка при загрузке файла: {str(e)}')
+        flash(f'Ошибка при загрузке файла: {str(e)}', 'error')
+
+    return redirect(url_for('requests_catalog'))
+
+def upload_as_dict(state):
+    """Состояние загрузки частями для API"""
+    return {
+        'upload_id': state['upload_id'],
+        'offset': state['offset'],
+        'size': state['size'],
+        'complete': bool(state.get('result')),
+        'hashing': bool(state.get('hashing')),
+        'chunk_size': config.UPLOAD_CHUNK_MB * 1024 * 1024,
+    }
+
+@app.route('/api/uploads', methods=['POST'])
+@require_auth
+def start_upload():
+    """Начать загрузку частями: {filename, size} -> {upload_id, offset, chunk_size}"""
+    if session.get('role') not in ['developer', 'admin', 'moderator']:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Неверный размер файла'}), 400
+
+    state, error = file_storage.start_upload(data.get('filename') or '', size, owner=session.get('user_id'))
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(upload_as_dict(state)), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PUT'])
+@require_auth
+def upload_chunk(upload_id):
+    """GET - сколько байт принято (для продолжения), PUT - часть файла с позиции ?offset="""
+    owner = session.get('user_id')
+    if request.method == 'GET':
+        state = file_storage.upload_status(upload_id, owner)
+        if state is None:
+            return jsonify({'error': 'Загрузка не найдена'}), 404
+        return jsonify(upload_as_dict(state))
+
+    if request.content_length is None:
+        return jsonify({'error': 'Нужен заголовок Content-Length'}), 411
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Не указан offset'}), 400
+
+    # Тело читается из потока запроса кусками, без разбора формы
+    state, error = file_storage.append_chunk(upload_id, offset, request.stream, owner)
+    if state is None:
+        return jsonify({'error': error}), 404
+    if error:
+        return jsonify(dict(upload_as_dict(state), error=error)), 409
+    return jsonify(upload_as_dict(state))
+
 @app.route('/file/delete/<int:file_id>', methods=['POST'])
 @require_auth
 def delete_file(file_id):
@@ -1343,7 +1589,7 @@ def delete_file(file_id):
         flash('У вас нет прав для удаления файлов', 'error')
         return redirect(url_for('requests_catalog'))
 
-    db_session = get_session()
+    db_session = get_db()
     file = db_session.query(RequestFile).get(file_id)
 
     if file:
@@ -1352,37 +1598,110 @@ def delete_file(file_id):
             user = db_session.query(User).filter_by(id=session.get('user_id')).first()
             if file.company != user.company:
                 flash('Вы можете удалять только файлы своей компании', 'error')
-                db_session.close()
                 return redirect(url_for('requests_catalog'))
 
+        # Загруженный файл удалит сборщик мусора, когда на него не останется ссылок
+        file_storage.release_blob(db_session, file.content_hash)
         db_session.delete(file)
         db_session.commit()
         flash('Файл удален!', 'success')
 
-    db_session.close()
     return redirect(url_for('requests_catalog'))
 
 @app.route('/file/open/<int:file_id>')
 @require_auth
 def open_file(file_id):
     """Открыть файл по ссылке"""
-    db_session = get_session()
+    db_session = get_db()
     file = db_session.query(RequestFile).get(file_id)
 
     if not file:
         flash('Файл не найден', 'error')
-        db_session.close()
         return redirect(url_for('requests_catalog'))
 
     # Проверяем доступ к файлу (только для своей компании)
     user = db_session.query(User).filter_by(id=session.get('user_id')).first()
     if not is_admin() and file.company != user.company:
         flash('У вас нет доступа к этому файлу', 'error')
-        db_session.close()
         return redirect(url_for('requests_catalog'))
 
-    db_session.close()
     return redirect(file.file_url)
 
+def send_upload(path, filename, etag, download_name=None):
+    """Ответ с файлом хранилища без чтения его в память
+
+    С UPLOADS_ACCEL_PREFIX файл отдаёт Nginx (X-Accel-Redirect), иначе
+    send_file: Range и If-None-Match обрабатывает Werkzeug, тело передаётся
+    через wsgi.file_wrapper (sendfile в gunicorn).
+    """
+    mimetype = get_file_info(filename)['mimetype']
+    if config.UPLOADS_ACCEL_PREFIX:
+        if etag and request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(mimetype=mimetype)
+            relative = os.path.relpath(path, file_storage.storage_path).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = config.UPLOADS_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative)
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag or True)
+        # Werkzeug объявляет поддержку Range только в ответе на Range-запрос; плееру она нужна сразу
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+
+    if etag:
+        # Адрес содержит хэш: содержимое по нему не меняется
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'private, max-age={STATIC_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    if download_name:
+        response.headers['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(download_name)}"
+    # Загруженные svg и html не должны выполняться как страница сайта
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; img-src 'self'; media-src 'self'; style-src 'unsafe-inline'; sandbox"
+    return response
+
+@app.route('/uploads/<file_type>/<filename>')
+@require_auth
+def uploaded_file(file_type, filename):
+    """Загруженный файл; доступ, как в open_file, только для своей компании"""
+    resolved = file_storage.resolve(file_type, filename)
+    if resolved is None:
+        abort(404)
+    path, content_hash = resolved
+
+    db_session = get_db()
+    query = db_session.query(RequestFile.company, RequestFile.original_name)
+    if content_hash:
+        files = query.filter(RequestFile.content_hash == content_hash).all()
+    else:
+        files = query.filter(RequestFile.file_url == f"/uploads/{file_type}/{filename}").all()
+    if not files:
+        abort(404)
+
+    if not is_admin():
+        user = db_session.query(User).filter_by(id=session.get('user_id')).first()
+        files = [f for f in files if user and f.company == user.company]
+        if not files:
+            abort(403)
+
+    if content_hash and path != file_storage.blob_path(content_hash):
+        # Превью: своё содержимое и ETag, имя оригинала не подходит
+        return send_upload(path, filename, os.path.basename(path))
+    return send_upload(path, filename, content_hash, files[0].original_name)
+
+@app.route('/api/db/pool-stats')
+@require_developer
+def db_pool_stats():
+    """Счётчики пула соединений с БД"""
+    return jsonify(get_pool_stats())
+
+@app.route('/api/cache/stats')
+@require_developer
+def page_cache_stats():
+    """Попадания, промахи и размер кэша страниц процесса"""
+    return jsonify(cache_stats())
+
 def run_app():
-    app.run(host='0.0.0.0', port=5055, debug=False)
\ No newline at end of file
+    """Запуск через production-сервер (см. main.start_web_app)"""
+    from main import start_web_app
+    start_web_app()
\ No newline at end of file
@@ -1,21 +1,240 @@
 import logging
 import asyncio
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+import functools
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatMember
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ChatMemberHandler, ContextTypes, MessageHandler, filters
 from telegram.error import TelegramError
 import config
-from database import get_session, User
+from database import get_session, User, SystemState
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def check_group_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+# Запросы к БД синхронные: выполняются в ограниченном пуле потоков,
+# чтобы не блокировать цикл событий бота при параллельной обработке обновлений
+_db_executor = ThreadPoolExecutor(max_workers=config.BOT_DB_WORKERS, thread_name_prefix='bot-db')
+
+async def run_db(func, *args, **kwargs):
+    """Выполнить синхронную функцию работы с БД в пуле потоков"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+def ensure_user(telegram_id, username, first_name, last_name):
+    """Создать пользователя при первом /start"""
+    session = get_session()
+    try:
+        if session.query(User.id).filter_by(telegram_id=telegram_id).first():
+            return
+        session.add(User(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name
+        ))
+        session.commit()
+    except IntegrityError:
+        # Параллельный /start того же пользователя уже создал запись
+        session.rollback()
+    finally:
+        session.close()
+
+def load_personal_data(telegram_id):
+    """Данные профиля для ответа в чат (None, если пользователя нет)"""
+    session = get_session()
+    try:
+        db_user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        if not db_user:
+            return None
+        return {
+            'first_name': db_user.first_name,
+            'last_name': db_user.last_name,
+            'username': db_user.username,
+            'company': db_user.company,
+            'position': db_user.position,
+            'points': db_user.points,
+        }
+    finally:
+        session.close()
+
+# Изменения членства, полученные любым процессом бота (chat_member приходит только в один)
+MEMBERSHIP_KEY_PREFIX = 'membership:'
+# Запас на расхождение часов процессов: недавние изменения применяются повторно, это безопасно
+MEMBERSHIP_CLOCK_SKEW = timedelta(seconds=60)
+
+def publish_membership(user_id, is_member):
+    """Записать изменение членства для остальных процессов бота; возвращает время записи"""
+    session = get_session()
     try:
-        member = await context.bot.get_chat_member(chat_id=config.GROUP_ID, user_id=user_id)
-        return member.status in ['member', 'administrator', 'creator']
-    except TelegramError as e:
-        logger.error(f"Error checking group membership: {e}")
-        return False
+        key = f"{MEMBERSHIP_KEY_PREFIX}{user_id}"
+        value = 'member' if is_member else 'left'
+        updated_at = datetime.utcnow()
+        state = session.query(SystemState).get(key)
+        if state is None:
+            session.add(SystemState(key=key, value=value, updated_at=updated_at))
+        else:
+            state.value = value
+            state.updated_at = updated_at
+        session.commit()
+        return updated_at
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error publishing membership change: {e}")
+    finally:
+        session.close()
+
+def load_membership_changes(since):
+    """Изменения членства с момента since: [(user_id, член группы, время)]"""
+    session = get_session()
+    try:
+        rows = session.query(SystemState.key, SystemState.value, SystemState.updated_at).filter(
+            SystemState.key.like(f"{MEMBERSHIP_KEY_PREFIX}%"), SystemState.updated_at >= since - MEMBERSHIP_CLOCK_SKEW
+        ).all()
+        return [(int(key[len(MEMBERSHIP_KEY_PREFIX):]), value == 'member', updated_at) for key, value, updated_at in rows]
+    finally:
+        session.close()
+
+# Типы обновлений, которые обрабатывает бот; остальные Telegram не присылает
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.CHAT_MEMBER]
+
+MEMBER_STATUSES = {ChatMember.MEMBER, ChatMember.ADMINISTRATOR, ChatMember.OWNER}
+
+class MembershipCache:
+    """Членство в группе с TTL: положительные и отрицательные ответы кэшируются раздельно
+
+    Событие chat_member получает только один процесс бота (webhook за
+    балансировщиком), поэтому изменения публикуются в system_state, и каждый
+    процесс не реже раза в sync_interval применяет чужие изменения к своему кэшу.
+    Исключённый из группы теряет доступ во всех процессах за sync_interval, а не за TTL.
+    """
+
+    def __init__(self, ttl, negative_ttl, sync_interval):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.sync_interval = sync_interval
+        self._entries = {}   # user_id -> (член группы, срок годности)
+        self._inflight = {}  # user_id -> запрос к API, который уже выполняется
+        self._synced_at = 0.0
+        self._changes_since = datetime.utcnow() - timedelta(seconds=ttl)
+        self._applied = {}   # user_id -> updated_at уже применённой записи system_state
+        self._sync_task = None
+        self.hits = self.misses = self.api_calls = self.updates = self.remote_updates = 0
+
+    async def sync(self):
+        """Применить изменения членства из других процессов (не чаще sync_interval)"""
+        if time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        if self._sync_task is None:
+            self._sync_task = asyncio.ensure_future(self._load_changes())
+            self._sync_task.add_done_callback(lambda _: setattr(self, '_sync_task', None))
+        await self._sync_task
+
+    async def _load_changes(self):
+        try:
+            changes = await run_db(load_membership_changes, self._changes_since)
+        except Exception as e:
+            # Без синхронизации остаётся TTL; повторим при следующей проверке
+            logger.error(f"Error loading membership changes: {e}")
+            return
+        self._synced_at = time.monotonic()
+        for user_id, is_member, updated_at in changes:
+            # Окно MEMBERSHIP_CLOCK_SKEW возвращает одну запись несколько синхронизаций подряд
+            applied = self._applied.get(user_id)
+            if applied is not None and updated_at <= applied:
+                continue
+            self._applied[user_id] = updated_at
+            self.set(user_id, is_member)
+            self._changes_since = max(self._changes_since, updated_at)
+            self.remote_updates += 1
+
+        # Записи старше окна из БД больше не придут
+        horizon = self._changes_since - MEMBERSHIP_CLOCK_SKEW
+        self._applied = {user_id: updated_at for user_id, updated_at in self._applied.items() if updated_at >= horizon}
+
+    def mark_published(self, user_id, updated_at):
+        """Своё изменение, записанное в system_state, не считается чужим при синхронизации"""
+        if updated_at is not None:
+            self._applied[user_id] = max(updated_at, self._applied.get(user_id, updated_at))
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, user_id, is_member):
+        ttl = self.ttl if is_member else self.negative_ttl
+        self._entries[user_id] = (is_member, time.monotonic() + ttl)
+
+    async def is_member(self, bot, user_id):
+        await self.sync()
+        cached = self.get(user_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        # Повторные /start одного пользователя ждут один и тот же запрос
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(bot, user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await task
+
+    async def _fetch(self, bot, user_id):
+        self.api_calls += 1
+        try:
+            member = await bot.get_chat_member(chat_id=config.GROUP_ID, user_id=user_id)
+        except TelegramError as e:
+            # Ошибку API не кэшируем: следующий /start проверит снова
+            logger.error(f"Error checking group membership: {e}")
+            return False
+        is_member = member.status in MEMBER_STATUSES
+        self.set(user_id, is_member)
+        return is_member
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        now = time.monotonic()
+        return {
+            'entries': sum(1 for _, expires in self._entries.values() if expires > now),
+            'hits': self.hits,
+            'misses': self.misses,
+            'api_calls': self.api_calls,
+            'updates': self.updates,
+            'remote_updates': self.remote_updates,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+membership_cache = MembershipCache(config.MEMBERSHIP_CACHE_TTL_SECONDS, config.MEMBERSHIP_NEGATIVE_TTL_SECONDS,
+                                   config.MEMBERSHIP_SYNC_SECONDS)
+
+async def check_group_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    return await membership_cache.is_member(context.bot, user_id)
+
+async def track_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обновление кэша по событиям chat_member группы (бот должен быть администратором)"""
+    change = update.chat_member
+    if change.chat.id != config.GROUP_ID:
+        return
+    membership_cache.updates += 1
+    user_id = change.new_chat_member.user.id
+    is_member = change.new_chat_member.status in MEMBER_STATUSES
+    membership_cache.set(user_id, is_member)
+    membership_cache.mark_published(user_id, await run_db(publish_membership, user_id, is_member))
+
+async def membership_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/membership_stats - статистика кэша для администратора"""
+    if str(update.effective_user.id) != config.HOST_ADMIN_TELEGRAM_ID:
+        return
+    stats = membership_cache.stats()
+    await update.message.reply_text(
+        "📈 Кэш проверки членства в группе:\n\n" + "\n".join(f"{key}: {value}" for key, value in stats.items())
+    )
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -34,21 +253,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error in start command: {e}")
         # Продолжаем работу даже если проверка группы не удалась
     
-    
-    session = get_session()
-    db_user = session.query(User).filter_by(telegram_id=str(user.id)).first()
-    
-    if not db_user:
-        db_user = User(
-            telegram_id=str(user.id),
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name
-        )
-        session.add(db_user)
-        session.commit()
-    
-    session.close()
+    await run_db(ensure_user, str(user.id), user.username, user.first_name, user.last_name)
     
     keyboard = [
         [InlineKeyboardButton("👥 О компании", callback_data='about_company'),
@@ -88,17 +293,18 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     
     elif data == 'personal_data':
-        session = get_session()
-        db_user = session.query(User).filter_by(telegram_id=str(user.id)).first()
-        session.close()
+        db_user = await run_db(load_personal_data, str(user.id))
+        if not db_user:
+            await query.message.reply_text("Профиль не найден. Отправьте /start")
+            return
         
         await query.message.reply_text(
             f"👤 Ваши данные:\n\n"
-            f"Имя: {db_user.first_name or 'Не указано'} {db_user.last_name or ''}\n"
-            f"Username: @{db_user.username or 'Не указан'}\n"
-            f"Компания: {db_user.company or 'Не указана'}\n"
-            f"Должность: {db_user.position or 'Не указана'}\n"
-            f"Баллы: {db_user.points} 🏆"
+            f"Имя: {db_user['first_name'] or 'Не указано'} {db_user['last_name'] or ''}\n"
+            f"Username: @{db_user['username'] or 'Не указан'}\n"
+            f"Компания: {db_user['company'] or 'Не указана'}\n"
+            f"Должность: {db_user['position'] or 'Не указана'}\n"
+            f"Баллы: {db_user['points']} 🏆"
         )
     
     elif data == 'employees':
@@ -131,18 +337,50 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "⚫ Больничный - на больничном"
         )
 
+def build_application():
+    """Приложение бота: параллельная обработка и ограниченная очередь обновлений"""
+    builder = Application.builder().token(config.BOT_TOKEN) \
+        .concurrent_updates(config.BOT_CONCURRENT_UPDATES) \
+        .update_queue(asyncio.Queue(maxsize=config.BOT_UPDATE_QUEUE_SIZE))
+    if config.BOT_API_URL:
+        # Локальный Bot API (fake_telegram.py или telegram-bot-api)
+        builder = builder.base_url(f"{config.BOT_API_URL}/bot").base_file_url(f"{config.BOT_API_URL}/file/bot")
+    application = builder.build()
+
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(CommandHandler("membership_stats", membership_stats))
+    application.add_handler(ChatMemberHandler(track_membership, ChatMemberHandler.CHAT_MEMBER))
+    return application
+
 def run_bot():
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     
     logger.info(f"Initializing bot with token: {config.BOT_TOKEN[:10]}...")
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    application = build_application()
     
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(button_callback))
-    
-    logger.info("Bot handlers registered, starting polling...")
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if config.BOT_MODE == 'webhook':
+            # Несколько процессов бота можно поставить за балансировщиком на один BOT_WEBHOOK_URL
+            logger.info(f"Bot handlers registered, starting webhook on {config.BOT_WEBHOOK_LISTEN}:{config.BOT_WEBHOOK_PORT}...")
+            application.run_webhook(
+                listen=config.BOT_WEBHOOK_LISTEN,
+                port=config.BOT_WEBHOOK_PORT,
+                url_path=config.BOT_WEBHOOK_PATH,
+                webhook_url=config.BOT_WEBHOOK_URL,
+                secret_token=config.BOT_WEBHOOK_SECRET or None,
+                max_connections=config.BOT_WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=ALLOWED_UPDATES
+            )
+        else:
+            logger.info("Bot handlers registered, starting polling...")
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
     except Exception as e:
-        logger.error(f"Bot polling error: {e}")
+        logger.error(f"Bot error: {e}")
+    finally:
+        logger.info(f"Membership cache stats: {membership_cache.stats()}")
+        _db_executor.shutdown(wait=False)
+
+if __name__ == "__main__":
+    run_bot()
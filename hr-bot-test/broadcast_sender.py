@@ -0,0 +1,220 @@
+"""
+Доставка рассылок в Telegram
+
+Рассылка получает задачу notification_jobs (kind='telegram'); задачи
+выполняет планировщик (один процесс, см. scheduler.py), поэтому лимит
+Telegram (~30 сообщений в секунду на бота) соблюдается одним ограничителем.
+
+Получатели фиксируются в broadcast_deliveries одним INSERT ... SELECT,
+затем отправляются пачками по BROADCAST_BATCH_SIZE: сообщения пачки идут
+параллельно через token bucket. Перед запросом к Telegram строка
+помечается 'sending', результат записывается сразу по получении. После
+сбоя задача продолжается с 'pending', а строки, оставшиеся в 'sending',
+получают статус 'unknown' и повторно не отправляются: сообщение могло
+уже дойти. По той же причине не повторяется запрос, завершившийся
+таймаутом. На 429 все отправки ждут retry_after, прочие сетевые ошибки
+(запрос не дошёл до Telegram) повторяются с экспоненциальной задержкой.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, literal, or_, select, update
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+import config
+from database import get_session, User, NotificationJob, BroadcastDelivery
+from fanout import audience_filter, claim_job
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = 'telegram'
+
+class TokenBucket:
+    """Ограничитель частоты: rate сообщений в секунду, всплеск до capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Остановить все отправки (ответ 429 относится ко всему боту)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def start_delivery(broadcast_id, title, message, audience=None, created_by=None, db_session=None):
+    """Задача доставки рассылки в Telegram в транзакции вызывающего кода
+
+    Задачу выполнит планировщик (deliver_pending) после коммита.
+    """
+    job = NotificationJob(
+        kind=JOB_KIND,
+        source_id=broadcast_id,
+        title=title,
+        message=message,
+        audience=json.dumps(audience or {}, ensure_ascii=False),
+        status='pending',
+        created_by=created_by
+    )
+    db_session.add(job)
+    db_session.flush()
+    return job.id
+
+def _add_recipients(db_session, job):
+    """Получатели рассылки с telegram_id; один раз на задачу"""
+    has_rows = db_session.query(BroadcastDelivery.id).filter_by(broadcast_id=job.source_id).first()
+    if not has_rows:
+        audience = json.loads(job.audience or '{}')
+        recipients = select(
+            literal(job.source_id), User.id, User.telegram_id, literal('pending'), literal(0)
+        ).where(*audience_filter(audience), User.telegram_id.isnot(None), User.telegram_id != '')
+        db_session.execute(insert(BroadcastDelivery).from_select(
+            ['broadcast_id', 'user_id', 'chat_id', 'status', 'attempts'], recipients
+        ))
+
+    # Отправка прервалась на этих получателях: дошло ли сообщение, неизвестно
+    db_session.query(BroadcastDelivery).filter_by(broadcast_id=job.source_id, status='sending').update(
+        {'status': 'unknown', 'error': 'Отправка прервана перезапуском'}, synchronize_session=False
+    )
+    job.total = db_session.query(func.count(BroadcastDelivery.id)).filter_by(broadcast_id=job.source_id).scalar()
+    db_session.commit()
+
+def _save_status(db_session, delivery_id, status, attempts, error=None):
+    db_session.execute(update(BroadcastDelivery), [{
+        'id': delivery_id, 'status': status, 'attempts': attempts, 'error': error,
+        'sent_at': datetime.utcnow() if status == 'sent' else None
+    }])
+    db_session.commit()
+
+async def _send(db_session, bot, bucket, delivery_id, chat_id, attempts, text):
+    """Отправка одному получателю; возвращает True, если сообщение доставлено"""
+    while True:
+        await bucket.acquire()
+        attempts += 1
+        _save_status(db_session, delivery_id, 'sending', attempts)
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            _save_status(db_session, delivery_id, 'sent', attempts)
+            return True
+        except RetryAfter as e:
+            # Ожидание по требованию Telegram не считается попыткой
+            attempts -= 1
+            retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            logger.warning(f"Telegram ограничил частоту, пауза {retry_after} с")
+            _save_status(db_session, delivery_id, 'pending', attempts)
+            bucket.pause(retry_after)
+        except TimedOut as e:
+            # Запрос мог дойти до Telegram: повтор дал бы второе сообщение
+            _save_status(db_session, delivery_id, 'unknown', attempts, str(e))
+            return False
+        except Forbidden as e:
+            _save_status(db_session, delivery_id, 'blocked', attempts, str(e))
+            return False
+        except BadRequest as e:
+            _save_status(db_session, delivery_id, 'failed', attempts, str(e))
+            return False
+        except NetworkError as e:
+            if attempts >= config.BROADCAST_MAX_ATTEMPTS:
+                _save_status(db_session, delivery_id, 'failed', attempts, str(e))
+                return False
+            _save_status(db_session, delivery_id, 'pending', attempts, str(e))
+            await asyncio.sleep(min(2 ** attempts, 60))
+
+async def _deliver(db_session, job, bot):
+    text = f"📢 {job.title}\n\n{job.message}" if job.title else job.message
+    bucket = TokenBucket(config.BROADCAST_RATE_PER_SECOND, config.BROADCAST_RATE_PER_SECOND)
+
+    while True:
+        batch = db_session.query(BroadcastDelivery).filter_by(
+            broadcast_id=job.source_id, status='pending'
+        ).order_by(BroadcastDelivery.id).limit(config.BROADCAST_BATCH_SIZE).all()
+        if not batch:
+            return
+        # Значения берутся до отправки: коммит статуса сбрасывает загруженные объекты
+        results = await asyncio.gather(*[
+            _send(db_session, bot, bucket, delivery.id, delivery.chat_id, delivery.attempts or 0, text)
+            for delivery in batch
+        ])
+        db_session.query(NotificationJob).filter_by(id=job.id).update({
+            'processed': NotificationJob.processed + sum(results),
+            'heartbeat_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db_session.commit()
+
+def _bot():
+    if config.BOT_API_URL:
+        return Bot(config.BOT_TOKEN, base_url=f"{config.BOT_API_URL}/bot", base_file_url=f"{config.BOT_API_URL}/file/bot")
+    return Bot(config.BOT_TOKEN)
+
+def run_delivery(job_id):
+    """Выполнить (или продолжить) доставку рассылки"""
+    db_session = get_session()
+    try:
+        if not claim_job(db_session, job_id):
+            return
+
+        job = db_session.query(NotificationJob).get(job_id)
+        _add_recipients(db_session, job)
+
+        async def deliver():
+            async with _bot() as bot:
+                await _deliver(db_session, job, bot)
+        asyncio.run(deliver())
+
+        job.processed = db_session.query(func.count(BroadcastDelivery.id)).filter_by(
+            broadcast_id=job.source_id, status='sent'
+        ).scalar()
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        db_session.commit()
+        logger.info(f"Рассылка #{job.source_id} в Telegram: отправлено {job.processed} из {job.total}")
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка доставки рассылки в Telegram (задача #{job_id}): {e}")
+        db_session.query(NotificationJob).filter_by(id=job_id).update(
+            {'status': 'failed', 'error': str(e), 'finished_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db_session.commit()
+    finally:
+        db_session.close()
+
+def deliver_pending():
+    """Новые задачи и задачи, прерванные остановкой процесса"""
+    db_session = get_session()
+    try:
+        stale_before = datetime.utcnow() - timedelta(minutes=config.FANOUT_STALE_MINUTES)
+        job_ids = [job_id for (job_id,) in db_session.query(NotificationJob.id).filter(
+            NotificationJob.kind == JOB_KIND,
+            or_(NotificationJob.status == 'pending',
+                (NotificationJob.status == 'running') & (NotificationJob.heartbeat_at < stale_before))
+        ).order_by(NotificationJob.id).all()]
+    finally:
+        db_session.close()
+
+    for job_id in job_ids:
+        run_delivery(job_id)
+
+def register_jobs(scheduler):
+    """Проверка очереди рассылок каждые BROADCAST_POLL_SECONDS"""
+    scheduler.add_job(deliver_pending, 'interval', seconds=config.BROADCAST_POLL_SECONDS,
+                      id='telegram_broadcast_delivery', replace_existing=True)
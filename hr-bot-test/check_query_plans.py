@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Проверка планов горячих запросов на большом наборе данных (только PostgreSQL)
+
+Данные генерируются внутри транзакции, после ANALYZE для каждого запроса
+снимается EXPLAIN (FORMAT JSON); транзакция в конце откатывается.
+Скрипт завершается с кодом 1, если запрос к проверяемой таблице
+выполняется через Seq Scan.
+
+Запуск: DATABASE_URL=postgresql://... python check_query_plans.py
+"""
+
+import logging
+import sys
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from migrations import run_migrations
+from database import engine, User, Vacation, Request, Activity, Notification, Reminder, KnowledgeArticle, PollQuestion, Onboarding, RequestTemplate, RequestFile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PAGE = 51
+
+SEED_SQL = [
+    """INSERT INTO users (email, first_name, company, department, role, role_level, work_status, points, created_at)
+       SELECT 'plan' || g || '@check.local', 'User' || g, 'Company ' || (g % 50), 'Dept ' || (g % 20),
+              CASE WHEN g % 100 = 0 THEN 'admin' ELSE 'employee' END,
+              CASE WHEN g % 100 = 0 THEN 4 ELSE 1 END,
+              (ARRAY['active', 'remote', 'vacation', 'sick', 'none'])[1 + g % 5], g % 1000,
+              now() - (g || ' minutes')::interval
+       FROM generate_series(1, 20000) g""",
+    """INSERT INTO requests (user_id, request_type, title, status, created_at)
+       SELECT u.id, (ARRAY['hr', 'it', 'purchase', 'other'])[1 + g % 4], 'Request ' || g,
+              CASE WHEN g % 20 = 0 THEN 'pending' WHEN g % 3 = 0 THEN 'rejected' ELSE 'approved' END,
+              now() - (g || ' minutes')::interval
+       FROM generate_series(1, 200000) g
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE '%@check.local') u
+         ON u.n = 1 + g % 20000""",
+    """INSERT INTO vacations (user_id, start_date, end_date, days_count, status, created_at)
+       SELECT u.id, now(), now() + interval '5 days', 5,
+              CASE WHEN g % 20 = 0 THEN 'pending' ELSE 'approved' END,
+              now() - (g || ' minutes')::interval
+       FROM generate_series(1, 100000) g
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE '%@check.local') u
+         ON u.n = 1 + g % 20000""",
+    """INSERT INTO notifications (user_id, title, message, is_read, created_at)
+       SELECT u.id, 'Notification ' || g, 'text', g % 2 = 0, now() - (g || ' seconds')::interval
+       FROM generate_series(1, 300000) g
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE '%@check.local') u
+         ON u.n = 1 + g % 20000""",
+    """INSERT INTO activities (user_id, activity_type, description, points, created_at)
+       SELECT u.id, 'login', 'visit', 1, now() - (g || ' seconds')::interval
+       FROM generate_series(1, 300000) g
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE '%@check.local') u
+         ON u.n = 1 + g % 20000""",
+    """INSERT INTO reminders (user_id, title, reminder_date, created_at)
+       SELECT u.id, 'Reminder ' || g, now() + (g || ' minutes')::interval, now()
+       FROM generate_series(1, 50000) g
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE '%@check.local') u
+         ON u.n = 1 + g % 20000""",
+    """INSERT INTO onboarding (user_id, title, status, created_at)
+       SELECT u.id, 'Task ' || g, CASE WHEN g % 4 = 0 THEN 'pending' ELSE 'completed' END, now()
+       FROM generate_series(1, 60000) g
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE '%@check.local') u
+         ON u.n = 1 + g % 20000""",
+    """INSERT INTO knowledge_categories (name, description, icon, created_at)
+       SELECT 'Plan category ' || g, '', '📁', now() FROM generate_series(1, 200) g""",
+    """INSERT INTO knowledge_articles (category_id, title, content, created_at)
+       SELECT c.id, 'Article ' || g, 'text', now() - (g || ' minutes')::interval
+       FROM generate_series(1, 40000) g
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM knowledge_categories WHERE name LIKE 'Plan category %') c
+         ON c.n = 1 + g % 200""",
+    """INSERT INTO polls (title, is_active, created_at)
+       SELECT 'Poll ' || g, g % 100 = 0, now() - (g || ' minutes')::interval FROM generate_series(1, 5000) g""",
+    """INSERT INTO poll_questions (poll_id, question, options, created_at)
+       SELECT p.id, 'Question ' || g, '[]', now()
+       FROM polls p, generate_series(1, 4) g WHERE p.title LIKE 'Poll %'""",
+    """INSERT INTO request_templates (title, company, created_at)
+       SELECT 'Template ' || g, 'Company ' || (g % 50), now() FROM generate_series(1, 5000) g""",
+    """INSERT INTO request_files (template_id, filename, file_url, company, created_at)
+       SELECT t.id, 'file' || g, 'https://files.local/' || g, t.company, now()
+       FROM request_templates t, generate_series(1, 4) g WHERE t.title LIKE 'Template %'""",
+]
+
+def hot_queries(ids):
+    """Горячие запросы приложения: (название, проверяемая таблица, запрос)"""
+    user_id, category_id, poll_id, template_id = ids['user'], ids['category'], ids['poll'], ids['template']
+
+    def newest(model, sort_column=None):
+        sort_column = sort_column if sort_column is not None else model.created_at
+        return select(model).order_by(sort_column.desc(), model.id.desc()).limit(PAGE)
+
+    return [
+        ('requests: лента', 'requests', newest(Request)),
+        ('requests: мои заявки', 'requests', newest(Request).where(Request.user_id == user_id)),
+        ('requests: по статусу', 'requests', newest(Request).where(Request.status == 'pending')),
+        ('vacations: лента', 'vacations', newest(Vacation)),
+        ('vacations: мои отпуска', 'vacations', newest(Vacation).where(Vacation.user_id == user_id)),
+        ('notifications: мои уведомления', 'notifications', newest(Notification).where(Notification.user_id == user_id)),
+        ('activities: лента', 'activities', newest(Activity)),
+        ('activities: мои активности', 'activities', newest(Activity).where(Activity.user_id == user_id)),
+        ('reminders: лента', 'reminders', newest(Reminder, Reminder.reminder_date)),
+        ('reminders: удаление сотрудника', 'reminders', select(Reminder.id).where(Reminder.user_id == user_id)),
+        ('onboarding: задачи сотрудника', 'onboarding',
+         select(Onboarding).where(Onboarding.user_id == user_id, Onboarding.status == 'pending')),
+        ('knowledge_articles: статьи категории', 'knowledge_articles',
+         select(KnowledgeArticle).where(KnowledgeArticle.category_id == category_id)),
+        ('knowledge_articles: последние', 'knowledge_articles',
+         select(KnowledgeArticle).order_by(KnowledgeArticle.created_at.desc()).limit(5)),
+        ('poll_questions: вопросы опроса', 'poll_questions', select(PollQuestion).where(PollQuestion.poll_id == poll_id)),
+        ('request_templates: шаблоны компании', 'request_templates',
+         select(RequestTemplate).where(RequestTemplate.company == 'Company 7')),
+        ('request_files: файлы компании', 'request_files', select(RequestFile).where(RequestFile.company == 'Company 7')),
+        ('request_files: файлы шаблона', 'request_files', select(RequestFile).where(RequestFile.template_id == template_id)),
+        ('users: рейтинг', 'users', select(User).order_by(User.points.desc()).limit(10)),
+        ('users: администраторы', 'users', select(User).where(User.role == 'admin', User.work_status == 'active')),
+    ]
+
+def seq_scans(plan, table):
+    """Узлы плана с последовательным чтением указанной таблицы"""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') == table:
+        found.append(plan)
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child, table))
+    return found
+
+def check_query_plans():
+    """Проверить планы горячих запросов; возвращает список проваленных проверок"""
+    if engine.dialect.name != 'postgresql':
+        raise RuntimeError("Проверка планов запросов поддерживается только для PostgreSQL")
+
+    run_migrations()
+
+    failures = []
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            logger.info("Генерация тестовых данных...")
+            for statement in SEED_SQL:
+                conn.execute(text(statement))
+            conn.execute(text("ANALYZE"))
+
+            ids = {
+                'user': conn.execute(text("SELECT id FROM users WHERE email = 'plan777@check.local'")).scalar(),
+                'category': conn.execute(text("SELECT id FROM knowledge_categories WHERE name = 'Plan category 7'")).scalar(),
+                'poll': conn.execute(text("SELECT id FROM polls WHERE title = 'Poll 7'")).scalar(),
+                'template': conn.execute(text("SELECT id FROM request_templates WHERE title = 'Template 7'")).scalar(),
+            }
+
+            for name, table, stmt in hot_queries(ids):
+                sql = stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]['Plan']
+                scans = seq_scans(plan, table)
+                if scans:
+                    failures.append(name)
+                    logger.error(f"❌ {name}: Seq Scan по {table} (стоимость {plan['Total Cost']})")
+                else:
+                    logger.info(f"✅ {name}: {plan['Node Type']} (стоимость {plan['Total Cost']})")
+        finally:
+            trans.rollback()
+
+    return failures
+
+if __name__ == "__main__":
+    failures = check_query_plans()
+    if failures:
+        logger.error(f"Деградировали планы запросов: {', '.join(failures)}")
+        sys.exit(1)
+    logger.info("Все горячие запросы используют индексы")
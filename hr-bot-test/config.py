@@ -74,3 +74,90 @@ COMPANIES = [
     'Sapa Digital Communications',
     'Sapa Solutions'
 ]
+
+# Рабочее время (автоматическая смена статусов сотрудников)
+TIMEZONE = os.environ.get("TIMEZONE", "Asia/Almaty")
+WORK_DAY_START_HOUR = int(os.environ.get("WORK_DAY_START_HOUR", "9"))
+WORK_DAY_END_HOUR = int(os.environ.get("WORK_DAY_END_HOUR", "18"))
+
+# Пул соединений с базой данных
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))  # секунды ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # секунды жизни соединения
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "30000"))  # 0 - без ограничения
+# Предупреждение в лог, если соединение удерживается дольше порога
+DB_CONNECTION_LEAK_THRESHOLD_MS = int(os.environ.get("DB_CONNECTION_LEAK_THRESHOLD_MS", "5000"))
+
+# Production-сервер (gunicorn)
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", str(os.cpu_count() * 2 + 1 if os.cpu_count() else 3)))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "4"))
+WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", "60"))
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))
+WEB_KEEPALIVE = int(os.environ.get("WEB_KEEPALIVE", "5"))
+WEB_MAX_REQUESTS = int(os.environ.get("WEB_MAX_REQUESTS", "1000"))  # перезапуск воркера после N запросов, 0 - никогда
+SCHEDULER_LOCK_RETRY_SECONDS = int(os.environ.get("SCHEDULER_LOCK_RETRY_SECONDS", "30"))  # как быстро другой воркер подхватит фоновые задачи
+
+# HR-аналитика: период пересчёта дневных агрегатов
+ANALYTICS_ROLLUP_INTERVAL_MINUTES = int(os.environ.get("ANALYTICS_ROLLUP_INTERVAL_MINUTES", "5"))
+ANALYTICS_ROLLUP_REBUILD_DAYS = int(os.environ.get("ANALYTICS_ROLLUP_REBUILD_DAYS", "35"))  # ночной пересчёт последних N дней
+
+# Массовые уведомления (fan-out)
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "2"))  # потоков на процесс
+FANOUT_STALE_MINUTES = int(os.environ.get("FANOUT_STALE_MINUTES", "5"))  # задача без прогресса дольше - перезапускается
+
+# Индекс сотрудников в памяти (подсказки и справочник)
+EMPLOYEE_INDEX_SYNC_SECONDS = int(os.environ.get("EMPLOYEE_INDEX_SYNC_SECONDS", "30"))  # как часто подтягивать изменения из БД
+
+# Счётчики просмотров новостей и статей
+VIEW_FLUSH_SECONDS = int(os.environ.get("VIEW_FLUSH_SECONDS", "10"))  # период записи накопленных просмотров
+VIEW_BUFFER_MAX = int(os.environ.get("VIEW_BUFFER_MAX", "1000"))  # материалов в буфере до досрочной записи
+VIEW_DEDUP_MINUTES = int(os.environ.get("VIEW_DEDUP_MINUTES", "30"))  # повторный просмотр пользователем не считается
+
+# Кэш страниц базы знаний, новостей и справочных страниц
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "500"))  # записей на процесс (LRU)
+PAGE_CACHE_TTL_SECONDS = int(os.environ.get("PAGE_CACHE_TTL_SECONDS", "300"))
+PAGE_CACHE_VERSION_CHECK_SECONDS = int(os.environ.get("PAGE_CACHE_VERSION_CHECK_SECONDS", "5"))  # как быстро видны правки из других процессов
+
+# Telegram-бот: параллельная обработка обновлений
+BOT_CONCURRENT_UPDATES = int(os.environ.get("BOT_CONCURRENT_UPDATES", "32"))  # одновременно обрабатываемых обновлений
+BOT_DB_WORKERS = int(os.environ.get("BOT_DB_WORKERS", "8"))  # потоков для запросов к БД; не больше DB_POOL_SIZE + DB_MAX_OVERFLOW
+MEMBERSHIP_CACHE_TTL_SECONDS = int(os.environ.get("MEMBERSHIP_CACHE_TTL_SECONDS", "900"))  # участник группы
+MEMBERSHIP_NEGATIVE_TTL_SECONDS = int(os.environ.get("MEMBERSHIP_NEGATIVE_TTL_SECONDS", "60"))  # не участник: короче, чтобы вступившие быстро получили доступ
+MEMBERSHIP_SYNC_SECONDS = int(os.environ.get("MEMBERSHIP_SYNC_SECONDS", "5"))  # как быстро изменения членства доходят до других процессов бота
+BOT_UPDATE_QUEUE_SIZE = int(os.environ.get("BOT_UPDATE_QUEUE_SIZE", "1000"))  # при заполнении приём обновлений ждёт обработчиков
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+BOT_WEBHOOK_URL = os.environ.get("BOT_WEBHOOK_URL", "")  # публичный https-адрес, например https://hr.example.kz/telegram
+BOT_WEBHOOK_LISTEN = os.environ.get("BOT_WEBHOOK_LISTEN", "127.0.0.1")
+BOT_WEBHOOK_PORT = int(os.environ.get("BOT_WEBHOOK_PORT", "8443"))
+BOT_WEBHOOK_PATH = os.environ.get("BOT_WEBHOOK_PATH", "telegram")
+BOT_WEBHOOK_SECRET = os.environ.get("BOT_WEBHOOK_SECRET", "")  # проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+BOT_WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("BOT_WEBHOOK_MAX_CONNECTIONS", "40"))  # параллельных запросов от Telegram
+BOT_API_URL = os.environ.get("BOT_API_URL", "")  # свой Bot API сервер (по умолчанию api.telegram.org)
+
+# Доставка рассылок в Telegram
+BROADCAST_RATE_PER_SECOND = int(os.environ.get("BROADCAST_RATE_PER_SECOND", "25"))  # лимит Telegram ~30 сообщений/с на бота
+BROADCAST_BATCH_SIZE = int(os.environ.get("BROADCAST_BATCH_SIZE", "30"))  # сообщений между записями прогресса в БД
+BROADCAST_MAX_ATTEMPTS = int(os.environ.get("BROADCAST_MAX_ATTEMPTS", "5"))  # попыток при сетевых ошибках
+BROADCAST_POLL_SECONDS = int(os.environ.get("BROADCAST_POLL_SECONDS", "10"))  # как часто планировщик проверяет очередь
+
+# Загрузка файлов
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "uploads")
+UPLOAD_FORM_MAX_MB = int(os.environ.get("UPLOAD_FORM_MAX_MB", "32"))  # предел тела запроса (форма или одна часть загрузки)
+UPLOAD_CHUNK_MB = int(os.environ.get("UPLOAD_CHUNK_MB", "8"))  # размер части при загрузке частями
+UPLOAD_SESSION_HOURS = int(os.environ.get("UPLOAD_SESSION_HOURS", "24"))  # брошенные загрузки частями удаляются
+BLOB_GC_GRACE_MINUTES = int(os.environ.get("BLOB_GC_GRACE_MINUTES", "60"))  # файл без ссылок удаляется не раньше
+UPLOADS_ACCEL_PREFIX = os.environ.get("UPLOADS_ACCEL_PREFIX", "")  # internal location Nginx для X-Accel-Redirect, например /_uploads/
+UPLOAD_MAX_SIZE_MB = {  # предел размера файла по категориям
+    'images': int(os.environ.get("UPLOAD_MAX_IMAGES_MB", "10")),
+    'documents': int(os.environ.get("UPLOAD_MAX_DOCUMENTS_MB", "25")),
+    'videos': int(os.environ.get("UPLOAD_MAX_VIDEOS_MB", "1024")),
+    'archives': int(os.environ.get("UPLOAD_MAX_ARCHIVES_MB", "512")),
+}
+
+# Превью загруженных изображений и PDF (media_worker.py)
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", "2"))  # потоков на процесс
+MEDIA_VARIANT_WIDTHS = [int(w) for w in os.environ.get("MEDIA_VARIANT_WIDTHS", "320,640,1280").split(",")]  # ширины превью, px
+MEDIA_PDF_TIMEOUT_SECONDS = int(os.environ.get("MEDIA_PDF_TIMEOUT_SECONDS", "30"))  # отрисовка первой страницы PDF
@@ -1,16 +1,28 @@
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, Float, ForeignKey, text
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Date, Boolean, Text, Float, ForeignKey, Index, UniqueConstraint, text, exc, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+from contextvars import ContextVar
 import config
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 Base = declarative_base()
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_role_work_status', 'role', 'work_status'),
+        Index('ix_users_role_level', 'role_level'),
+        Index('ix_users_company', 'company'),
+        Index('ix_users_points', 'points'),
+        Index('ix_users_updated_at', 'updated_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(String, unique=True, nullable=True)
@@ -36,6 +48,7 @@ class User(Base):
     termination_date = Column(DateTime)
     termination_reason = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # синхронизация индекса сотрудников
     
     vacations = relationship('Vacation', back_populates='user')
     requests = relationship('Request', back_populates='user')
@@ -43,6 +56,11 @@ class User(Base):
 
 class Vacation(Base):
     __tablename__ = 'vacations'
+    __table_args__ = (
+        Index('ix_vacations_created_at_id', 'created_at', 'id'),
+        Index('ix_vacations_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_vacations_status_created_at_id', 'status', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -53,6 +71,7 @@ class Vacation(Base):
     reason = Column(Text)
     admin_comment = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, onupdate=datetime.utcnow)  # смена статуса -> пересчёт агрегатов аналитики
     
     user = relationship('User', back_populates='vacations')
 
@@ -68,9 +87,70 @@ class Admin(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
-# Инициализация движка базы данных
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool со счётчиками выдачи соединений и времени ожидания"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'timeouts': 0,
+            'overflow_peak': 0,
+        }
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.stats['timeouts'] += 1
+            raise
+        waited_ms = (time.perf_counter() - started) * 1000
+
+        with self._stats_lock:
+            self.stats['checkouts'] += 1
+            # Всё, что дольше миллисекунды, считаем ожиданием свободного соединения
+            if waited_ms >= 1:
+                self.stats['waits'] += 1
+            self.stats['wait_time_total_ms'] += waited_ms
+            self.stats['wait_time_max_ms'] = max(self.stats['wait_time_max_ms'], waited_ms)
+            self.stats['overflow_peak'] = max(self.stats['overflow_peak'], self.overflow())
+        return conn
+
+    def recreate(self):
+        new_pool = super().recreate()
+        new_pool.stats = self.stats
+        new_pool._stats_lock = self._stats_lock
+        return new_pool
+
+def create_db_engine(database_url=None):
+    """Создание движка с единым настраиваемым пулом соединений"""
+    database_url = database_url or config.DATABASE_URL
+    url = make_url(database_url)
+    engine_kwargs = {'pool_pre_ping': True}
+
+    if url.get_backend_name() != 'sqlite':
+        engine_kwargs.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+
+    if url.get_backend_name() == 'postgresql' and config.DB_STATEMENT_TIMEOUT_MS > 0:
+        engine_kwargs['connect_args'] = {'options': f'-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}'}
+
+    return create_engine(database_url, **engine_kwargs)
+
+# Инициализация движка базы данных (без DDL: таблицы создаёт init_db)
 try:
-    engine = create_engine(config.DATABASE_URL, pool_pre_ping=True)
+    engine = create_db_engine()
     SessionLocal = sessionmaker(bind=engine)
     logger.info("Database engine created successfully")
 except Exception as e:
@@ -80,266 +160,42 @@ except Exception as e:
 def get_session():
     return SessionLocal()
 
-def check_and_add_columns():
-    """Проверка и добавление недостающих колонок"""
-    from sqlalchemy import inspect
-    
-    session = get_session()
-    inspector = inspect(engine)
-    
-    try:
-        # Удаляем старые колонки question и options из polls, если они существуют
-        if 'polls' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('polls')]
-            
-            if 'question' in existing_columns:
-                try:
-                    session.execute(text("ALTER TABLE polls DROP COLUMN question"))
-                    session.commit()
-                    logger.info("✅ Удалена устаревшая колонка polls.question")
-                except Exception as e:
-                    logger.warning(f"Не удалось удалить polls.question: {e}")
-                    session.rollback()
-            
-            if 'options' in existing_columns:
-                try:
-                    session.execute(text("ALTER TABLE polls DROP COLUMN options"))
-                    session.commit()
-                    logger.info("✅ Удалена устаревшая колонка polls.options")
-                except Exception as e:
-                    logger.warning(f"Не удалось удалить polls.options: {e}")
-                    session.rollback()
-            
-            if 'votes' in existing_columns:
-                try:
-                    session.execute(text("ALTER TABLE polls DROP COLUMN votes"))
-                    session.commit()
-                    logger.info("✅ Удалена устаревшая колонка polls.votes")
-                except Exception as e:
-                    logger.warning(f"Не удалось удалить polls.votes: {e}")
-                    session.rollback()
-            
-            if 'total_votes' in existing_columns:
-                try:
-                    session.execute(text("ALTER TABLE polls DROP COLUMN total_votes"))
-                    session.commit()
-                    logger.info("✅ Удалена устаревшая колонка polls.total_votes")
-                except Exception as e:
-                    logger.warning(f"Не удалось удалить polls.total_votes: {e}")
-                    session.rollback()
-        
-        # Проверяем колонки в таблице users
-        if 'users' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('users')]
-            
-            users_columns = {
-                'telegram_id': "ALTER TABLE users ADD COLUMN telegram_id VARCHAR UNIQUE",
-                'username': "ALTER TABLE users ADD COLUMN username VARCHAR",
-                'email': "ALTER TABLE users ADD COLUMN email VARCHAR UNIQUE",
-                'password': "ALTER TABLE users ADD COLUMN password VARCHAR",
-                'first_name': "ALTER TABLE users ADD COLUMN first_name VARCHAR",
-                'last_name': "ALTER TABLE users ADD COLUMN last_name VARCHAR",
-                'phone': "ALTER TABLE users ADD COLUMN phone VARCHAR",
-                'company': "ALTER TABLE users ADD COLUMN company VARCHAR",
-                'position': "ALTER TABLE users ADD COLUMN position VARCHAR",
-                'department': "ALTER TABLE users ADD COLUMN department VARCHAR",
-                'avatar': "ALTER TABLE users ADD COLUMN avatar VARCHAR",
-                'role': "ALTER TABLE users ADD COLUMN role VARCHAR DEFAULT 'employee'",
-                'role_level': "ALTER TABLE users ADD COLUMN role_level INTEGER DEFAULT 1",
-                'points': "ALTER TABLE users ADD COLUMN points INTEGER DEFAULT 0",
-                'level': "ALTER TABLE users ADD COLUMN level INTEGER DEFAULT 1",
-                'is_active': "ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT TRUE",
-                'onboarding_completed': "ALTER TABLE users ADD COLUMN onboarding_completed BOOLEAN DEFAULT FALSE",
-                'onboarding_progress': "ALTER TABLE users ADD COLUMN onboarding_progress INTEGER DEFAULT 0",
-                'work_status': "ALTER TABLE users ADD COLUMN work_status VARCHAR DEFAULT 'active'",
-                'hire_date': "ALTER TABLE users ADD COLUMN hire_date TIMESTAMP",
-                'termination_date': "ALTER TABLE users ADD COLUMN termination_date TIMESTAMP",
-                'termination_reason': "ALTER TABLE users ADD COLUMN termination_reason VARCHAR(255)",
-                'created_at': "ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
-            }
-            
-            for col_name, sql in users_columns.items():
-                if col_name not in existing_columns:
-                    try:
-                        session.execute(text(sql))
-                        session.commit()
-                        logger.info(f"✅ Добавлена колонка users.{col_name}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить users.{col_name}: {e}")
-                        session.rollback()
-        
-        # Проверяем колонки в таблице news
-        if 'news' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('news')]
-            
-            news_columns = {
-                'image_url': "ALTER TABLE news ADD COLUMN image_url VARCHAR(500)",
-                'category': "ALTER TABLE news ADD COLUMN category VARCHAR(100)",
-                'author': "ALTER TABLE news ADD COLUMN author VARCHAR(255)",
-                'views': "ALTER TABLE news ADD COLUMN views INTEGER DEFAULT 0"
-            }
-            
-            for col_name, sql in news_columns.items():
-                if col_name not in existing_columns:
-                    try:
-                        session.execute(text(sql))
-                        session.commit()
-                        logger.info(f"✅ Добавлена колонка news.{col_name}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить news.{col_name}: {e}")
-                        session.rollback()
-        
-        # Проверяем колонки в таблице notifications
-        if 'notifications' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('notifications')]
-            
-            notifications_columns = {
-                'user_id': "ALTER TABLE notifications ADD COLUMN user_id INTEGER REFERENCES users(id)",
-                'title': "ALTER TABLE notifications ADD COLUMN title VARCHAR",
-                'message': "ALTER TABLE notifications ADD COLUMN message TEXT",
-                'is_read': "ALTER TABLE notifications ADD COLUMN is_read BOOLEAN DEFAULT FALSE",
-                'created_at': "ALTER TABLE notifications ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
-            }
-            
-            for col_name, sql in notifications_columns.items():
-                if col_name not in existing_columns:
-                    try:
-                        session.execute(text(sql))
-                        session.commit()
-                        logger.info(f"✅ Добавлена колонка notifications.{col_name}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить notifications.{col_name}: {e}")
-                        session.rollback()
-        
-        # Проверяем колонки в таблице admins
-        if 'admins' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('admins')]
-            
-            admins_columns = {
-                'telegram_id': "ALTER TABLE admins ADD COLUMN telegram_id VARCHAR UNIQUE",
-                'email': "ALTER TABLE admins ADD COLUMN email VARCHAR UNIQUE",
-                'login': "ALTER TABLE admins ADD COLUMN login VARCHAR UNIQUE",
-                'password': "ALTER TABLE admins ADD COLUMN password VARCHAR",
-                'level': "ALTER TABLE admins ADD COLUMN level INTEGER DEFAULT 1",
-                'created_at': "ALTER TABLE admins ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
-                'updated_at': "ALTER TABLE admins ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
-            }
-            
-            for col_name, sql in admins_columns.items():
-                if col_name not in existing_columns:
-                    try:
-                        session.execute(text(sql))
-                        session.commit()
-                        logger.info(f"✅ Добавлена колонка admins.{col_name}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить admins.{col_name}: {e}")
-                        session.rollback()
-            
-            # Делаем nullable для существующих колонок
-            try:
-                session.execute(text("ALTER TABLE admins ALTER COLUMN email DROP NOT NULL"))
-                session.commit()
-                logger.info("✅ admins.email теперь nullable")
-            except:
-                pass
-            
-            try:
-                session.execute(text("ALTER TABLE admins ALTER COLUMN login DROP NOT NULL"))
-                session.commit()
-                logger.info("✅ admins.login теперь nullable")
-            except:
-                pass
-            
-            try:
-                session.execute(text("ALTER TABLE admins ALTER COLUMN password DROP NOT NULL"))
-                session.commit()
-                logger.info("✅ admins.password теперь nullable")
-            except:
-                pass
-        
-        # Проверяем колонки в таблице polls
-        if 'polls' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('polls')]
-            
-            polls_columns = {
-                'title': "ALTER TABLE polls ADD COLUMN title VARCHAR",
-                'description': "ALTER TABLE polls ADD COLUMN description TEXT",
-                'is_active': "ALTER TABLE polls ADD COLUMN is_active BOOLEAN DEFAULT TRUE",
-                'total_responses': "ALTER TABLE polls ADD COLUMN total_responses INTEGER DEFAULT 0",
-                'created_at': "ALTER TABLE polls ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
-            }
-            
-            for col_name, sql in polls_columns.items():
-                if col_name not in existing_columns:
-                    try:
-                        session.execute(text(sql))
-                        session.commit()
-                        logger.info(f"✅ Добавлена колонка polls.{col_name}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить polls.{col_name}: {e}")
-                        session.rollback()
-        
-        # Проверяем колонки в таблице onboarding
-        if 'onboarding' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('onboarding')]
-            
-            onboarding_columns = {
-                'progress': "ALTER TABLE onboarding ADD COLUMN progress INTEGER DEFAULT 0"
-            }
-            
-            for col_name, sql in onboarding_columns.items():
-                if col_name not in existing_columns:
-                    try:
-                        session.execute(text(sql))
-                        session.commit()
-                        logger.info(f"✅ Добавлена колонка onboarding.{col_name}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить onboarding.{col_name}: {e}")
-                        session.rollback()
-        
-        # Проверяем колонки в таблице request_files
-        if 'request_files' in inspector.get_table_names():
-            existing_columns = [col['name'] for col in inspector.get_columns('request_files')]
-            
-            request_files_columns = {
-                'file_path': "ALTER TABLE request_files ADD COLUMN file_path VARCHAR(500)",
-                'file_url': "ALTER TABLE request_files ADD COLUMN file_url VARCHAR(500)",
-                'file_type': "ALTER TABLE request_files ADD COLUMN file_type VARCHAR(50)",
-                'uploaded_by': "ALTER TABLE request_files ADD COLUMN uploaded_by INTEGER REFERENCES users(id)",
-                'original_name': "ALTER TABLE request_files ADD COLUMN original_name VARCHAR(500)"
-            }
-            
-            for col_name, sql in request_files_columns.items():
-                if col_name not in existing_columns:
-                    try:
-                        session.execute(text(sql))
-                        session.commit()
-                        logger.info(f"✅ Добавлена колонка request_files.{col_name}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить request_files.{col_name}: {e}")
-                        session.rollback()
-        
-        # Делаем nullable для telegram_id в users
-        try:
-            session.execute(text("ALTER TABLE users ALTER COLUMN telegram_id DROP NOT NULL"))
-            session.commit()
-            logger.info("✅ users.telegram_id теперь nullable")
-        except:
-            pass
-        
-        # Делаем nullable для file_path в request_files
-        try:
-            session.execute(text("ALTER TABLE request_files ALTER COLUMN file_path DROP NOT NULL"))
-            session.commit()
-            logger.info("✅ request_files.file_path теперь nullable")
-        except:
-            pass
-        
-    except Exception as e:
-        logger.error(f"Ошибка при проверке колонок: {e}")
-        session.rollback()
-    finally:
-        session.close()
+# Владелец соединения для детектора утечек (например, эндпоинт Flask)
+connection_owner = ContextVar('connection_owner', default=None)
+
+@event.listens_for(engine, 'checkout')
+def _track_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info['checkout_at'] = time.monotonic()
+    connection_record.info['owner'] = connection_owner.get()
+
+@event.listens_for(engine, 'checkin')
+def _detect_leak(dbapi_connection, connection_record):
+    checkout_at = connection_record.info.pop('checkout_at', None)
+    owner = connection_record.info.pop('owner', None)
+    if checkout_at is None:
+        return
+
+    held_ms = (time.monotonic() - checkout_at) * 1000
+    if held_ms > config.DB_CONNECTION_LEAK_THRESHOLD_MS:
+        logger.warning(f"Соединение с БД удерживалось {held_ms:.0f} мс (владелец: {owner or 'неизвестен'})")
+
+def get_pool_stats():
+    """Текущее состояние пула и накопленные счётчики"""
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update(pool.stats)
+
+    return stats
 
 def init_knowledge_base():
     """Инициализация базы знаний"""
@@ -459,12 +315,9 @@ def create_main_developer():
 
 def init_db():
     try:
-        Base.metadata.create_all(engine)
-        logger.info("Database tables created successfully")
-        
-        # Автоматическая проверка и добавление недостающих колонок
-        check_and_add_columns()
-        logger.info("Database columns verified and updated")
+        # Таблицы, колонки и индексы - через версионированные миграции
+        from migrations import run_migrations
+        run_migrations()
         
         # Автоматическая инициализация базы знаний
         init_knowledge_base()
@@ -489,6 +342,11 @@ def test_database_connection():
 
 class Request(Base):
     __tablename__ = 'requests'
+    __table_args__ = (
+        Index('ix_requests_created_at_id', 'created_at', 'id'),
+        Index('ix_requests_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_requests_status_created_at_id', 'status', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -504,6 +362,9 @@ class Request(Base):
 
 class News(Base):
     __tablename__ = 'news'
+    __table_args__ = (
+        Index('ix_news_created_at_id', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String)
@@ -516,6 +377,10 @@ class News(Base):
 
 class Activity(Base):
     __tablename__ = 'activities'
+    __table_args__ = (
+        Index('ix_activities_created_at_id', 'created_at', 'id'),
+        Index('ix_activities_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -528,16 +393,41 @@ class Activity(Base):
 
 class Notification(Base):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        Index('ix_notifications_created_at_id', 'created_at', 'id'),
+        Index('ix_notifications_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_notifications_audience_created_at_id', 'audience', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'))  # для личных уведомлений
     title = Column(String)
     message = Column(Text)
-    is_read = Column(Boolean, default=False)
+    is_read = Column(Boolean, default=False)  # для личных; общие - в notification_reads
+    audience = Column(String, default='user')  # user - личное, shared - одно на аудиторию
+    # Фильтры общей аудитории; NULL - без ограничения
+    audience_company = Column(String)
+    audience_department = Column(String)
+    audience_role = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class NotificationRead(Base):
+    """Отметка о прочтении общего уведомления пользователем"""
+    __tablename__ = 'notification_reads'
+    __table_args__ = (
+        Index('ix_notification_reads_user_id', 'user_id'),
+    )
+
+    notification_id = Column(Integer, ForeignKey('notifications.id', ondelete='CASCADE'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    read_at = Column(DateTime, default=datetime.utcnow)
+
 class Reminder(Base):
     __tablename__ = 'reminders'
+    __table_args__ = (
+        Index('ix_reminders_user_id', 'user_id'),
+        Index('ix_reminders_reminder_date_id', 'reminder_date', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -558,6 +448,9 @@ class PurchaseExecutor(Base):
 
 class Broadcast(Base):
     __tablename__ = 'broadcasts'
+    __table_args__ = (
+        Index('ix_broadcasts_created_at_id', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String)
@@ -578,6 +471,10 @@ class KnowledgeCategory(Base):
 
 class KnowledgeArticle(Base):
     __tablename__ = 'knowledge_articles'
+    __table_args__ = (
+        Index('ix_knowledge_articles_category_id', 'category_id'),
+        Index('ix_knowledge_articles_created_at', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     category_id = Column(Integer, ForeignKey('knowledge_categories.id'))
@@ -592,6 +489,10 @@ class KnowledgeArticle(Base):
 
 class Poll(Base):
     __tablename__ = 'polls'
+    __table_args__ = (
+        Index('ix_polls_is_active_created_at', 'is_active', 'created_at'),
+        Index('ix_polls_created_at', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
@@ -604,20 +505,42 @@ class Poll(Base):
 
 class PollQuestion(Base):
     __tablename__ = 'poll_questions'
+    __table_args__ = (
+        Index('ix_poll_questions_poll_id', 'poll_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     poll_id = Column(Integer, ForeignKey('polls.id'))
     question = Column(String, nullable=False)
     options = Column(Text, nullable=False)
-    votes = Column(Text, default='{}')
+    votes = Column(Text, default='{}')  # устарело: голоса хранятся в poll_votes
     total_votes = Column(Integer, default=0)
     order = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     poll = relationship('Poll', back_populates='questions')
 
+class PollVote(Base):
+    """Голос пользователя по вопросу опроса (один голос на вопрос)"""
+    __tablename__ = 'poll_votes'
+    __table_args__ = (
+        UniqueConstraint('question_id', 'user_id', name='uq_poll_votes_question_user'),
+        Index('ix_poll_votes_question_id_option', 'question_id', 'option'),
+        Index('ix_poll_votes_poll_id_user_id', 'poll_id', 'user_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    poll_id = Column(Integer, ForeignKey('polls.id', ondelete='CASCADE'), nullable=False)
+    question_id = Column(Integer, ForeignKey('poll_questions.id', ondelete='CASCADE'), nullable=False)
+    option = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'))  # NULL - голоса, перенесённые из JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Onboarding(Base):
     __tablename__ = 'onboarding'
+    __table_args__ = (
+        Index('ix_onboarding_user_id_status', 'user_id', 'status'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -690,6 +613,9 @@ class EmployeeMetrics(Base):
 
 class RequestTemplate(Base):
     __tablename__ = 'request_templates'
+    __table_args__ = (
+        Index('ix_request_templates_company', 'company'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
@@ -702,6 +628,11 @@ class RequestTemplate(Base):
 
 class RequestFile(Base):
     __tablename__ = 'request_files'
+    __table_args__ = (
+        Index('ix_request_files_company', 'company'),
+        Index('ix_request_files_template_id', 'template_id'),
+        Index('ix_request_files_content_hash', 'content_hash'),
+    )
     
     id = Column(Integer, primary_key=True)
     template_id = Column(Integer, ForeignKey('request_templates.id'))
@@ -711,12 +642,85 @@ class RequestFile(Base):
     file_url = Column(String, nullable=False)  # Ссылка на файл
     file_type = Column(String)
     company = Column(String, nullable=False)
+    content_hash = Column(String(64))  # sha256 загруженного файла (stored_blobs), для ссылок - пусто
     uploaded_by = Column(Integer, ForeignKey('users.id'))
     created_at = Column(DateTime, default=datetime.utcnow)
 
-engine = create_engine(config.DATABASE_URL)
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+class SchemaVersion(Base):
+    """Применённые миграции схемы (см. migrations.py)"""
+    __tablename__ = 'schema_version'
 
-def get_session():
-    return Session()
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class NotificationJob(Base):
+    """Задача массовой рассылки уведомлений и её прогресс (см. fanout.py)"""
+    __tablename__ = 'notification_jobs'
+    __table_args__ = (
+        Index('ix_notification_jobs_status', 'status'),
+        Index('ix_notification_jobs_kind_source_id', 'kind', 'source_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # poll, broadcast, ...
+    source_id = Column(Integer)  # id опроса/рассылки
+    title = Column(String)
+    message = Column(Text)
+    audience = Column(Text, default='{}')  # JSON: company, department, role
+    status = Column(String, default='pending')  # pending, running, done, failed
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    notification_id = Column(Integer, ForeignKey('notifications.id', ondelete='SET NULL'))  # опубликованное общее уведомление
+    error = Column(Text)
+    created_by = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class BroadcastDelivery(Base):
+    """Доставка рассылки в Telegram одному получателю (см. broadcast_sender.py)"""
+    __tablename__ = 'broadcast_deliveries'
+    __table_args__ = (
+        UniqueConstraint('broadcast_id', 'user_id', name='uq_broadcast_deliveries_broadcast_user'),
+        Index('ix_broadcast_deliveries_broadcast_status', 'broadcast_id', 'status', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    broadcast_id = Column(Integer, ForeignKey('broadcasts.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    chat_id = Column(String, nullable=False)  # telegram_id получателя
+    status = Column(String, default='pending')  # pending, sending, sent, blocked, failed, unknown (могло дойти)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    sent_at = Column(DateTime)
+
+class StoredBlob(Base):
+    """Файл хранилища по хэшу содержимого и число ссылок на него (см. file_storage.py)"""
+    __tablename__ = 'stored_blobs'
+    __table_args__ = (
+        Index('ix_stored_blobs_released_at', 'released_at'),
+    )
+
+    content_hash = Column(String(64), primary_key=True)  # sha256
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    released_at = Column(DateTime)  # когда ушла последняя ссылка; файл удалит сборщик мусора
+
+class SystemState(Base):
+    """Служебные отметки фоновых задач (ключ -> значение)"""
+    __tablename__ = 'system_state'
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AnalyticsDaily(Base):
+    """Дневные агрегаты для HR-аналитики (метрика + измерение за день)"""
+    __tablename__ = 'analytics_daily'
+
+    day = Column(Date, primary_key=True)
+    metric = Column(String, primary_key=True)  # requests_status, requests_type, vacation_days, ...
+    dimension = Column(String, primary_key=True, default='')  # статус, тип, отдел или ''
+    value = Column(Integer, default=0)
@@ -0,0 +1,300 @@
+"""
+Индекс сотрудников в памяти процесса для подсказок и справочника
+
+Слова из ФИО, email, должности, отдела и компании хранятся в отсортированном
+списке (поиск по префиксу через bisect) и в словаре триграмм (опечатки и
+вхождения в середине слова). Запрос к индексу не обращается к БД.
+
+Индекс обновляется:
+- сразу после коммита изменений User в этом процессе (события ORM);
+- разницей по users.updated_at не чаще EMPLOYEE_INDEX_SYNC_SECONDS,
+  в фоновом потоке, - изменения из других процессов и массовые UPDATE;
+- полной перезагрузкой, если число строк в БД разошлось с индексом
+  (удаление сотрудника в другом процессе).
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from datetime import timedelta
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+import config
+from database import get_session, User
+
+logger = logging.getLogger(__name__)
+
+# Поля, по которым ищутся сотрудники
+SEARCH_FIELDS = ('first_name', 'last_name', 'email', 'position', 'department', 'company')
+
+SORT_KEYS = {
+    'name': lambda card: (_name(card).lower(), card['id']),
+    'points': lambda card: (-card['points'], _name(card).lower()),
+    'company': lambda card: (card['company'].lower(), _name(card).lower()),
+}
+
+# Доля общих триграмм, при которой слово считается похожим
+TRIGRAM_THRESHOLD = 0.5
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+def _name(card):
+    return f"{card['first_name']} {card['last_name']}".strip()
+
+def _words(value):
+    return _WORD_RE.findall((value or '').lower().replace('ё', 'е'))
+
+def _trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def user_card(user):
+    """Карточка сотрудника для индекса и JSON"""
+    return {
+        'id': user.id,
+        'first_name': user.first_name or '',
+        'last_name': user.last_name or '',
+        'email': user.email or '',
+        'phone': user.phone or '',
+        'company': user.company or '',
+        'position': user.position or '',
+        'department': user.department or '',
+        'role': user.role,
+        'work_status': user.work_status or 'active',
+        'points': user.points or 0,
+        'level': user.level or 1,
+        'is_active': bool(user.is_active),
+    }
+
+class EmployeeIndex:
+    """Префиксный и триграммный индекс карточек сотрудников"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cards = {}
+        self._words = {}        # user_id -> слова карточки
+        self._name_words = {}   # user_id -> слова ФИО (для ранжирования)
+        self._postings = {}     # слово -> {user_id}
+        self._sorted = []       # отсортированные слова для поиска по префиксу
+        self._grams = {}        # триграмма -> {слово}
+
+    def __len__(self):
+        return len(self._cards)
+
+    def replace_all(self, cards):
+        """Полная перезагрузка индекса"""
+        fresh = EmployeeIndex()
+        for card in cards:
+            fresh._add(card, keep_sorted=False)
+        fresh._sorted = sorted(fresh._postings)
+        with self._lock:
+            self._cards, self._words, self._name_words = fresh._cards, fresh._words, fresh._name_words
+            self._postings, self._sorted, self._grams = fresh._postings, fresh._sorted, fresh._grams
+
+    def upsert(self, card):
+        with self._lock:
+            self._remove(card['id'])
+            self._add(card)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def _add(self, card, keep_sorted=True):
+        user_id = card['id']
+        words = {word for field in SEARCH_FIELDS for word in _words(card[field])}
+        self._cards[user_id] = card
+        self._words[user_id] = words
+        self._name_words[user_id] = set(_words(_name(card)))
+
+        for word in words:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                if keep_sorted:
+                    bisect.insort(self._sorted, word)
+                for gram in _trigrams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+            postings.add(user_id)
+
+    def _remove(self, user_id):
+        if self._cards.pop(user_id, None) is None:
+            return
+        self._name_words.pop(user_id, None)
+
+        for word in self._words.pop(user_id):
+            postings = self._postings[word]
+            postings.discard(user_id)
+            if postings:
+                continue
+            del self._postings[word]
+            del self._sorted[bisect.bisect_left(self._sorted, word)]
+            for gram in _trigrams(word):
+                similar = self._grams[gram]
+                similar.discard(word)
+                if not similar:
+                    del self._grams[gram]
+
+    def _prefix_words(self, prefix):
+        position = bisect.bisect_left(self._sorted, prefix)
+        words = []
+        while position < len(self._sorted) and self._sorted[position].startswith(prefix):
+            words.append(self._sorted[position])
+            position += 1
+        return words
+
+    def _similar_words(self, word):
+        grams = _trigrams(word)
+        counts = {}
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        return [candidate for candidate, shared in counts.items()
+                if shared / len(grams | _trigrams(candidate)) >= TRIGRAM_THRESHOLD]
+
+    def _matches(self, term):
+        """Сотрудники со словом на term: сначала по префиксу, затем по триграммам"""
+        words = self._prefix_words(term)
+        if not words and len(term) >= 3:
+            words = self._similar_words(term)
+        ids = set()
+        for word in words:
+            ids |= self._postings[word]
+        return ids
+
+    def _filtered(self, ids, company=None, role=None):
+        cards = (self._cards[user_id] for user_id in ids)
+        if company:
+            cards = (card for card in cards if card['company'] == company)
+        if role:
+            cards = (card for card in cards if card['role'] == role)
+        return list(cards)
+
+    def suggest(self, query, limit=10, company=None, role=None):
+        """Подсказки: каждое слово запроса - начало (или похожее) слово карточки"""
+        terms = _words(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            ids = None
+            for term in terms:
+                matched = self._matches(term)
+                ids = matched if ids is None else ids & matched
+                if not ids:
+                    return []
+
+            def rank(card):
+                names = self._name_words[card['id']]
+                name_hits = sum(1 for term in terms if any(word.startswith(term) for word in names))
+                return (-name_hits, _name(card).lower(), card['id'])
+
+            return heapq.nsmallest(limit, self._filtered(ids, company, role), key=rank)
+
+    def listing(self, query=None, company=None, role=None, sort='name', offset=0, limit=50):
+        """Страница справочника: (карточки, всего найдено)"""
+        with self._lock:
+            if query and _words(query):
+                cards = self.suggest(query, len(self._cards), company, role)
+            else:
+                cards = self._filtered(self._cards, company, role)
+        cards.sort(key=SORT_KEYS.get(sort, SORT_KEYS['name']))
+        return cards[offset:offset + limit], len(cards)
+
+    def stats(self):
+        """Всего, активных и список компаний"""
+        with self._lock:
+            cards = list(self._cards.values())
+        return {
+            'total': len(cards),
+            'active': sum(1 for card in cards if card['is_active']),
+            'companies': sorted({card['company'] for card in cards if card['company']}),
+        }
+
+_index = EmployeeIndex()
+_loaded = threading.Event()
+_load_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_watermark = None
+_synced_at = 0.0
+
+def _load(db_session):
+    global _watermark, _synced_at
+    users = db_session.query(User).all()
+    _index.replace_all(user_card(user) for user in users)
+    _watermark = max((user.updated_at for user in users if user.updated_at), default=None)
+    _synced_at = time.monotonic()
+    logger.info(f"Индекс сотрудников загружен: {len(users)}")
+
+def get_index():
+    """Индекс процесса; при первом обращении загружается, затем обновляется в фоне"""
+    if not _loaded.is_set():
+        with _load_lock:
+            if not _loaded.is_set():
+                db_session = get_session()
+                try:
+                    _load(db_session)
+                finally:
+                    db_session.close()
+                _loaded.set()
+    elif time.monotonic() - _synced_at >= config.EMPLOYEE_INDEX_SYNC_SECONDS and not _sync_lock.locked():
+        threading.Thread(target=sync, name='employee-index-sync', daemon=True).start()
+    return _index
+
+def sync():
+    """Применить изменения из БД, сделанные после последней синхронизации"""
+    global _watermark, _synced_at
+    if not _sync_lock.acquire(blocking=False):
+        return
+    db_session = get_session()
+    try:
+        query = db_session.query(User)
+        if _watermark is not None:
+            # Запас на записи, чьи транзакции зафиксировались позже чужих
+            query = query.filter(User.updated_at >= _watermark - timedelta(seconds=config.EMPLOYEE_INDEX_SYNC_SECONDS))
+        changed = query.all()
+        for user in changed:
+            _index.upsert(user_card(user))
+            if user.updated_at and (_watermark is None or user.updated_at > _watermark):
+                _watermark = user.updated_at
+
+        if db_session.query(func.count(User.id)).scalar() != len(_index):
+            _load(db_session)
+        _synced_at = time.monotonic()
+    except Exception as e:
+        logger.error(f"Ошибка синхронизации индекса сотрудников: {e}")
+    finally:
+        db_session.close()
+        _sync_lock.release()
+
+# Изменения User в сессии копируются при flush и попадают в индекс после коммита
+
+def _pending(session):
+    return session.info.setdefault('employee_index', {})
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _on_user_saved(mapper, connection, target):
+    _pending(Session.object_session(target))[target.id] = user_card(target)
+
+@event.listens_for(User, 'after_delete')
+def _on_user_deleted(mapper, connection, target):
+    _pending(Session.object_session(target))[target.id] = None
+
+@event.listens_for(Session, 'after_commit')
+def _on_commit(session):
+    changes = session.info.pop('employee_index', None)
+    if not changes or not _loaded.is_set():
+        return
+    for user_id, card in changes.items():
+        if card is None:
+            _index.remove(user_id)
+        else:
+            _index.upsert(card)
+
+@event.listens_for(Session, 'after_rollback')
+def _on_rollback(session):
+    session.info.pop('employee_index', None)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка Telegram Bot API для замера пропускной способности бота
+
+Заглушка отвечает на методы, которые вызывает бот (getMe, setWebhook,
+getUpdates, getChatMember, sendMessage, answerCallbackQuery ...), и
+присылает боту N команд /start от разных пользователей: в режиме webhook -
+POST на адрес бота, иначе - через getUpdates. Задержка считается от отправки
+обновления до ответа бота sendMessage в тот же чат.
+
+Бот создаёт записи пользователей для каждого /start, поэтому запускайте его
+на тестовой БД:
+
+    BOT_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook BOT_WEBHOOK_URL=http://127.0.0.1:8443/telegram \\
+        DATABASE_URL=postgresql://.../sapahr_test python bot.py
+    python fake_telegram.py --webhook http://127.0.0.1:8443/telegram --updates 2000 --concurrency 50
+
+Без --webhook бот запускается в режиме polling (BOT_MODE=polling).
+"""
+
+import argparse
+import json
+import logging
+import queue
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': 'SapaHR', 'username': 'sapahr_fake_bot'}
+FIRST_USER_ID = 7000000000
+
+class FakeTelegram:
+    """Состояние заглушки: очередь для getUpdates и время отправки обновлений"""
+
+    def __init__(self):
+        self.updates = queue.Queue()
+        self.sent_at = {}       # chat_id -> время отправки обновления
+        self.latencies = []
+        self.webhook_set = threading.Event()
+        self.connected = threading.Event()
+        self.done = threading.Event()
+        self.expected = 0
+        self._lock = threading.Lock()
+        self._message_id = 0
+
+    def reply(self, chat_id):
+        with self._lock:
+            self._message_id += 1
+            started = self.sent_at.pop(chat_id, None)
+            if started is not None:
+                self.latencies.append(time.perf_counter() - started)
+                if len(self.latencies) >= self.expected:
+                    self.done.set()
+            return self._message_id
+
+    def call(self, method, params):
+        """Результат метода Bot API"""
+        if method == 'getMe':
+            self.connected.set()
+            return BOT_USER
+        if method in ('setWebhook', 'deleteWebhook'):
+            if method == 'setWebhook' and params.get('url'):
+                self.webhook_set.set()
+            return True
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'getUpdates':
+            return self._poll(float(params.get('timeout') or 0))
+        if method == 'getChatMember':
+            user_id = int(params['user_id'])
+            return {'status': 'member', 'user': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}}
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params['chat_id'])
+            return {
+                'message_id': self.reply(chat_id),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        if method in ('answerCallbackQuery', 'close', 'logOut'):
+            return True
+        return None
+
+    def _poll(self, timeout):
+        items = []
+        try:
+            items.append(self.updates.get(timeout=min(timeout, 1.0)))
+            while len(items) < 100:
+                items.append(self.updates.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            # /bot<token>/<method>
+            method = self.path.rstrip('/').rsplit('/', 1)[-1]
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params = json.loads(body or b'{}')
+            else:
+                params = dict(parse_qsl(body.decode()))
+
+            result = fake.call(method, params)
+            if result is None:
+                payload = {'ok': False, 'error_code': 404, 'description': f'Not Found: method {method}'}
+            else:
+                payload = {'ok': True, 'result': result}
+
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def start_update(update_id, user_id):
+    """Обновление с командой /start от пользователя"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+def deliver(update, webhook, secret):
+    request = urllib.request.Request(webhook, data=json.dumps(update).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    if secret:
+        request.add_header('X-Telegram-Bot-Api-Secret-Token', secret)
+    urllib.request.urlopen(request, timeout=30).read()
+
+def run_benchmark(fake, count, concurrency, webhook=None, secret=None, timeout=120):
+    """Отправить count команд /start и дождаться ответов; возвращает метрики"""
+    fake.expected = count
+    started = time.perf_counter()
+
+    def send(i):
+        user_id = FIRST_USER_ID + i
+        update = start_update(i + 1, user_id)
+        fake.sent_at[user_id] = time.perf_counter()
+        if webhook:
+            deliver(update, webhook, secret)
+        else:
+            fake.updates.put(update)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(count)))
+
+    fake.done.wait(timeout)
+    elapsed = time.perf_counter() - started
+    latencies = sorted(fake.latencies)
+    if not latencies:
+        return {'updates': count, 'answered': 0, 'seconds': round(elapsed, 2)}
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+    return {
+        'updates': count,
+        'answered': len(latencies),
+        'seconds': round(elapsed, 2),
+        'updates_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms_mean': round(statistics.mean(latencies) * 1000, 1),
+        'latency_ms_p50': percentile(0.5),
+        'latency_ms_p95': percentile(0.95),
+        'latency_ms_p99': percentile(0.99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API и нагрузочный тест бота")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--webhook', help="адрес webhook бота; без него - режим getUpdates")
+    parser.add_argument('--secret', default='', help="BOT_WEBHOOK_SECRET бота")
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--wait', type=float, default=60, help="сколько ждать подключения бота, с")
+    args = parser.parse_args()
+
+    fake = FakeTelegram()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Заглушка Bot API: http://{args.host}:{args.port}; запустите бота с BOT_API_URL на этот адрес")
+
+    ready = fake.webhook_set if args.webhook else fake.connected
+    if not ready.wait(args.wait):
+        logger.error("Бот не подключился к заглушке")
+        raise SystemExit(1)
+    time.sleep(1)
+
+    result = run_benchmark(fake, args.updates, args.concurrency, args.webhook, args.secret)
+    logger.info(json.dumps(result, ensure_ascii=False))
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
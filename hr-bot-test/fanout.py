@@ -0,0 +1,256 @@
+"""
+Массовые уведомления
+
+Уведомление для аудитории (все / компания / отдел / роль) хранится одной
+строкой notifications с audience='shared'; кто его прочитал - в
+notification_reads. Публикация идёт задачей notification_jobs, которая
+хранит размер аудитории и прогресс для страниц администратора.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, insert, or_
+from sqlalchemy.exc import IntegrityError
+import config
+from database import get_session, User, Notification, NotificationJob, NotificationRead
+
+logger = logging.getLogger(__name__)
+
+# Задачи notification_jobs, которые выполняет этот модуль (telegram - broadcast_sender.py)
+FANOUT_KINDS = ('poll', 'broadcast')
+
+AUDIENCE_FIELDS = {'company': User.company, 'department': User.department, 'role': User.role}
+
+# Фильтр аудитории -> колонка общего уведомления
+AUDIENCE_COLUMNS = {
+    'company': Notification.audience_company,
+    'department': Notification.audience_department,
+    'role': Notification.audience_role,
+}
+
+_executor = None
+_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.FANOUT_WORKERS, thread_name_prefix='fanout')
+        return _executor
+
+def audience_filter(audience):
+    """Условия выборки получателей: активные пользователи + company/department/role"""
+    conditions = [User.is_active.is_(True)]
+    for key, value in (audience or {}).items():
+        if key in AUDIENCE_FIELDS and value:
+            conditions.append(AUDIENCE_FIELDS[key] == value)
+    return conditions
+
+def start_fanout(kind, title, message, source_id=None, audience=None, created_by=None, db_session=None):
+    """Создать задачу рассылки уведомлений и запустить её в фоне; возвращает id задачи
+
+    Если передана сессия, задача добавляется в её транзакцию и запускается
+    после коммита вызывающим кодом через submit_job.
+    """
+    own_session = db_session is None
+    db_session = db_session or get_session()
+
+    try:
+        job = NotificationJob(
+            kind=kind,
+            source_id=source_id,
+            title=title,
+            message=message,
+            audience=json.dumps(audience or {}, ensure_ascii=False),
+            status='pending',
+            created_by=created_by
+        )
+        db_session.add(job)
+        db_session.flush()
+        job_id = job.id
+
+        if own_session:
+            db_session.commit()
+            submit_job(job_id)
+        return job_id
+    except Exception:
+        if own_session:
+            db_session.rollback()
+        raise
+    finally:
+        if own_session:
+            db_session.close()
+
+def submit_job(job_id):
+    """Выполнение задачи в пуле потоков процесса"""
+    _get_executor().submit(run_job, job_id)
+
+def claim_job(db_session, job_id):
+    """Захват задачи: не завершена и никто не отмечался дольше FANOUT_STALE_MINUTES"""
+    now = datetime.utcnow()
+    stale_before = now - timedelta(minutes=config.FANOUT_STALE_MINUTES)
+    claimed = db_session.query(NotificationJob).filter(
+        NotificationJob.id == job_id,
+        NotificationJob.status.in_(['pending', 'running']),
+        or_(NotificationJob.heartbeat_at.is_(None), NotificationJob.heartbeat_at < stale_before)
+    ).update({'status': 'running', 'heartbeat_at': now}, synchronize_session=False)
+    db_session.commit()
+    return claimed == 1
+
+def run_job(job_id):
+    """Публикация общего уведомления и подсчёт размера аудитории
+
+    Уведомление и ссылка на него в задаче фиксируются в одной транзакции,
+    поэтому повторный запуск прерванной задачи не создаёт дубль.
+    """
+    db_session = get_session()
+
+    try:
+        if not claim_job(db_session, job_id):
+            return
+
+        job = db_session.query(NotificationJob).get(job_id)
+        audience = json.loads(job.audience or '{}')
+
+        if not job.notification_id:
+            notification = Notification(
+                audience='shared',
+                title=job.title,
+                message=job.message,
+                is_read=False,
+                **{column.key: audience.get(key) or None for key, column in AUDIENCE_COLUMNS.items()}
+            )
+            db_session.add(notification)
+            db_session.flush()
+            job.notification_id = notification.id
+
+        job.total = db_session.query(func.count(User.id)).filter(*audience_filter(audience)).scalar()
+        job.processed = job.total
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        db_session.commit()
+        logger.info(f"Рассылка {job.kind} #{job_id}: уведомление #{job.notification_id} для {job.total} пользователей")
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка рассылки уведомлений #{job_id}: {e}")
+        db_session.query(NotificationJob).filter_by(id=job_id).update(
+            {'status': 'failed', 'error': str(e), 'finished_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db_session.commit()
+    finally:
+        db_session.close()
+
+def job_as_dict(job, reads=0):
+    """Прогресс задачи для API и страниц администратора"""
+    total = job.total or 0
+    processed = job.processed or 0
+    if total:
+        percent = round(processed / total * 100, 1)
+    else:
+        percent = 100.0 if job.status == 'done' else 0.0
+
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'source_id': job.source_id,
+        'status': job.status,
+        'total': total,
+        'processed': processed,
+        'percent': percent,
+        'reads': reads,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def job_progress(db_session, job_id):
+    """Прогресс задачи по id (None, если задачи нет)"""
+    job = db_session.query(NotificationJob).get(job_id)
+    if job is None:
+        return None
+    return job_as_dict(job, read_counts(db_session, [job.notification_id]).get(job.notification_id, 0))
+
+def visible_to(user):
+    """Условие видимости уведомлений: личные и общие для аудитории пользователя"""
+    shared = [Notification.audience == 'shared']
+    for key, column in AUDIENCE_COLUMNS.items():
+        shared.append(or_(column.is_(None), column == getattr(user, key)))
+    return or_(Notification.user_id == user.id, and_(*shared))
+
+def is_recipient(user, notification):
+    """Адресовано ли уведомление пользователю (то же условие, что visible_to)"""
+    if notification.audience != 'shared':
+        return notification.user_id == user.id
+    return all(
+        getattr(notification, column.key) in (None, getattr(user, key))
+        for key, column in AUDIENCE_COLUMNS.items()
+    )
+
+def read_counts(db_session, notification_ids):
+    """Сколько пользователей прочитали общие уведомления: {notification_id: количество}"""
+    notification_ids = [i for i in notification_ids if i]
+    if not notification_ids:
+        return {}
+    return dict(db_session.query(NotificationRead.notification_id, func.count()).filter(
+        NotificationRead.notification_id.in_(notification_ids)
+    ).group_by(NotificationRead.notification_id).all())
+
+def read_shared_ids(db_session, user_id, notifications):
+    """id общих уведомлений из списка, уже прочитанных пользователем"""
+    shared_ids = [n.id for n in notifications if n.audience == 'shared']
+    if not shared_ids:
+        return set()
+    return {notification_id for (notification_id,) in db_session.query(NotificationRead.notification_id).filter(
+        NotificationRead.user_id == user_id, NotificationRead.notification_id.in_(shared_ids)
+    ).all()}
+
+def mark_read(db_session, user, notifications, already_read=frozenset()):
+    """Отметить показанные уведомления прочитанными (личные - флаг, общие - строка в notification_reads)
+
+    Отмечаются только уведомления, адресованные пользователю: админ видит
+    все, но его просмотр не должен попадать в счётчик «Прочитали X из Y».
+    """
+    notifications = [n for n in notifications if is_recipient(user, n)]
+    personal_ids = [n.id for n in notifications if n.audience != 'shared' and not n.is_read]
+    shared_ids = [n.id for n in notifications if n.audience == 'shared' and n.id not in already_read]
+    user_id = user.id
+
+    try:
+        if personal_ids:
+            db_session.query(Notification).filter(Notification.id.in_(personal_ids)).update(
+                {'is_read': True}, synchronize_session=False
+            )
+        if shared_ids:
+            db_session.execute(insert(NotificationRead), [
+                {'notification_id': notification_id, 'user_id': user_id, 'read_at': datetime.utcnow()}
+                for notification_id in shared_ids
+            ])
+        db_session.commit()
+    except IntegrityError:
+        # Та же страница открыта параллельно в другой вкладке
+        db_session.rollback()
+
+def resume_stalled_jobs():
+    """Перезапуск задач, чей процесс завершился до окончания рассылки"""
+    db_session = get_session()
+    try:
+        stale_before = datetime.utcnow() - timedelta(minutes=config.FANOUT_STALE_MINUTES)
+        job_ids = [job_id for (job_id,) in db_session.query(NotificationJob.id).filter(
+            NotificationJob.kind.in_(FANOUT_KINDS),
+            NotificationJob.status.in_(['pending', 'running']),
+            func.coalesce(NotificationJob.heartbeat_at, NotificationJob.created_at) < stale_before
+        ).all()]
+    finally:
+        db_session.close()
+
+    for job_id in job_ids:
+        logger.warning(f"Возобновление рассылки уведомлений #{job_id}")
+        run_job(job_id)
+
+def register_jobs(scheduler):
+    """Проверка зависших рассылок раз в минуту"""
+    scheduler.add_job(resume_stalled_jobs, 'interval', minutes=1,
+                      id='notification_fanout_resume', replace_existing=True)
@@ -1,13 +1,68 @@
 
+"""
+Файловое хранилище загрузок
+
+Файлы копируются из потока запроса кусками по COPY_BUFFER_SIZE: размер
+проверяется по ходу копирования (лимит категории из UPLOAD_MAX_SIZE_MB),
+sha256 считается на лету. Недописанный файл лежит с суффиксом .part и
+переименовывается только после успешной записи.
+
+Большие файлы (видео, архивы) загружаются частями: start_upload создаёт
+сессию в incoming/, append_chunk дописывает кусок с указанного смещения.
+Смещение берётся из размера .part-файла, поэтому после обрыва клиент
+узнаёт его через upload_status и продолжает с того же места. sha256
+части считается по ходу записи и продолжается следующей частью, если
+она пришла в тот же процесс. Иначе (другой воркер, перезапуск) хэш
+после последней части досчитывается в фоне: пока он не готов, сессия
+помечена hashing и finish_upload возвращает ошибку.
+
+Файлы хранятся по хэшу содержимого: blobs/ab/cd/<sha256>, одинаковые
+загрузки (один бланк для всех компаний) занимают место один раз. Число
+ссылок на файл ведётся в stored_blobs в транзакции вместе с записью,
+которая на него ссылается:
+
+    stored, error = file_storage.save_file(file)   # файл пока в incoming/
+    file_storage.acquire_blob(db_session, stored)
+    db_session.commit()
+    file_storage.commit_blob(stored)                # или discard(stored) при ошибке
+
+release_blob снимает ссылку; файл без ссылок дольше BLOB_GC_GRACE_MINUTES
+удаляет collect_garbage (задача планировщика).
+"""
+
 import os
+import re
+import glob
+import json
+import time
 import uuid
+import fcntl
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
 from flask import current_app
 import mimetypes
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+import config
+from database import get_session, StoredBlob
 
 logger = logging.getLogger(__name__)
 
+COPY_BUFFER_SIZE = 1024 * 1024
+INCOMING_DIR = 'incoming'
+BLOBS_DIR = 'blobs'
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+VARIANT_RE = re.compile(r'^w\d+\.webp$')  # превью media_worker: <hash>.w320.webp
+
+# Хэш загрузок частями: {upload_id: (принято байт, sha256)} в памяти процесса
+_digests = {}
+_digests_lock = threading.Lock()
+_hashing = set()    # загрузки, хэш которых досчитывается в этом процессе
+_hash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-hash')
+
 # Допустимые типы файлов
 ALLOWED_EXTENSIONS = {
     'images': {'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg'},
@@ -33,6 +88,35 @@ def allowed_file(filename, file_type='all'):
     
     return False
 
+def max_upload_size(file_type):
+    """Максимальный размер файла категории в байтах"""
+    return config.UPLOAD_MAX_SIZE_MB.get(file_type, config.UPLOAD_FORM_MAX_MB) * 1024 * 1024
+
+def copy_stream(stream, destination, limit, digest=None):
+    """Скопировать поток в открытый файл кусками; возвращает число байт
+
+    Если данных больше limit, копирование прерывается с ValueError.
+    """
+    size = 0
+    while True:
+        chunk = stream.read(COPY_BUFFER_SIZE)
+        if not chunk:
+            return size
+        size += len(chunk)
+        if size > limit:
+            raise ValueError(f"Файл больше допустимого размера ({limit // (1024 * 1024)} МБ)")
+        if digest is not None:
+            digest.update(chunk)
+        destination.write(chunk)
+
+def file_sha256(file_path):
+    """sha256 файла на диске (читается кусками)"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def generate_unique_filename(filename):
     """Генерация уникального имени файла"""
     name, ext = os.path.splitext(secure_filename(filename))
@@ -65,45 +149,64 @@ class FileStorage:
     
     def ensure_directories(self):
         """Создание необходимых директорий"""
-        for file_type in ALLOWED_EXTENSIONS.keys():
+        for file_type in list(ALLOWED_EXTENSIONS.keys()) + [INCOMING_DIR, BLOBS_DIR]:
             dir_path = os.path.join(self.storage_path, file_type)
             os.makedirs(dir_path, exist_ok=True)
+
+    def blob_path(self, content_hash):
+        """Путь файла по хэшу: два уровня каталогов, чтобы не держать всё в одном"""
+        return os.path.join(self.storage_path, BLOBS_DIR, content_hash[:2], content_hash[2:4], content_hash)
+
+    def variant_path(self, content_hash, name):
+        """Производный файл (превью) рядом с оригиналом"""
+        return os.path.join(os.path.dirname(self.blob_path(content_hash)), name)
+
+    def _stored(self, part_path, original_name, file_type, size, content_hash):
+        extension = get_file_info(original_name)['extension']
+        filename = f"{content_hash}.{extension}" if extension else content_hash
+        return {
+            'filename': filename,
+            'original_name': original_name,
+            'file_path': self.blob_path(content_hash),
+            'part_path': part_path,
+            'file_url': self.get_file_url(filename, file_type),
+            'file_type': file_type,
+            'file_info': get_file_info(filename),
+            'size': size,
+            'content_hash': content_hash
+        }
     
     def save_file(self, file, file_type='images'):
-        """Сохранение файла"""
+        """Приём файла во временный файл incoming/ (см. commit_blob)"""
         try:
             if not file or file.filename == '':
                 return None, "Файл не выбран"
             
             if not allowed_file(file.filename, file_type):
                 return None, f"Недопустимый тип файла для категории {file_type}"
+
+            limit = max_upload_size(file_type)
+            if file.content_length and file.content_length > limit:
+                return None, f"Файл больше допустимого размера ({limit // (1024 * 1024)} МБ)"
             
-            filename = generate_unique_filename(file.filename)
-            file_path = os.path.join(self.storage_path, file_type, filename)
-            
-            # Создаем директорию если её нет
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-            file.save(file_path)
-            
-            # Генерируем URL для доступа к файлу
-            file_url = f"/uploads/{file_type}/{filename}"
-            
-            return {
-                'filename': filename,
-                'original_name': file.filename,
-                'file_path': file_path,
-                'file_url': file_url,
-                'file_type': file_type,
-                'file_info': get_file_info(filename)
-            }, None
+            # Поток копируется кусками: файл целиком в память не читается
+            digest = hashlib.sha256()
+            part_path = os.path.join(self.storage_path, INCOMING_DIR, f"{uuid.uuid4().hex}.part")
+            try:
+                with open(part_path, 'wb') as f:
+                    size = copy_stream(file.stream, f, limit, digest)
+            except ValueError as e:
+                os.remove(part_path)
+                return None, str(e)
+
+            return self._stored(part_path, file.filename, file_type, size, digest.hexdigest()), None
             
         except Exception as e:
             logger.error(f"Ошибка сохранения файла: {e}")
             return None, f"Ошибка сохранения файла: {str(e)}"
     
     def delete_file(self, filename, file_type):
-        """Удаление файла"""
+        """Удаление файла со случайным именем (загруженного до хранилища по хэшу)"""
         try:
             file_path = os.path.join(self.storage_path, file_type, filename)
             if os.path.exists(file_path):
@@ -118,5 +221,280 @@ class FileStorage:
         """Получение URL файла"""
         return f"/uploads/{file_type}/{filename}"
 
+    def resolve(self, file_type, filename):
+        """Путь к файлу по адресу /uploads/<file_type>/<filename>: (путь, хэш или None)
+
+        Для превью возвращается хэш оригинала. None, если адрес неверный или файла нет.
+        """
+        if file_type not in ALLOWED_EXTENSIONS or secure_filename(filename) != filename:
+            return None
+
+        name, _, suffix = filename.partition('.')
+        if HASH_RE.match(name):
+            content_hash = name
+            path = self.variant_path(name, filename) if VARIANT_RE.match(suffix) else self.blob_path(name)
+        else:
+            path, content_hash = os.path.join(self.storage_path, file_type, filename), None
+        if not os.path.isfile(path):
+            return None
+        return path, content_hash
+
+    # Хранилище по хэшу содержимого
+
+    def acquire_blob(self, db_session, stored):
+        """+1 ссылка на файл в транзакции вызывающего кода"""
+        content_hash = stored['content_hash']
+        values = {'ref_count': StoredBlob.ref_count + 1, 'released_at': None}
+        if db_session.query(StoredBlob).filter_by(content_hash=content_hash).update(values, synchronize_session=False):
+            return
+        try:
+            with db_session.begin_nested():
+                db_session.add(StoredBlob(content_hash=content_hash, size=stored['size'], ref_count=1))
+        except IntegrityError:
+            # Тот же файл только что загрузили параллельно
+            db_session.query(StoredBlob).filter_by(content_hash=content_hash).update(values, synchronize_session=False)
+
+    def release_blob(self, db_session, content_hash):
+        """-1 ссылка на файл в транзакции вызывающего кода"""
+        if not content_hash:
+            return
+        db_session.query(StoredBlob).filter_by(content_hash=content_hash).update({
+            'ref_count': StoredBlob.ref_count - 1,
+            'released_at': datetime.utcnow()
+        }, synchronize_session=False)
+
+    def commit_blob(self, stored):
+        """Переместить принятый файл в хранилище после коммита ссылки на него"""
+        part_path = stored['part_path']
+        blob_path = stored['file_path']
+        if os.path.exists(blob_path):
+            os.remove(part_path)
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(part_path, blob_path)
+
+    def discard(self, stored):
+        """Удалить принятый файл, если ссылку на него сохранить не удалось"""
+        if os.path.exists(stored['part_path']):
+            os.remove(stored['part_path'])
+
+    def collect_garbage(self, grace_minutes=None):
+        """Удалить файлы без ссылок (дольше grace_minutes)"""
+        grace_minutes = grace_minutes if grace_minutes is not None else config.BLOB_GC_GRACE_MINUTES
+        released_before = datetime.utcnow() - timedelta(minutes=grace_minutes)
+        db_session = get_session()
+        removed = 0
+        try:
+            hashes = [h for (h,) in db_session.query(StoredBlob.content_hash).filter(
+                StoredBlob.ref_count <= 0, StoredBlob.released_at < released_before
+            ).all()]
+            for content_hash in hashes:
+                # Блокировка строки: параллельный acquire_blob дождётся удаления и создаст её заново
+                blob = db_session.query(StoredBlob).filter_by(content_hash=content_hash).with_for_update().first()
+                if blob is None or blob.ref_count > 0:
+                    db_session.commit()
+                    continue
+                path = self.blob_path(content_hash)
+                for leftover in [path] + glob.glob(f"{glob.escape(path)}.*"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                db_session.delete(blob)
+                db_session.commit()
+                removed += 1
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Ошибка очистки хранилища файлов: {e}")
+        finally:
+            db_session.close()
+
+        if removed:
+            logger.info(f"Удалено файлов без ссылок: {removed}")
+        return removed
+
+    # Загрузка частями
+
+    def _upload_paths(self, upload_id):
+        if not upload_id or not upload_id.isalnum():
+            return None, None
+        base = os.path.join(self.storage_path, INCOMING_DIR, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def _save_state(self, meta_path, state):
+        # Состояние читается без блокировки: файл заменяется целиком
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({k: v for k, v in state.items() if k != 'offset'}, f)
+        os.replace(tmp_path, meta_path)
+
+    def _submit_hash(self, upload_id):
+        with _digests_lock:
+            if upload_id in _hashing:
+                return
+            _hashing.add(upload_id)
+        _hash_executor.submit(self._hash_upload, upload_id)
+
+    def _hash_upload(self, upload_id):
+        """Досчитать хэш загрузки, части которой принимали разные процессы"""
+        meta_path, part_path = self._upload_paths(upload_id)
+        try:
+            with open(part_path, 'rb') as f:
+                try:
+                    # Блокировка держится до конца: второй процесс не считает тот же файл
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+                with open(meta_path) as meta:
+                    state = json.load(meta)
+                if not state.get('hashing'):
+                    return
+                state.pop('hashing')
+                state['result'] = self._stored(part_path, state['original_name'], state['file_type'],
+                                               state['size'], file_sha256(part_path))
+                self._save_state(meta_path, state)
+        except FileNotFoundError:
+            # Загрузку удалили, пока хэш считался
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка подсчёта хэша загрузки {upload_id}: {e}")
+        finally:
+            with _digests_lock:
+                _hashing.discard(upload_id)
+
+    def start_upload(self, filename, size, owner=None):
+        """Начать загрузку частями; категория определяется по расширению"""
+        file_type = get_file_info(filename)['type']
+        if not filename or not allowed_file(filename, file_type):
+            return None, "Недопустимый тип файла"
+
+        limit = max_upload_size(file_type)
+        if size <= 0:
+            return None, "Неверный размер файла"
+        if size > limit:
+            return None, f"Файл больше допустимого размера ({limit // (1024 * 1024)} МБ)"
+
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._upload_paths(upload_id)
+        state = {
+            'upload_id': upload_id,
+            'original_name': filename,
+            'file_type': file_type,
+            'size': size,
+            'owner': owner,
+            'created_at': time.time()
+        }
+        open(part_path, 'wb').close()
+        self._save_state(meta_path, state)
+        with _digests_lock:
+            _digests[upload_id] = (0, hashlib.sha256())
+        return dict(state, offset=0), None
+
+    def upload_status(self, upload_id, owner=None):
+        """Состояние загрузки (offset - сколько байт уже принято) или None"""
+        meta_path, part_path = self._upload_paths(upload_id)
+        if meta_path is None or not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            state = json.load(f)
+        if state.get('owner') != owner:
+            return None
+        if state.get('result'):
+            state['offset'] = state['size']
+        else:
+            state['offset'] = os.path.getsize(part_path)
+        if state.get('hashing'):
+            # Процесс, считавший хэш, мог завершиться
+            self._submit_hash(upload_id)
+        return state
+
+    def append_chunk(self, upload_id, offset, stream, owner=None):
+        """Дописать часть с позиции offset; после последней части файл сохраняется
+
+        offset должен совпадать с уже принятым размером, иначе вернётся
+        ошибка и клиент продолжит с offset из upload_status.
+        """
+        state = self.upload_status(upload_id, owner)
+        if state is None:
+            return None, "Загрузка не найдена"
+        if state.get('result') or state.get('hashing'):
+            return state, None
+
+        meta_path, part_path = self._upload_paths(upload_id)
+        with open(part_path, 'r+b') as f:
+            # Параллельные запросы одной загрузки выполняются по очереди
+            fcntl.flock(f, fcntl.LOCK_EX)
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                return dict(state, offset=current), f"Ожидается часть с позиции {current}"
+            with _digests_lock:
+                received, digest = _digests.pop(upload_id, (None, None))
+            if received != offset:
+                digest = None
+            f.seek(offset)
+            try:
+                written = copy_stream(stream, f, state['size'] - offset, digest)
+            except ValueError:
+                f.truncate(offset)
+                return dict(state, offset=offset), "Данных больше заявленного размера файла"
+            f.flush()
+            os.fsync(f.fileno())
+            state['offset'] = offset + written
+
+            if state['offset'] < state['size']:
+                if digest is not None:
+                    with _digests_lock:
+                        _digests[upload_id] = (state['offset'], digest)
+                return state, None
+
+            if digest is not None:
+                state['result'] = self._stored(part_path, state['original_name'], state['file_type'],
+                                               state['size'], digest.hexdigest())
+            else:
+                # Начало файла принимал другой процесс: весь файл читается в фоне, не в запросе
+                state['hashing'] = True
+            self._save_state(meta_path, state)
+        if state.get('hashing'):
+            self._submit_hash(upload_id)
+        return state, None
+
+    def finish_upload(self, upload_id, owner=None):
+        """Принятый файл завершённой загрузки (сессия удаляется, см. commit_blob)"""
+        state = self.upload_status(upload_id, owner)
+        if state is None:
+            return None, "Загрузка не найдена"
+        if state.get('hashing'):
+            return None, "Файл ещё обрабатывается, повторите отправку через минуту"
+        if not state.get('result'):
+            return None, f"Загрузка не завершена: принято {state['offset']} из {state['size']} байт"
+
+        meta_path, _ = self._upload_paths(upload_id)
+        os.remove(meta_path)
+        return state['result'], None
+
+    def cleanup_uploads(self, max_age_hours=None):
+        """Удалить брошенные загрузки старше max_age_hours"""
+        max_age_hours = max_age_hours or config.UPLOAD_SESSION_HOURS
+        expire_before = time.time() - max_age_hours * 3600
+        incoming = os.path.join(self.storage_path, INCOMING_DIR)
+        removed = 0
+        for name in os.listdir(incoming):
+            path = os.path.join(incoming, name)
+            try:
+                if os.path.getmtime(path) < expire_before:
+                    os.remove(path)
+                    removed += name.endswith('.json')
+            except FileNotFoundError:
+                # Файл удалил параллельный finish_upload или discard
+                continue
+        if removed:
+            logger.info(f"Удалено брошенных загрузок: {removed}")
+        return removed
+
 # Глобальный экземпляр
-file_storage = FileStorage()
+file_storage = FileStorage(config.UPLOAD_FOLDER)
+
+def register_jobs(scheduler):
+    """Ежечасная очистка брошенных загрузок и файлов без ссылок"""
+    scheduler.add_job(file_storage.cleanup_uploads, 'interval', hours=1,
+                      id='upload_cleanup', replace_existing=True)
+    scheduler.add_job(file_storage.collect_garbage, 'interval', hours=1,
+                      id='blob_garbage_collection', replace_existing=True)
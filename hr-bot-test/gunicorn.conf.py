@@ -0,0 +1,53 @@
+"""
+Конфигурация gunicorn для веб-приложения SapaHR
+
+Мастер-процесс только выполняет миграции и управляет воркерами; каждый
+воркер загружает приложение сам, поэтому kill -HUP <pid мастера> плавно
+перезапускает воркеры уже с новым кодом. Фоновые задачи выполняет один из
+воркеров (см. scheduler.run_when_leader).
+"""
+
+import logging
+# Не «config»: gunicorn считает переменные модуля своими настройками, а config - одна из них
+import config as app_config
+
+bind = f"{app_config.SERVER_HOST}:{app_config.SERVER_PORT}"
+workers = app_config.WEB_WORKERS
+threads = app_config.WEB_THREADS
+worker_class = 'gthread'
+
+timeout = app_config.WEB_TIMEOUT
+graceful_timeout = app_config.WEB_GRACEFUL_TIMEOUT
+keepalive = app_config.WEB_KEEPALIVE
+max_requests = app_config.WEB_MAX_REQUESTS
+max_requests_jitter = app_config.WEB_MAX_REQUESTS // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = 'debug' if app_config.DEBUG_MODE else 'info'
+
+logger = logging.getLogger(__name__)
+
+def on_starting(server):
+    """Инициализация БД и миграции — один раз, до запуска воркеров"""
+    from main import prepare_database
+    if not prepare_database():
+        raise SystemExit(1)
+
+def post_fork(server, worker):
+    """Воркер не должен использовать соединения, открытые в мастере"""
+    from database import engine
+    engine.dispose(close=False)
+
+def post_worker_init(worker):
+    """Фоновые задачи - в воркере, получившем блокировку лидера"""
+    from scheduler import run_when_leader
+    run_when_leader()
+
+def worker_exit(server, worker):
+    """Несохранённые просмотры записываются до остановки воркера"""
+    from scheduler import stop_leader
+    stop_leader()
+
+    from view_counter import flush
+    flush()
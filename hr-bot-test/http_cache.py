@@ -0,0 +1,184 @@
+"""
+HTTP-кэширование и сжатие ответов
+
+- Статика: url_for('static', ...) добавляет к адресу отпечаток содержимого
+  (?v=<хэш>), такие ответы отдаются с Cache-Control immutable на год.
+  Сжатые версии файлов готовятся один раз на процесс.
+- Страницы: conditional() строит ETag из версии данных (updated_at,
+  количества строк, хэша закэшированного фрагмента) и пользователя и
+  отвечает 304 без отрисовки шаблона.
+- HTML, JSON, CSS и JS сжимаются gzip или brotli (если установлен пакет
+  brotli и браузер его принимает).
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from flask import current_app, make_response, request, session
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+    'application/json', 'image/svg+xml',
+}
+MIN_COMPRESS_SIZE = 1024
+MAX_COMPRESS_SIZE = 5 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+_lock = threading.Lock()
+_fingerprints = {}      # файл статики -> (mtime_ns, отпечаток)
+_static_encoded = {}    # (файл, mtime_ns, кодировка) -> сжатое содержимое
+
+def _tree_signature(*folders):
+    digest = hashlib.sha1()
+    for folder in folders:
+        for root, _, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f'{os.path.relpath(os.path.join(root, name), folder)}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    return digest.hexdigest()[:12]
+
+def static_fingerprint(filename):
+    """Отпечаток содержимого файла статики (None, если файла нет)"""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _fingerprints.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'rb') as f:
+        fingerprint = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _lock:
+        _fingerprints[filename] = (mtime, fingerprint)
+    return fingerprint
+
+def _encode(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def _client_encoding():
+    if brotli is not None and 'br' in request.accept_encodings:
+        return 'br'
+    if 'gzip' in request.accept_encodings:
+        return 'gzip'
+    return None
+
+def _static_encoded_body(filename, encoding):
+    path = os.path.join(current_app.static_folder, filename)
+    mtime = os.stat(path).st_mtime_ns
+    key = (filename, mtime, encoding)
+    body = _static_encoded.get(key)
+    if body is None:
+        with open(path, 'rb') as f:
+            body = _encode(f.read(), encoding)
+        with _lock:
+            _static_encoded[key] = body
+    return body
+
+def precompress_static(app):
+    """Сжать текстовые файлы статики заранее"""
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    count = 0
+    with app.app_context():
+        for root, _, files in os.walk(app.static_folder):
+            for name in files:
+                filename = os.path.relpath(os.path.join(root, name), app.static_folder).replace(os.sep, '/')
+                if name.endswith(('.css', '.js', '.svg', '.txt')):
+                    for encoding in encodings:
+                        _static_encoded_body(filename, encoding)
+                    count += 1
+    logger.info(f"Статика сжата заранее: {count} файлов")
+
+def page_etag(version):
+    """ETag страницы: версия данных + сборка + пользователь (шапка и меню зависят от сессии)
+
+    None, если в сессии ждут показа flash-сообщения: страницу нужно отрисовать.
+    """
+    if session.get('_flashes'):
+        return None
+    parts = (current_app.config['BUILD_ID'], session.get('user_id'), session.get('role'),
+             session.get('original_role'), session.get('username'), version)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def conditional(version, render):
+    """Ответ 304, если у клиента актуальная версия страницы, иначе render()"""
+    etag = page_etag(version)
+    if etag and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+        if response.status_code != 200:
+            return response
+
+    if etag:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _compress(response):
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _client_encoding()
+    if encoding is None:
+        return response
+
+    if request.endpoint == 'static':
+        body = _static_encoded_body(request.view_args['filename'], encoding)
+        response.direct_passthrough = False
+    else:
+        if response.direct_passthrough or response.is_streamed:
+            return response
+        data = response.get_data()
+        if not MIN_COMPRESS_SIZE <= len(data) <= MAX_COMPRESS_SIZE:
+            return response
+        body = _encode(data, encoding)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # Сжатое представление байт в байт отличается от исходного
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_app(app):
+    """Отпечатки статики, заголовки кэширования и сжатие ответов"""
+    # Меняется при выкладке новых шаблонов или статики
+    app.config['BUILD_ID'] = _tree_signature(os.path.join(app.root_path, app.template_folder), app.static_folder)
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            fingerprint = static_fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    @app.after_request
+    def http_cache_headers(response):
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            fingerprint = static_fingerprint(request.view_args['filename'])
+            if fingerprint and request.args.get('v') == fingerprint:
+                response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+        return _compress(response)
+
+    precompress_static(app)
@@ -1,9 +1,7 @@
 import os
 import sys
 import logging
-import signal # Keep signal import as it might be used by Flask or other libraries
-import time # Keep time import as it might be used by Flask or other libraries
-from datetime import datetime, timezone # Keep datetime import as it might be used by Flask or other libraries
+import signal
 
 # Добавляем путь к модулям
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -18,62 +16,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def start_web_app(): # This function is no longer directly called by main, but might be imported elsewhere. Keeping it for now.
-    """Запуск веб-приложения"""
-    logger.info("🌐 Starting web application...")
+def prepare_database():
+    """Проверка соединения и инициализация БД (один раз перед запуском воркеров)"""
+    from database import init_db, test_database_connection, engine
 
-    try:
-        # Инициализация базы данных
-        from database import init_db, test_database_connection, get_session, Admin
-        import config
-        logger.info("Initializing database...")
-
-        if test_database_connection():
-            logger.info("Database connection successful")
-            init_db()
-            logger.info("Database initialized")
-
-            # Создание главного администратора
-            try:
-                session = get_session()
-                main_admin_telegram_id = config.HOST_ADMIN_TELEGRAM_ID
-
-                if not session.query(Admin).filter(Admin.telegram_id == main_admin_telegram_id).first():
-                    from datetime import datetime, timezone
-                    new_admin = Admin(
-                        telegram_id=main_admin_telegram_id,
-                        login=config.HOST_ADMIN_LOGIN,
-                        password=config.HOST_ADMIN_PASSWORD,
-                        level=3,
-                        created_at=datetime.now(timezone.utc),
-                        updated_at=datetime.now(timezone.utc),
-                    )
-                    session.add(new_admin)
-                    session.commit()
-                    logger.info(f"✅ Главный администратор создан (Telegram ID: {main_admin_telegram_id})")
-                else:
-                    logger.info(f"ℹ️ Главный администратор уже существует (Telegram ID: {main_admin_telegram_id})")
-
-                session.close()
-            except Exception as e:
-                logger.error(f"Ошибка при создании администратора: {e}")
-        else:
-            logger.error("Database connection failed")
-            return
-
-        # Импортируем Flask приложение
-        from app import app
-
-        # Запускаем приложение
-        logger.info("Starting Flask application on 0.0.0.0:5055")
-        app.run(
-            host='0.0.0.0',
-            port=5055,
-            debug=False
-        )
+    logger.info("Initializing database...")
 
-    except Exception as e:
-        logger.error(f"Web app startup failed: {e}")
+    if not test_database_connection():
+        logger.error("Database connection failed")
+        return False
+
+    logger.info("Database connection successful")
+    init_db()
+    logger.info("Database initialized")
+
+    # Соединения мастер-процесса не должны переходить в воркеры
+    engine.dispose()
+    return True
+
+def start_web_app():
+    """Запуск веб-приложения через gunicorn (настройки в gunicorn.conf.py)"""
+    from gunicorn.app.wsgiapp import run
+
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    sys.argv = [sys.argv[0], '--config', config_path, 'wsgi:app']
+    run()
 
 def start_bot(): # This function is removed in the new main logic.
     """Запуск Telegram бота"""
@@ -97,31 +64,11 @@ def main():
     logger.info("=" * 50)
 
     try:
-        # Инициализация базы данных
-        from database import init_db, test_database_connection
-
-        logger.info("Initializing database...")
-
-        if test_database_connection():
-            logger.info("Database connection successful")
-            init_db()
-            logger.info("Database initialized")
-        else:
-            logger.error("Database connection failed")
-            return
-
-        # Импортируем Flask приложение ПОСЛЕ миграций
-        from app import app
-
-        # Запускаем приложение
-        logger.info("Starting Flask application on 0.0.0.0:5055")
-        logger.info("✅ Web app: http://0.0.0.0:5055")
-
-        app.run(
-            host='0.0.0.0',
-            port=5055,
-            debug=False
-        )
+        # Миграции выполняет мастер-процесс gunicorn, фоновые задачи - один из воркеров (см. gunicorn.conf.py)
+        import config
+        logger.info(f"✅ Web app: http://{config.SERVER_HOST}:{config.SERVER_PORT} "
+                    f"({config.WEB_WORKERS} workers x {config.WEB_THREADS} threads)")
+        start_web_app()
 
     except Exception as e:
         logger.error(f"Application startup failed: {e}")
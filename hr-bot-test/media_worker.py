@@ -0,0 +1,156 @@
+"""
+Превью загруженных изображений и документов
+
+Для файлов хранилища по хэшу (см. file_storage.py) рядом с оригиналом
+готовятся уменьшенные копии в WebP: <hash>.w<ширина>.webp для каждой
+ширины из MEDIA_VARIANT_WIDTHS. Изображения уменьшает Pillow, у PDF
+отрисовывается первая страница (pdftoppm из poppler-utils; без него превью
+документов не делаются).
+
+Превью готовятся в фоновых потоках (MEDIA_WORKERS), а не в запросе:
+после загрузки файла и при первом обращении media_url к ещё не готовому
+размеру. Пока превью нет, media_url отдаёт оригинал изображения (или
+None, если запрошен только предпросмотр).
+"""
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+from file_storage import file_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+DOCUMENT_EXTENSIONS = {'pdf'}
+WEBP_QUALITY = 80
+
+UPLOAD_URL_RE = re.compile(r'^/uploads/\w+/([0-9a-f]{64})\.(\w+)$')
+
+_executor = ThreadPoolExecutor(max_workers=config.MEDIA_WORKERS, thread_name_prefix='media')
+_lock = threading.Lock()
+_queued = set()    # хэши, для которых превью уже готовятся
+_failed = set()    # файлы, которые не удалось обработать (не повторяем до перезапуска)
+
+def variant_name(content_hash, width):
+    return f"{content_hash}.w{width}.webp"
+
+def variant_width(width):
+    """Наименьшая из подготовленных ширин, не меньше запрошенной"""
+    widths = sorted(config.MEDIA_VARIANT_WIDTHS)
+    return next((w for w in widths if w >= width), widths[-1])
+
+def can_preview(extension):
+    if Image is None:
+        return False
+    if extension in DOCUMENT_EXTENSIONS:
+        return shutil.which('pdftoppm') is not None
+    return extension in IMAGE_EXTENSIONS
+
+def _source_image(content_hash, extension):
+    """Изображение для уменьшения: сам файл или первая страница PDF"""
+    path = file_storage.blob_path(content_hash)
+    if extension not in DOCUMENT_EXTENSIONS:
+        image = Image.open(path)
+        # JPEG декодируется сразу в уменьшенном масштабе
+        image.draft('RGB', (max(config.MEDIA_VARIANT_WIDTHS),) * 2)
+        return ImageOps.exif_transpose(image)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, 'page')
+        subprocess.run(
+            ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-png',
+             '-scale-to', str(max(config.MEDIA_VARIANT_WIDTHS)), path, prefix],
+            check=True, capture_output=True, timeout=config.MEDIA_PDF_TIMEOUT_SECONDS
+        )
+        with Image.open(f"{prefix}.png") as page:
+            page.load()
+            return page.copy()
+
+def generate_variants(content_hash, extension):
+    """Подготовить недостающие превью файла; возвращает число созданных"""
+    missing = [w for w in config.MEDIA_VARIANT_WIDTHS
+               if not os.path.exists(file_storage.variant_path(content_hash, variant_name(content_hash, w)))]
+    if not missing or not os.path.exists(file_storage.blob_path(content_hash)):
+        return 0
+
+    image = _source_image(content_hash, extension)
+    created = 0
+    try:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        for width in sorted(missing, reverse=True):
+            path = file_storage.variant_path(content_hash, variant_name(content_hash, width))
+            # Тот же файл мог обработать другой процесс (очередь у каждого своя)
+            if os.path.exists(path):
+                continue
+            variant = image.copy()
+            variant.thumbnail((width, width * 4), Image.LANCZOS)
+            # Своё временное имя у каждого процесса; префикс <hash>. - остатки удалит collect_garbage
+            fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp', dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    variant.save(f, 'WEBP', quality=WEBP_QUALITY, method=4)
+                os.replace(tmp_path, path)
+                created += 1
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+    finally:
+        image.close()
+    return created
+
+def _run(content_hash, extension):
+    try:
+        created = generate_variants(content_hash, extension)
+        if created:
+            logger.info(f"Превью {content_hash[:12]}.{extension}: {created} шт.")
+    except Exception as e:
+        logger.error(f"Ошибка подготовки превью {content_hash[:12]}.{extension}: {e}")
+        with _lock:
+            _failed.add(content_hash)
+    finally:
+        with _lock:
+            _queued.discard(content_hash)
+
+def submit(content_hash, extension):
+    """Поставить файл в очередь на подготовку превью (повторы отбрасываются)"""
+    extension = (extension or '').lower()
+    if not can_preview(extension):
+        return False
+    with _lock:
+        if content_hash in _queued or content_hash in _failed:
+            return False
+        _queued.add(content_hash)
+    _executor.submit(_run, content_hash, extension)
+    return True
+
+def media_url(url, width, fallback=True):
+    """Адрес превью подходящей ширины для ссылки на файл /uploads/...
+
+    Если превью ещё нет, оно ставится в очередь, а возвращается исходный
+    адрес (fallback=True, для изображений) или None.
+    """
+    match = UPLOAD_URL_RE.match(url or '')
+    if match is None:
+        return url if fallback else None
+
+    content_hash, extension = match.group(1), match.group(2).lower()
+    width = variant_width(width)
+    name = variant_name(content_hash, width)
+    if os.path.exists(file_storage.variant_path(content_hash, name)):
+        return file_storage.get_file_url(name, 'images')
+
+    submit(content_hash, extension)
+    return url if fallback else None
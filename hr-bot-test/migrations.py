@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Версионированные миграции схемы БД
+
+Применённые версии хранятся в таблице schema_version. На старте выполняется
+одна проверка версии; если есть новые миграции, они применяются под
+pg_advisory_lock, чтобы параллельно стартующие процессы не выполняли DDL
+одновременно (в том числе создание самой schema_version). Каждая миграция
+выполняется в своей транзакции вместе с записью о версии. Нетранзакционные
+миграции (CREATE INDEX CONCURRENTLY) должны быть идемпотентными: при сбое
+до записи версии они повторяются.
+
+Миграции не зависят от моделей database.py: таблицы и индексы каждой
+версии зафиксированы в schema_history.py, поэтому новая БД и БД, обновляемая
+со старой версии, проходят одни и те же шаги. Новая миграция добавляется
+в конец списка MIGRATIONS со следующим номером.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Callable
+from sqlalchemy import exc, func, inspect, insert, select, text
+from database import engine
+import schema_history as schema
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock для миграций
+MIGRATIONS_LOCK_ID = 724168100
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable
+    transactional: bool = True
+
+def _baseline(conn):
+    """Базовые таблицы (индексы - миграция 3); существующие таблицы не трогаются"""
+    schema.metadata.create_all(conn, tables=schema.BASELINE_TABLES)
+
+# Колонки, которых может не быть в БД, созданных старыми версиями приложения
+LEGACY_COLUMNS = {
+    'users': {
+        'telegram_id': "VARCHAR UNIQUE",
+        'username': "VARCHAR",
+        'email': "VARCHAR UNIQUE",
+        'password': "VARCHAR",
+        'first_name': "VARCHAR",
+        'last_name': "VARCHAR",
+        'phone': "VARCHAR",
+        'company': "VARCHAR",
+        'position': "VARCHAR",
+        'department': "VARCHAR",
+        'avatar': "VARCHAR",
+        'role': "VARCHAR DEFAULT 'employee'",
+        'role_level': "INTEGER DEFAULT 1",
+        'points': "INTEGER DEFAULT 0",
+        'level': "INTEGER DEFAULT 1",
+        'is_active': "BOOLEAN DEFAULT TRUE",
+        'onboarding_completed': "BOOLEAN DEFAULT FALSE",
+        'onboarding_progress': "INTEGER DEFAULT 0",
+        'work_status': "VARCHAR DEFAULT 'active'",
+        'hire_date': "TIMESTAMP",
+        'termination_date': "TIMESTAMP",
+        'termination_reason': "VARCHAR(255)",
+        'created_at': "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    },
+    'news': {
+        'image_url': "VARCHAR(500)",
+        'category': "VARCHAR(100)",
+        'author': "VARCHAR(255)",
+        'views': "INTEGER DEFAULT 0",
+    },
+    'notifications': {
+        'user_id': "INTEGER REFERENCES users(id)",
+        'title': "VARCHAR",
+        'message': "TEXT",
+        'is_read': "BOOLEAN DEFAULT FALSE",
+        'created_at': "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    },
+    'admins': {
+        'telegram_id': "VARCHAR UNIQUE",
+        'email': "VARCHAR UNIQUE",
+        'login': "VARCHAR UNIQUE",
+        'password': "VARCHAR",
+        'level': "INTEGER DEFAULT 1",
+        'created_at': "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+        'updated_at': "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    },
+    'polls': {
+        'title': "VARCHAR",
+        'description': "TEXT",
+        'is_active': "BOOLEAN DEFAULT TRUE",
+        'total_responses': "INTEGER DEFAULT 0",
+        'created_at': "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    },
+    'onboarding': {
+        'progress': "INTEGER DEFAULT 0",
+    },
+    'request_files': {
+        'file_path': "VARCHAR(500)",
+        'file_url': "VARCHAR(500)",
+        'file_type': "VARCHAR(50)",
+        'uploaded_by': "INTEGER REFERENCES users(id)",
+        'original_name': "VARCHAR(500)",
+    },
+}
+
+# Колонки опросов, перенесённые в poll_questions
+OBSOLETE_COLUMNS = {'polls': ['question', 'options', 'votes', 'total_votes']}
+
+NULLABLE_COLUMNS = [
+    ('users', 'telegram_id'),
+    ('admins', 'email'),
+    ('admins', 'login'),
+    ('admins', 'password'),
+    ('request_files', 'file_path'),
+]
+
+def _legacy_columns(conn):
+    """Приведение старых БД к моделям (бывшие check_and_add_columns, migrate_db.py, upgrade_db.py)"""
+    inspector = inspect(conn)
+
+    for table, columns in LEGACY_COLUMNS.items():
+        existing = {col['name'] for col in inspector.get_columns(table)}
+        for column, ddl in columns.items():
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                logger.info(f"✅ Добавлена колонка {table}.{column}")
+
+    for table, columns in OBSOLETE_COLUMNS.items():
+        existing = {col['name'] for col in inspector.get_columns(table)}
+        for column in columns:
+            if column in existing:
+                conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+                logger.info(f"✅ Удалена устаревшая колонка {table}.{column}")
+
+    # SQLite не поддерживает ALTER COLUMN; таблицы из моделей там и так nullable
+    if conn.dialect.name == 'postgresql':
+        for table, column in NULLABLE_COLUMNS:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL"))
+
+    conn.execute(text("UPDATE users SET role = 'employee' WHERE role = 'user'"))
+
+def _create_indexes(bind, indexes):
+    """Индексы из списка (имя, таблица, колонки), которых ещё нет в БД
+
+    В PostgreSQL индексы строятся через CREATE INDEX CONCURRENTLY IF NOT EXISTS
+    в режиме autocommit, без блокировки записи в таблицы. Невалидные индексы,
+    оставшиеся от прерванной сборки, пересоздаются.
+    """
+    quote = bind.dialect.identifier_preparer.quote
+
+    def ddl(name, table, columns, concurrently=''):
+        return text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({', '.join(map(quote, columns))})")
+
+    if bind.dialect.name != 'postgresql':
+        with bind.begin() as conn:
+            for index in indexes:
+                conn.execute(ddl(*index))
+        return
+
+    with bind.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        invalid = set(conn.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE NOT i.indisvalid"
+        )).scalars())
+
+        for name, table, columns in indexes:
+            if name in invalid:
+                logger.warning(f"Пересоздание невалидного индекса {name}")
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+            conn.execute(ddl(name, table, columns, 'CONCURRENTLY '))
+
+def _model_indexes(bind):
+    """Индексы горячих фильтров и сортировок базовых таблиц"""
+    _create_indexes(bind, schema.MODEL_INDEXES)
+
+def _poll_votes(conn):
+    """Таблица poll_votes и перенос голосов из JSON-поля poll_questions.votes"""
+    schema.metadata.create_all(conn, tables=[schema.poll_votes])
+
+    poll_questions = schema.poll_questions
+    questions = conn.execute(select(poll_questions.c.id, poll_questions.c.poll_id, poll_questions.c.votes)).all()
+    rows = []
+    for question_id, poll_id, votes in questions:
+        try:
+            counts = json.loads(votes) if votes else {}
+        except ValueError:
+            logger.warning(f"Пропущены голоса вопроса {question_id}: неверный JSON")
+            continue
+        for option, count in counts.items():
+            rows.extend({'poll_id': poll_id, 'question_id': question_id, 'option': option, 'user_id': None}
+                        for _ in range(int(count or 0)))
+
+    if rows:
+        conn.execute(insert(schema.poll_votes), rows)
+    logger.info(f"✅ Перенесено голосов из JSON: {len(rows)}")
+
+def _notification_jobs(conn):
+    """Таблица задач массовой рассылки уведомлений"""
+    schema.metadata.create_all(conn, tables=[schema.notification_jobs])
+
+def _add_missing_columns(conn, table, columns):
+    existing = {col['name'] for col in inspect(conn).get_columns(table)}
+    for column, ddl in columns.items():
+        if column not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _shared_notifications(conn):
+    """Общие уведомления для аудитории и отметки о прочтении"""
+    _add_missing_columns(conn, 'notifications', {
+        'audience': "VARCHAR DEFAULT 'user'",
+        'audience_company': "VARCHAR",
+        'audience_department': "VARCHAR",
+        'audience_role': "VARCHAR",
+    })
+    conn.execute(text("UPDATE notifications SET audience = 'user' WHERE audience IS NULL"))
+    _add_missing_columns(conn, 'notification_jobs', {
+        'notification_id': "INTEGER REFERENCES notifications(id) ON DELETE SET NULL",
+    })
+    # Уведомления больше не копируются пачками по пользователям
+    if 'last_user_id' in {col['name'] for col in inspect(conn).get_columns('notification_jobs')}:
+        conn.execute(text("ALTER TABLE notification_jobs DROP COLUMN last_user_id"))
+    schema.metadata.create_all(conn, tables=[schema.notification_reads])
+
+def _shared_notifications_indexes(bind):
+    """Индекс общих уведомлений по аудитории"""
+    _create_indexes(bind, schema.SHARED_NOTIFICATIONS_INDEXES)
+
+def _search_vectors(conn):
+    """Генерируемые tsvector-колонки для полнотекстового поиска (PostgreSQL 12+)"""
+    if conn.dialect.name != 'postgresql':
+        return
+
+    from search import SEARCH_FIELDS, search_vector_sql
+    for table in SEARCH_FIELDS:
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_tsv tsvector "
+            f"GENERATED ALWAYS AS ({search_vector_sql(table)}) STORED"
+        ))
+
+    # Триграммы для поиска сотрудников; без прав на расширение поиск работает через LIKE
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except exc.DBAPIError as e:
+        logger.warning(f"Расширение pg_trgm недоступно: {e}")
+
+def _search_indexes(bind):
+    """GIN-индексы поиска (CONCURRENTLY, вне транзакции)"""
+    if bind.dialect.name != 'postgresql':
+        return
+
+    from search import SEARCH_FIELDS, USER_NAME_SQL
+    with bind.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in SEARCH_FIELDS:
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_search_tsv ON {table} USING gin (search_tsv)"))
+
+        has_trgm = conn.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")).scalar()
+        if has_trgm:
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_name_trgm ON users USING gin (({USER_NAME_SQL}) gin_trgm_ops)"
+            ))
+
+def _users_updated_at(conn):
+    """Время изменения сотрудника для синхронизации индекса в памяти"""
+    _add_missing_columns(conn, 'users', {'updated_at': "TIMESTAMP"})
+    conn.execute(text("UPDATE users SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL"))
+
+def _users_updated_at_index(bind):
+    _create_indexes(bind, schema.USERS_UPDATED_AT_INDEXES)
+
+def _broadcast_deliveries(conn):
+    """Состояние доставки рассылок в Telegram по получателям"""
+    schema.metadata.create_all(conn, tables=[schema.broadcast_deliveries])
+
+def _stored_blobs(conn):
+    """Хранилище файлов по хэшу содержимого со счётчиком ссылок"""
+    schema.metadata.create_all(conn, tables=[schema.stored_blobs])
+    _add_missing_columns(conn, 'request_files', {'content_hash': "VARCHAR(64)"})
+
+def _request_files_content_hash_index(bind):
+    _create_indexes(bind, schema.REQUEST_FILES_CONTENT_HASH_INDEXES)
+
+def _vacations_updated_at(conn):
+    """Время изменения отпуска: смена статуса пересчитывает агрегаты аналитики"""
+    _add_missing_columns(conn, 'vacations', {'updated_at': "TIMESTAMP"})
+
+MIGRATIONS = [
+    Migration(1, 'baseline', _baseline),
+    Migration(2, 'legacy_columns', _legacy_columns),
+    Migration(3, 'model_indexes', _model_indexes, transactional=False),
+    Migration(4, 'poll_votes', _poll_votes),
+    Migration(5, 'notification_jobs', _notification_jobs),
+    Migration(6, 'shared_notifications', _shared_notifications),
+    Migration(7, 'shared_notifications_indexes', _shared_notifications_indexes, transactional=False),
+    Migration(8, 'search_vectors', _search_vectors),
+    Migration(9, 'search_indexes', _search_indexes, transactional=False),
+    Migration(10, 'users_updated_at', _users_updated_at),
+    Migration(11, 'users_updated_at_index', _users_updated_at_index, transactional=False),
+    Migration(12, 'broadcast_deliveries', _broadcast_deliveries),
+    Migration(13, 'stored_blobs', _stored_blobs),
+    Migration(14, 'request_files_content_hash_index', _request_files_content_hash_index, transactional=False),
+    Migration(15, 'vacations_updated_at', _vacations_updated_at),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+def current_version(conn):
+    """Последняя применённая версия схемы (0 для пустой БД); без DDL"""
+    version = 0
+    if inspect(conn).has_table(schema.schema_version.name):
+        version = conn.execute(select(func.max(schema.schema_version.c.version))).scalar() or 0
+    conn.commit()
+    return version
+
+def _apply(conn, migration):
+    logger.info(f"Применение миграции {migration.version}: {migration.name}")
+
+    if migration.transactional:
+        with conn.begin():
+            migration.apply(conn)
+            conn.execute(insert(schema.schema_version).values(version=migration.version, name=migration.name))
+        return
+
+    migration.apply(engine)
+    with conn.begin():
+        conn.execute(insert(schema.schema_version).values(version=migration.version, name=migration.name))
+
+def run_migrations():
+    """Применить недостающие миграции; возвращает текущую версию схемы"""
+    with engine.connect() as conn:
+        version = current_version(conn)
+        if version >= LATEST_VERSION:
+            logger.info(f"Схема БД актуальна (версия {version})")
+            return version
+
+        use_lock = conn.dialect.name == 'postgresql'
+        if use_lock:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATIONS_LOCK_ID})
+            conn.commit()
+
+        try:
+            # Таблица версий создаётся под блокировкой; пока ждали, миграции мог применить другой процесс
+            with conn.begin():
+                schema.schema_version.create(conn, checkfirst=True)
+            version = current_version(conn)
+            for migration in MIGRATIONS:
+                if migration.version > version:
+                    _apply(conn, migration)
+                    version = migration.version
+        finally:
+            if use_lock:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATIONS_LOCK_ID})
+                conn.commit()
+
+    logger.info(f"✅ Схема БД обновлена до версии {version}")
+    return version
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_migrations()
@@ -0,0 +1,177 @@
+"""
+Кэш отрисованных страниц, которые меняются только при правках администратора
+
+Кэшируются блоки title и content шаблона (шапка base.html с именем
+пользователя и flash-сообщениями отрисовывается на каждый запрос). Ключ:
+раздел, эндпоинт, параметры пути и запроса, роль пользователя.
+Размер ограничен PAGE_CACHE_MAX_ENTRIES (LRU), запись живёт PAGE_CACHE_TTL_SECONDS.
+
+Правки администратора вызывают invalidate(раздел): локальные записи
+удаляются сразу, а версия раздела в system_state сообщает об изменении
+другим процессам (проверка не чаще PAGE_CACHE_VERSION_CHECK_SECONDS).
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app, render_template, request, session
+from markupsafe import Markup
+import config
+from http_cache import conditional
+from database import get_session, SystemState
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY_PREFIX = 'page_cache:'
+
+class PageCache:
+    """LRU-кэш с TTL и счётчиками попаданий"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # ключ -> (срок годности, значение)
+        self._generations = {}         # раздел -> число сбросов
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def set(self, key, value, generation=None):
+        """Сохранить значение; если раздел сбросили во время отрисовки, оно устарело"""
+        with self._lock:
+            if generation is not None and generation != self.generation(key[0]):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def drop(self, namespace):
+        """Удалить записи раздела (первый элемент ключа)"""
+        with self._lock:
+            self._generations[namespace] = self.generation(namespace) + 1
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+_cache = PageCache(config.PAGE_CACHE_MAX_ENTRIES, config.PAGE_CACHE_TTL_SECONDS)
+_versions = {}
+_versions_lock = threading.Lock()
+_versions_checked_at = 0.0
+
+def _sync_versions():
+    """Сбросить разделы, которые другой процесс пометил изменёнными"""
+    global _versions_checked_at
+    now = time.monotonic()
+    if now - _versions_checked_at < config.PAGE_CACHE_VERSION_CHECK_SECONDS:
+        return
+    with _versions_lock:
+        if now - _versions_checked_at < config.PAGE_CACHE_VERSION_CHECK_SECONDS:
+            return
+        db_session = get_session()
+        try:
+            rows = db_session.query(SystemState.key, SystemState.value).filter(
+                SystemState.key.like(f'{VERSION_KEY_PREFIX}%')
+            ).all()
+        finally:
+            db_session.close()
+
+        for key, value in rows:
+            namespace = key[len(VERSION_KEY_PREFIX):]
+            if _versions.get(namespace) != value:
+                _versions[namespace] = value
+                _cache.drop(namespace)
+        _versions_checked_at = now
+
+def invalidate(namespace):
+    """Сбросить кэш раздела во всех процессах (вызывать после коммита правки)"""
+    _cache.drop(namespace)
+    version = uuid.uuid4().hex
+    db_session = get_session()
+    try:
+        key = f'{VERSION_KEY_PREFIX}{namespace}'
+        state = db_session.query(SystemState).get(key)
+        if state is None:
+            db_session.add(SystemState(key=key, value=version))
+        else:
+            state.value = version
+        db_session.commit()
+        with _versions_lock:
+            _versions[namespace] = version
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка сброса кэша страниц {namespace}: {e}")
+    finally:
+        db_session.close()
+
+def _cache_key(namespace):
+    return (
+        namespace,
+        request.endpoint,
+        tuple(sorted((request.view_args or {}).items())),
+        tuple(sorted(request.args.items(multi=True))),
+        session.get('role'),
+    )
+
+def _render_blocks(template_name, context):
+    template = current_app.jinja_env.get_template(template_name)
+    current_app.update_template_context(context)
+    blocks = {}
+    for name in ('title', 'content'):
+        blocks[name] = Markup(''.join(template.blocks[name](template.new_context(context))))
+    blocks['etag'] = hashlib.sha1((blocks['title'] + blocks['content']).encode()).hexdigest()
+    return blocks
+
+def render_cached(namespace, template_name, load_context):
+    """Страница из кэша или load_context() -> контекст шаблона
+
+    Если load_context возвращает ответ (redirect), он отдаётся без кэширования.
+    ETag страницы - хэш фрагмента, поэтому повторный запрос получает 304.
+    """
+    _sync_versions()
+    key = _cache_key(namespace)
+    blocks = _cache.get(key)
+
+    if blocks is None:
+        generation = _cache.generation(namespace)
+        context = load_context()
+        if not isinstance(context, dict):
+            return context
+        blocks = _render_blocks(template_name, context)
+        _cache.set(key, blocks, generation)
+
+    return conditional(blocks['etag'], lambda: render_template('cached_page.html', blocks=blocks))
+
+def cache_stats():
+    """Метрики кэша страниц процесса"""
+    return _cache.stats()
@@ -0,0 +1,110 @@
+import base64
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, date, timedelta
+from sqlalchemy import or_, tuple_
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+@dataclass
+class Page:
+    """Страница списка и курсор для следующей"""
+    items: list
+    next_cursor: str = None
+    filters: dict = field(default_factory=dict)
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+@dataclass
+class ListSpec:
+    """Описание пагинируемого списка: модель, колонка сортировки и допустимые фильтры"""
+    model: type
+    sort_column: object
+    filters: dict = field(default_factory=dict)  # параметр запроса -> колонка
+
+def encode_cursor(sort_value, row_id):
+    """Курсор = (значение сортировки или None, id) последней строки страницы"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Разбор курсора; ValueError при неверном формате"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if sort_value is not None:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Неверный курсор: {cursor}") from e
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+def apply_filters(query, spec, args):
+    """Фильтры из параметров запроса переносятся в SQL; возвращает (query, применённые фильтры)"""
+    applied = {}
+
+    for param, column in spec.filters.items():
+        value = args.get(param)
+        if value in (None, ''):
+            continue
+        if param == 'user':
+            value = int(value)
+        query = query.filter(column == value)
+        applied[param] = value
+
+    date_from = _parse_date(args.get('date_from'))
+    if date_from:
+        query = query.filter(spec.sort_column >= date_from)
+        applied['date_from'] = date_from.isoformat()
+
+    date_to = _parse_date(args.get('date_to'))
+    if date_to:
+        query = query.filter(spec.sort_column < date_to + timedelta(days=1))
+        applied['date_to'] = date_to.isoformat()
+
+    return query, applied
+
+def keyset_page(query, spec, args, limit=PAGE_SIZE):
+    """Страница по ключу (sort_column, id) в порядке убывания
+
+    Стоимость зависит от размера страницы, а не таблицы: вместо OFFSET
+    используется условие (sort, id) < (sort, id) последней показанной строки.
+    Строки без значения сортировки идут первыми (NULLS FIRST - порядок
+    обратного просмотра индекса в PostgreSQL), между собой - по id.
+    Неверные параметры фильтров и курсора приводят к ValueError.
+    """
+    id_column = spec.model.id
+    query, applied = apply_filters(query, spec, args)
+
+    cursor = args.get('cursor')
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if sort_value is None:
+            # Дочитываем строки без значения, затем все остальные
+            query = query.filter(or_(
+                (spec.sort_column.is_(None)) & (id_column < row_id),
+                spec.sort_column.isnot(None)
+            ))
+        else:
+            query = query.filter(tuple_(spec.sort_column, id_column) < tuple_(sort_value, row_id))
+
+    limit = max(1, min(int(args.get('limit') or limit), MAX_PAGE_SIZE))
+    rows = query.order_by(spec.sort_column.desc().nulls_first(), id_column.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, spec.sort_column.key), last.id)
+
+    return Page(items=rows, next_cursor=next_cursor, filters=applied)
@@ -0,0 +1,160 @@
+"""
+Фоновые задачи (статусы, аналитика, рассылки, очистка хранилища)
+
+Планировщик работает в одном воркере gunicorn, а не в мастере: мастер
+форкает воркеры, и потоки планировщика в нём могли бы держать блокировки
+logging или пула соединений в момент fork. Каждый воркер запускает
+run_when_leader(); планировщик запускает тот, кто получил
+pg_try_advisory_lock (для SQLite - flock файла). Остальные раз в
+SCHEDULER_LOCK_RETRY_SECONDS пробуют снова, поэтому после перезапуска
+воркера-лидера задачи подхватывает другой.
+"""
+
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import time
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+import config
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock лидера (у миграций - 724168100)
+SCHEDULER_LOCK_ID = 724168101
+
+_scheduler = None
+_lock = threading.Lock()
+_leader_thread = None
+
+def get_scheduler():
+    """Общий планировщик фоновых задач процесса"""
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = BackgroundScheduler(
+                timezone=config.TIMEZONE,
+                job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 300}
+            )
+        return _scheduler
+
+def start_scheduler():
+    """Регистрация фоновых задач и запуск планировщика (один раз на процесс)"""
+    scheduler = get_scheduler()
+    if scheduler.running:
+        return scheduler
+
+    from status_engine import register_jobs as register_status_jobs
+    register_status_jobs(scheduler)
+
+    from analytics import register_jobs as register_analytics_jobs
+    register_analytics_jobs(scheduler)
+
+    from fanout import register_jobs as register_fanout_jobs
+    register_fanout_jobs(scheduler)
+
+    from broadcast_sender import register_jobs as register_broadcast_jobs
+    register_broadcast_jobs(scheduler)
+
+    from file_storage import register_jobs as register_upload_jobs
+    register_upload_jobs(scheduler)
+
+    scheduler.start()
+    logger.info("Планировщик фоновых задач запущен")
+    return scheduler
+
+def shutdown_scheduler():
+    """Остановка планировщика"""
+    global _scheduler
+    with _lock:
+        if _scheduler is not None and _scheduler.running:
+            _scheduler.shutdown(wait=False)
+            logger.info("Планировщик фоновых задач остановлен")
+        _scheduler = None
+
+class LeaderLock:
+    """Блокировка «планировщик работает здесь» на время жизни процесса"""
+
+    def __init__(self):
+        self._conn = None
+        self._file = None
+
+    @property
+    def held(self):
+        return self._conn is not None or self._file is not None
+
+    def acquire(self):
+        from database import engine
+        if engine.dialect.name == 'postgresql':
+            # Отдельное соединение вне пула: блокировка живёт, пока оно открыто
+            lock_engine = create_engine(engine.url, poolclass=NullPool)
+            conn = lock_engine.connect()
+            if conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': SCHEDULER_LOCK_ID}).scalar():
+                conn.commit()
+                self._conn = conn
+                return True
+            conn.close()
+            return False
+
+        f = open(os.path.join(tempfile.gettempdir(), f'sapahr-scheduler-{SCHEDULER_LOCK_ID}.lock'), 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def alive(self):
+        """Соединение с блокировкой ещё открыто (иначе её мог взять другой процесс)"""
+        if self._conn is None:
+            return self._file is not None
+        try:
+            self._conn.execute(text("SELECT 1"))
+            self._conn.commit()
+            return True
+        except Exception as e:
+            logger.warning(f"Потеряно соединение с блокировкой планировщика: {e}")
+            self.release()
+            return False
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+_leader_lock = LeaderLock()
+
+def _leader_loop():
+    while True:
+        try:
+            if _leader_lock.held:
+                if not _leader_lock.alive():
+                    shutdown_scheduler()
+            elif _leader_lock.acquire():
+                logger.info(f"Процесс {os.getpid()} выполняет фоновые задачи")
+                start_scheduler()
+        except Exception as e:
+            logger.error(f"Ошибка выбора процесса для фоновых задач: {e}")
+        time.sleep(config.SCHEDULER_LOCK_RETRY_SECONDS)
+
+def run_when_leader():
+    """Запустить планировщик в этом процессе, если он первым получит блокировку"""
+    global _leader_thread
+    if _leader_thread is None or not _leader_thread.is_alive():
+        _leader_thread = threading.Thread(target=_leader_loop, name='scheduler-leader', daemon=True)
+        _leader_thread.start()
+
+def stop_leader():
+    """Остановить планировщик и отдать блокировку (при остановке процесса)"""
+    shutdown_scheduler()
+    _leader_lock.release()
@@ -0,0 +1,435 @@
+"""
+Схема БД по версиям миграций (см. migrations.py)
+
+Миграции не используют модели database.py: модели описывают текущую
+схему, а миграция должна выполнять тот DDL, который был на момент её
+версии, иначе новая и обновляемая БД получают разную схему. Здесь
+таблицы и индексы зафиксированы в том виде, в каком их создаёт
+миграция. Определения не меняются вместе с моделями: изменение схемы -
+это новая миграция и, если нужно, новые определения ниже.
+
+Индексы базовых таблиц не входят в определения таблиц: их строит
+миграция 3 (CONCURRENTLY в PostgreSQL) и для новой, и для старой БД.
+Индекс записывается как (имя, таблица, колонки).
+"""
+
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, String, DateTime, Date, Boolean, Text, Float, ForeignKey, Index, UniqueConstraint
+
+metadata = MetaData()
+
+# Версия 1: базовая схема
+
+schema_version = Table(
+    'schema_version', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, default=datetime.utcnow),
+)
+
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('telegram_id', String, unique=True, nullable=True),
+    Column('username', String, nullable=True),
+    Column('email', String, unique=True, nullable=True),
+    Column('password', String, nullable=True),
+    Column('first_name', String),
+    Column('last_name', String),
+    Column('phone', String),
+    Column('company', String),
+    Column('position', String),
+    Column('department', String),
+    Column('avatar', String),
+    Column('role', String, default='employee'),
+    Column('role_level', Integer, default=1),
+    Column('points', Integer, default=0),
+    Column('level', Integer, default=1),
+    Column('is_active', Boolean, default=True),
+    Column('onboarding_completed', Boolean, default=False),
+    Column('onboarding_progress', Integer, default=0),
+    Column('work_status', String, default='active'),
+    Column('hire_date', DateTime),
+    Column('termination_date', DateTime),
+    Column('termination_reason', String),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+vacations = Table(
+    'vacations', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('start_date', DateTime),
+    Column('end_date', DateTime),
+    Column('days_count', Integer),
+    Column('status', String, default='pending'),
+    Column('reason', Text),
+    Column('admin_comment', Text),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+admins = Table(
+    'admins', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('telegram_id', String, unique=True, nullable=True),
+    Column('email', String, unique=True, nullable=True),
+    Column('login', String, unique=True, nullable=True),
+    Column('password', String, nullable=True),
+    Column('level', Integer, default=1),
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Column('updated_at', DateTime, default=datetime.utcnow),
+)
+
+requests = Table(
+    'requests', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('request_type', String),
+    Column('title', String),
+    Column('description', Text),
+    Column('status', String, default='pending'),
+    Column('admin_comment', Text),
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Column('updated_at', DateTime),
+)
+
+news = Table(
+    'news', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String),
+    Column('content', Text),
+    Column('image_url', String),
+    Column('category', String),
+    Column('author', String),
+    Column('views', Integer, default=0),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+activities = Table(
+    'activities', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('activity_type', String),
+    Column('description', Text),
+    Column('points', Integer, default=0),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+notifications = Table(
+    'notifications', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('title', String),
+    Column('message', Text),
+    Column('is_read', Boolean, default=False),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+reminders = Table(
+    'reminders', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('title', String),
+    Column('message', Text),
+    Column('reminder_date', DateTime),
+    Column('is_sent', Boolean, default=False),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+purchase_executors = Table(
+    'purchase_executors', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String),
+    Column('company', String),
+    Column('email', String),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+broadcasts = Table(
+    'broadcasts', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String),
+    Column('message', Text),
+    Column('sent_to', Text),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+knowledge_categories = Table(
+    'knowledge_categories', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('description', Text),
+    Column('icon', String, default='📚'),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+knowledge_articles = Table(
+    'knowledge_articles', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('category_id', Integer, ForeignKey('knowledge_categories.id')),
+    Column('title', String, nullable=False),
+    Column('content', Text, nullable=False),
+    Column('author', String),
+    Column('views', Integer, default=0),
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Column('updated_at', DateTime),
+)
+
+polls = Table(
+    'polls', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String, nullable=False),
+    Column('description', Text),
+    Column('is_active', Boolean, default=True),
+    Column('total_responses', Integer, default=0),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+poll_questions = Table(
+    'poll_questions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('poll_id', Integer, ForeignKey('polls.id')),
+    Column('question', String, nullable=False),
+    Column('options', Text, nullable=False),
+    Column('votes', Text, default='{}'),
+    Column('total_votes', Integer, default=0),
+    Column('order', Integer, default=0),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+onboarding = Table(
+    'onboarding', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('title', String),
+    Column('description', Text),
+    Column('assignee', String),
+    Column('status', String, default='pending'),
+    Column('progress', Integer, default=0),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+candidates = Table(
+    'candidates', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String),
+    Column('position', String),
+    Column('status', String, default='new'),
+    Column('source', String),
+    Column('phone', String),
+    Column('email', String),
+    Column('resume_url', String),
+    Column('interview_date', DateTime),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+courses = Table(
+    'courses', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String, nullable=False),
+    Column('description', Text),
+    Column('category', String),
+    Column('duration', Integer),
+    Column('points', Integer, default=0),
+    Column('icon', String, default='📚'),
+    Column('is_active', Boolean, default=True),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+course_enrollments = Table(
+    'course_enrollments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('course_id', Integer, ForeignKey('courses.id')),
+    Column('progress', Integer, default=0),
+    Column('status', String, default='in_progress'),
+    Column('score', Integer),
+    Column('started_at', DateTime, default=datetime.utcnow),
+    Column('completed_at', DateTime),
+)
+
+quizzes = Table(
+    'quizzes', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('course_id', Integer, ForeignKey('courses.id')),
+    Column('question', String, nullable=False),
+    Column('options', Text),
+    Column('correct_answer', String),
+    Column('points', Integer, default=10),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+employee_metrics = Table(
+    'employee_metrics', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('metric_type', String),
+    Column('value', Float),
+    Column('period', String),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+request_templates = Table(
+    'request_templates', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String, nullable=False),
+    Column('description', Text),
+    Column('company', String, nullable=False),
+    Column('icon', String, default='📝'),
+    Column('color', String, default='#E8F5E9'),
+    Column('created_by', Integer, ForeignKey('users.id')),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+request_files = Table(
+    'request_files', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('template_id', Integer, ForeignKey('request_templates.id')),
+    Column('filename', String, nullable=False),
+    Column('original_name', String, nullable=True),
+    Column('file_path', String, nullable=True),
+    Column('file_url', String, nullable=False),
+    Column('file_type', String),
+    Column('company', String, nullable=False),
+    Column('uploaded_by', Integer, ForeignKey('users.id')),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+system_state = Table(
+    'system_state', metadata,
+    Column('key', String, primary_key=True),
+    Column('value', String),
+    Column('updated_at', DateTime, default=datetime.utcnow),
+)
+
+analytics_daily = Table(
+    'analytics_daily', metadata,
+    Column('day', Date, primary_key=True),
+    Column('metric', String, primary_key=True),
+    Column('dimension', String, primary_key=True, default=''),
+    Column('value', Integer, default=0),
+)
+
+BASELINE_TABLES = [
+    schema_version, users, vacations, admins, requests, news, activities, notifications, reminders,
+    purchase_executors, broadcasts, knowledge_categories, knowledge_articles, polls, poll_questions,
+    onboarding, candidates, courses, course_enrollments, quizzes, employee_metrics, request_templates,
+    request_files, system_state, analytics_daily,
+]
+
+# Версия 3: индексы горячих фильтров и сортировок
+MODEL_INDEXES = [
+    ('ix_users_role_work_status', 'users', ('role', 'work_status')),
+    ('ix_users_role_level', 'users', ('role_level',)),
+    ('ix_users_company', 'users', ('company',)),
+    ('ix_users_points', 'users', ('points',)),
+    ('ix_vacations_created_at_id', 'vacations', ('created_at', 'id')),
+    ('ix_vacations_user_id_created_at_id', 'vacations', ('user_id', 'created_at', 'id')),
+    ('ix_vacations_status_created_at_id', 'vacations', ('status', 'created_at', 'id')),
+    ('ix_requests_created_at_id', 'requests', ('created_at', 'id')),
+    ('ix_requests_user_id_created_at_id', 'requests', ('user_id', 'created_at', 'id')),
+    ('ix_requests_status_created_at_id', 'requests', ('status', 'created_at', 'id')),
+    ('ix_news_created_at_id', 'news', ('created_at', 'id')),
+    ('ix_activities_created_at_id', 'activities', ('created_at', 'id')),
+    ('ix_activities_user_id_created_at_id', 'activities', ('user_id', 'created_at', 'id')),
+    ('ix_notifications_created_at_id', 'notifications', ('created_at', 'id')),
+    ('ix_notifications_user_id_created_at_id', 'notifications', ('user_id', 'created_at', 'id')),
+    ('ix_reminders_user_id', 'reminders', ('user_id',)),
+    ('ix_reminders_reminder_date_id', 'reminders', ('reminder_date', 'id')),
+    ('ix_broadcasts_created_at_id', 'broadcasts', ('created_at', 'id')),
+    ('ix_knowledge_articles_category_id', 'knowledge_articles', ('category_id',)),
+    ('ix_knowledge_articles_created_at', 'knowledge_articles', ('created_at',)),
+    ('ix_polls_is_active_created_at', 'polls', ('is_active', 'created_at')),
+    ('ix_polls_created_at', 'polls', ('created_at',)),
+    ('ix_poll_questions_poll_id', 'poll_questions', ('poll_id',)),
+    ('ix_onboarding_user_id_status', 'onboarding', ('user_id', 'status')),
+    ('ix_request_templates_company', 'request_templates', ('company',)),
+    ('ix_request_files_company', 'request_files', ('company',)),
+    ('ix_request_files_template_id', 'request_files', ('template_id',)),
+]
+
+# Версия 4: голоса опросов строками
+poll_votes = Table(
+    'poll_votes', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('poll_id', Integer, ForeignKey('polls.id', ondelete='CASCADE'), nullable=False),
+    Column('question_id', Integer, ForeignKey('poll_questions.id', ondelete='CASCADE'), nullable=False),
+    Column('option', String, nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='SET NULL')),
+    Column('created_at', DateTime, default=datetime.utcnow),
+    UniqueConstraint('question_id', 'user_id', name='uq_poll_votes_question_user'),
+    Index('ix_poll_votes_question_id_option', 'question_id', 'option'),
+    Index('ix_poll_votes_poll_id_user_id', 'poll_id', 'user_id'),
+)
+
+# Версия 5: задачи массовой рассылки (last_user_id удалён в версии 6)
+notification_jobs = Table(
+    'notification_jobs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('kind', String, nullable=False),
+    Column('source_id', Integer),
+    Column('title', String),
+    Column('message', Text),
+    Column('audience', Text, default='{}'),
+    Column('status', String, default='pending'),
+    Column('total', Integer, default=0),
+    Column('processed', Integer, default=0),
+    Column('last_user_id', Integer, default=0),
+    Column('error', Text),
+    Column('created_by', Integer, ForeignKey('users.id', ondelete='SET NULL')),
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Column('heartbeat_at', DateTime),
+    Column('finished_at', DateTime),
+    Index('ix_notification_jobs_status', 'status'),
+    Index('ix_notification_jobs_kind_source_id', 'kind', 'source_id'),
+)
+
+# Версия 6: отметки о прочтении общих уведомлений
+notification_reads = Table(
+    'notification_reads', metadata,
+    Column('notification_id', Integer, ForeignKey('notifications.id', ondelete='CASCADE'), primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    Column('read_at', DateTime, default=datetime.utcnow),
+    Index('ix_notification_reads_user_id', 'user_id'),
+)
+
+# Версия 7
+SHARED_NOTIFICATIONS_INDEXES = [
+    ('ix_notifications_audience_created_at_id', 'notifications', ('audience', 'created_at', 'id')),
+]
+
+# Версия 11
+USERS_UPDATED_AT_INDEXES = [
+    ('ix_users_updated_at', 'users', ('updated_at',)),
+]
+
+# Версия 12: доставка рассылок в Telegram
+broadcast_deliveries = Table(
+    'broadcast_deliveries', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('broadcast_id', Integer, ForeignKey('broadcasts.id', ondelete='CASCADE'), nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+    Column('chat_id', String, nullable=False),
+    Column('status', String, default='pending'),
+    Column('attempts', Integer, default=0),
+    Column('error', Text),
+    Column('sent_at', DateTime),
+    UniqueConstraint('broadcast_id', 'user_id', name='uq_broadcast_deliveries_broadcast_user'),
+    Index('ix_broadcast_deliveries_broadcast_status', 'broadcast_id', 'status', 'id'),
+)
+
+# Версия 13: хранилище файлов по хэшу
+stored_blobs = Table(
+    'stored_blobs', metadata,
+    Column('content_hash', String(64), primary_key=True),
+    Column('size', BigInteger, nullable=False),
+    Column('ref_count', Integer, default=0, nullable=False),
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Column('released_at', DateTime),
+    Index('ix_stored_blobs_released_at', 'released_at'),
+)
+
+# Версия 14
+REQUEST_FILES_CONTENT_HASH_INDEXES = [
+    ('ix_request_files_content_hash', 'request_files', ('content_hash',)),
+]
@@ -0,0 +1,161 @@
+"""
+Полнотекстовый поиск по новостям, базе знаний, заявкам и сотрудникам
+
+В PostgreSQL у news, knowledge_articles и requests есть генерируемая колонка
+search_tsv (см. миграцию search_vectors) с GIN-индексом: заголовок с весом A,
+текст с весом B, в конфигурациях russian, english и simple (казахский
+и прочие слова без стемминга). Колонка пересчитывается самой БД при записи.
+Имена сотрудников ищутся по триграммному индексу (pg_trgm).
+В SQLite и без миграций используется ILIKE.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from markupsafe import Markup, escape
+from sqlalchemy import func, literal_column, or_, select, text
+from database import User, News, Request, KnowledgeArticle
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIGS = ['russian', 'english', 'simple']
+
+# Индексируемые поля: таблица -> (заголовок, текст, текст в HTML)
+SEARCH_FIELDS = {
+    'news': ('title', 'content', False),
+    'knowledge_articles': ('title', 'content', True),
+    'requests': ('title', 'description', False),
+}
+
+# Выражение триграммного индекса по ФИО и email
+USER_NAME_SQL = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || coalesce(email, ''))"
+
+# Маркеры подсветки из ts_headline; заменяются на <mark> после экранирования
+_START, _STOP = '\x02', '\x03'
+HEADLINE_OPTIONS = f'StartSel={_START}, StopSel={_STOP}, MaxFragments=2, MaxWords=25, MinWords=8, FragmentDelimiter=" … "'
+
+SNIPPET_LENGTH = 150
+
+@dataclass
+class SearchHit:
+    """Найденный объект, релевантность и фрагмент текста с подсветкой"""
+    item: object
+    rank: float
+    snippet: Markup
+
+def _body_sql(table, qualified=False):
+    """Текст документа без HTML-разметки"""
+    _, body, is_html = SEARCH_FIELDS[table]
+    column = f'{table}.{body}' if qualified else body
+    return f"regexp_replace({column}, '<[^>]+>', ' ', 'g')" if is_html else column
+
+def search_vector_sql(table):
+    """Выражение генерируемой колонки search_tsv для таблицы"""
+    title = SEARCH_FIELDS[table][0]
+    parts = []
+    for weight, column in (('A', title), ('B', _body_sql(table))):
+        for config in SEARCH_CONFIGS:
+            parts.append(f"setweight(to_tsvector('{config}'::regconfig, coalesce({column}, '')), '{weight}')")
+    return ' || '.join(parts)
+
+def _tsquery(query):
+    """Запрос во всех конфигурациях, объединённый через ИЛИ"""
+    combined = None
+    for config in SEARCH_CONFIGS:
+        part = func.websearch_to_tsquery(literal_column(f"'{config}'::regconfig"), query)
+        combined = part if combined is None else combined.op('||')(part)
+    return combined
+
+def _marked(snippet):
+    """Экранирование фрагмента и замена маркеров ts_headline на <mark>"""
+    escaped = str(escape(snippet or ''))
+    return Markup(escaped.replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+def _highlight(text_value, query):
+    """Подсветка вхождений запроса для ILIKE-поиска"""
+    plain = re.sub(r'<[^>]+>', ' ', text_value or '')
+    position = plain.lower().find(query.lower())
+    start = max(0, position - SNIPPET_LENGTH // 3) if position > 0 else 0
+    fragment = plain[start:start + SNIPPET_LENGTH]
+
+    escaped = str(escape(fragment))
+    pattern = re.compile(re.escape(str(escape(query))), re.IGNORECASE)
+    return Markup(pattern.sub(lambda m: f'<mark>{m.group(0)}</mark>', escaped))
+
+_search_ready = {}
+
+def fulltext_available(db_session):
+    """Есть ли в БД колонки search_tsv и pg_trgm (проверяется один раз на процесс)"""
+    bind = db_session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return {'tsv': False, 'trgm': False}
+
+    if not _search_ready:
+        row = db_session.execute(text(
+            "SELECT "
+            "EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'news' AND column_name = 'search_tsv'), "
+            "EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+        )).one()
+        _search_ready.update({'tsv': row[0], 'trgm': row[1]})
+    return _search_ready
+
+def _fulltext(db_session, model, query, limit):
+    table = model.__tablename__
+    tsv = literal_column(f'{table}.search_tsv')
+    tsq = _tsquery(query)
+    rank = func.ts_rank_cd(tsv, tsq)
+
+    # Сначала лучшие id по релевантности, фрагменты строятся только для них
+    ranked = select(model.id.label('id'), rank.label('rank')).where(tsv.op('@@')(tsq)) \
+        .order_by(rank.desc()).limit(limit).subquery()
+
+    body = func.coalesce(literal_column(_body_sql(table, qualified=True)), '')
+    headline = func.ts_headline(literal_column("'russian'::regconfig"), body, tsq, HEADLINE_OPTIONS)
+
+    rows = db_session.query(model, ranked.c.rank, headline).join(ranked, model.id == ranked.c.id) \
+        .order_by(ranked.c.rank.desc()).all()
+    return [SearchHit(item, float(rank_value or 0), _marked(snippet)) for item, rank_value, snippet in rows]
+
+def _ilike(db_session, model, title_column, body_column, query, limit):
+    pattern = f'%{query}%'
+    rows = db_session.query(model).filter(or_(title_column.ilike(pattern), body_column.ilike(pattern))) \
+        .order_by(model.created_at.desc()).limit(limit).all()
+    return [SearchHit(item, 0.0, _highlight(getattr(item, body_column.key), query)) for item in rows]
+
+def search_employees(db_session, query, limit=5, use_trgm=False):
+    """Сотрудники по ФИО/email: подстрока или похожее написание (триграммы)"""
+    name = literal_column(USER_NAME_SQL)
+    needle = query.lower()
+    conditions = [name.like(f'%{needle}%')]
+    order = User.first_name
+
+    if use_trgm:
+        conditions.append(name.op('%')(needle))
+        order = func.similarity(name, needle).desc()
+
+    return db_session.query(User).filter(or_(*conditions)).order_by(order).limit(limit).all()
+
+def search_all(db_session, query, include_requests=False, limit=5):
+    """Поиск по всем разделам: {раздел: [SearchHit | User]}"""
+    query = (query or '').strip()
+    results = {'employees': [], 'news': [], 'articles': [], 'requests': []}
+    if not query:
+        return results
+
+    available = fulltext_available(db_session)
+    results['employees'] = search_employees(db_session, query, limit, available['trgm'])
+
+    sources = [
+        ('news', News, News.title, News.content),
+        ('articles', KnowledgeArticle, KnowledgeArticle.title, KnowledgeArticle.content),
+    ]
+    if include_requests:
+        sources.append(('requests', Request, Request.title, Request.description))
+
+    for key, model, title_column, body_column in sources:
+        if available['tsv']:
+            results[key] = _fulltext(db_session, model, query, limit)
+        else:
+            results[key] = _ilike(db_session, model, title_column, body_column, query, limit)
+
+    return results
@@ -0,0 +1,79 @@
+// Загрузка больших файлов частями: при обрыве связи продолжается с принятого смещения
+const UPLOAD_RETRIES = 5;
+
+async function uploadInChunks(form, file, progress) {
+    const response = await fetch(form.dataset.startUrl, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    let upload = await response.json();
+    if (!response.ok) {
+        throw new Error(upload.error);
+    }
+
+    const url = `${form.dataset.startUrl}/${upload.upload_id}`;
+    let failures = 0;
+    while (!upload.complete) {
+        if (upload.hashing) {
+            // Все части приняты, сервер досчитывает хэш файла
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            const status = await fetch(url, { credentials: 'same-origin' });
+            if (!status.ok) {
+                throw new Error((await status.json()).error);
+            }
+            upload = Object.assign(upload, await status.json());
+            continue;
+        }
+        const chunk = file.slice(upload.offset, upload.offset + upload.chunk_size);
+        try {
+            const result = await fetch(`${url}?offset=${upload.offset}`, {
+                method: 'PUT',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: chunk
+            });
+            const state = await result.json();
+            if (!result.ok && result.status !== 409) {
+                throw new Error(state.error);
+            }
+            // 409: сервер принял другой объём - продолжаем с его смещения
+            upload = Object.assign(upload, state);
+            failures = 0;
+        } catch (error) {
+            if (++failures > UPLOAD_RETRIES) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+            const status = await fetch(url, { credentials: 'same-origin' });
+            if (status.ok) {
+                upload = Object.assign(upload, await status.json());
+            }
+        }
+        progress.textContent = `${Math.floor(upload.offset / upload.size * 100)}%`;
+    }
+    return upload.upload_id;
+}
+
+document.querySelectorAll('form.chunked-upload').forEach(form => {
+    form.addEventListener('submit', async event => {
+        const input = form.querySelector('input[type="file"]');
+        const file = input.files[0];
+        // Небольшие файлы отправляются обычной формой
+        if (!file || file.size < Number(form.dataset.formMax) / 2 || form.upload_id.value) {
+            return;
+        }
+
+        event.preventDefault();
+        const progress = form.querySelector('.upload-progress');
+        try {
+            form.upload_id.value = await uploadInChunks(form, file, progress);
+            input.disabled = true;
+            form.submit();
+        } catch (error) {
+            console.error('Error:', error);
+            progress.textContent = `Ошибка загрузки: ${error.message}`;
+        }
+    });
+});
@@ -0,0 +1,29 @@
+// Обновление статуса массовых рассылок, пока они не опубликованы
+function refreshJobProgress() {
+    const pending = document.querySelectorAll('.job-progress[data-status="pending"], .job-progress[data-status="running"]');
+    if (!pending.length) {
+        return;
+    }
+
+    pending.forEach(element => {
+        fetch(element.dataset.jobUrl, { credentials: 'same-origin' })
+            .then(response => response.json())
+            .then(job => {
+                element.dataset.status = job.status;
+                if (job.status === 'failed') {
+                    element.textContent = 'Ошибка';
+                } else if (element.dataset.kind === 'telegram') {
+                    if (job.status !== 'pending') {
+                        element.textContent = `Отправлено ${job.processed} из ${job.total}`;
+                    }
+                } else if (job.status === 'done') {
+                    element.textContent = `Прочитали ${job.reads} из ${job.total}`;
+                }
+            })
+            .catch(error => console.error('Error:', error));
+    });
+
+    setTimeout(refreshJobProgress, 2000);
+}
+
+document.addEventListener('DOMContentLoaded', refreshJobProgress);
@@ -0,0 +1,32 @@
+// Подгрузка следующей страницы списка по курсору ("Показать ещё")
+document.addEventListener('click', function(event) {
+    const button = event.target.closest('.load-more-btn');
+    if (!button) {
+        return;
+    }
+
+    button.disabled = true;
+    const url = new URL(button.dataset.endpoint, window.location.origin);
+    url.searchParams.set('cursor', button.dataset.cursor);
+
+    fetch(url, { credentials: 'same-origin' })
+        .then(response => response.json().then(data => {
+            if (!response.ok) {
+                throw new Error(data.error || response.statusText);
+            }
+            return data;
+        }))
+        .then(data => {
+            document.getElementById(button.dataset.target).insertAdjacentHTML('beforeend', data.html);
+            if (data.next_cursor) {
+                button.dataset.cursor = data.next_cursor;
+                button.disabled = false;
+            } else {
+                button.parentElement.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            button.disabled = false;
+        });
+});
@@ -0,0 +1,102 @@
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from sqlalchemy import select, func, true
+from database import User, Request, Vacation, News, Poll, Activity
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class HeadlineStats:
+    """Основные показатели для дашборда и HR-аналитики"""
+    total_users: int
+    registered_today: int
+    total_requests: int
+    pending_requests: int
+    approved_requests: int
+    active_vacations: int
+    vacation_days_total: int
+    total_news: int
+    total_polls: int
+    active_polls_count: int
+    total_poll_responses: int
+    total_visits_today: int
+
+    @property
+    def approval_rate(self):
+        if not self.total_requests:
+            return 0
+        return round(self.approved_requests / self.total_requests * 100, 1)
+
+    def as_dict(self):
+        data = asdict(self)
+        data['approval_rate'] = self.approval_rate
+        data['visitors_today'] = self.registered_today
+        return data
+
+@dataclass(frozen=True)
+class EmployeeStats:
+    """Личные показатели сотрудника"""
+    my_requests: int
+    my_vacations: int
+    my_points: int
+
+    def as_dict(self):
+        return asdict(self)
+
+def collect_headline_stats(db_session, today=None):
+    """Все показатели одним запросом: по подзапросу с условными агрегатами на таблицу"""
+    today = today or datetime.combine(datetime.now().date(), datetime.min.time())
+
+    users = select(
+        func.count().label('total_users'),
+        func.count().filter(User.created_at >= today).label('registered_today'),
+    ).select_from(User).subquery()
+
+    requests = select(
+        func.count().label('total_requests'),
+        func.count().filter(Request.status == 'pending').label('pending_requests'),
+        func.count().filter(Request.status == 'approved').label('approved_requests'),
+    ).select_from(Request).subquery()
+
+    vacations = select(
+        func.count().filter(Vacation.status == 'approved').label('active_vacations'),
+        func.coalesce(func.sum(Vacation.days_count), 0).label('vacation_days_total'),
+    ).select_from(Vacation).subquery()
+
+    news = select(func.count().label('total_news')).select_from(News).subquery()
+
+    polls = select(
+        func.count().label('total_polls'),
+        func.count().filter(Poll.is_active.is_(True)).label('active_polls_count'),
+        func.coalesce(func.sum(Poll.total_responses), 0).label('total_poll_responses'),
+    ).select_from(Poll).subquery()
+
+    activities = select(
+        func.count().label('total_visits_today'),
+    ).select_from(Activity).where(Activity.created_at >= today).subquery()
+
+    parts = [users, requests, vacations, news, polls, activities]
+    joined = parts[0]
+    for part in parts[1:]:
+        joined = joined.join(part, true())
+
+    columns = [column for part in parts for column in part.c]
+    row = db_session.execute(select(*columns).select_from(joined)).one()
+
+    return HeadlineStats(**{key: int(value or 0) for key, value in row._mapping.items()})
+
+def collect_employee_stats(db_session, user_id):
+    """Личные показатели сотрудника одним запросом"""
+    my_requests = select(func.count()).select_from(Request).where(Request.user_id == user_id).scalar_subquery()
+    my_vacations = select(func.count()).select_from(Vacation).where(Vacation.user_id == user_id).scalar_subquery()
+
+    row = db_session.execute(
+        select(
+            my_requests.label('my_requests'),
+            my_vacations.label('my_vacations'),
+            select(User.points).where(User.id == user_id).scalar_subquery().label('my_points'),
+        )
+    ).one()
+
+    return EmployeeStats(**{key: int(value or 0) for key, value in row._mapping.items()})
@@ -0,0 +1,94 @@
+import logging
+from datetime import datetime, time, timedelta
+import pytz
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+import config
+from database import get_session, User, SystemState
+
+logger = logging.getLogger(__name__)
+
+# Ключ отметки последнего применённого перехода в system_state
+STATE_KEY = 'work_status_transition'
+
+# Роли, статус которых переключается автоматически
+AUTO_STATUS_ROLES = ['employee', 'manager']
+
+def latest_boundary(now=None):
+    """Последняя наступившая граница рабочего дня: (момент, новый статус)
+
+    Пн-Пт в WORK_DAY_START_HOUR сотрудники становятся 'active',
+    в WORK_DAY_END_HOUR — 'none'.
+    """
+    tz = pytz.timezone(config.TIMEZONE)
+    now = now or datetime.now(tz)
+    day = now.date()
+
+    for _ in range(8):
+        if day.weekday() < 5:
+            for hour, status in ((config.WORK_DAY_END_HOUR, 'none'), (config.WORK_DAY_START_HOUR, 'active')):
+                boundary = tz.localize(datetime.combine(day, time(hour)))
+                if boundary <= now:
+                    return boundary, status
+        day -= timedelta(days=1)
+
+    return None, None
+
+def apply_transition(boundary, status):
+    """Применение перехода одним UPDATE, не более одного раза на границу
+
+    Отметка и смена статусов фиксируются в одной транзакции, поэтому
+    перезапуски и параллельные воркеры не повторяют работу.
+    Возвращает количество обновлённых пользователей или None, если переход уже применён.
+    """
+    slot = boundary.strftime('%Y-%m-%dT%H:%M')
+    db_session = get_session()
+
+    try:
+        state = db_session.query(SystemState).filter_by(key=STATE_KEY).with_for_update().first()
+        if state is None:
+            state = SystemState(key=STATE_KEY)
+            db_session.add(state)
+            db_session.flush()
+
+        if state.value and state.value >= slot:
+            db_session.rollback()
+            return None
+
+        users = db_session.query(User).filter(User.role.in_(AUTO_STATUS_ROLES))
+        if status == 'active':
+            # Отпуск и больничный не перезаписываем
+            users = users.filter(or_(User.work_status.is_(None), User.work_status.notin_(['vacation', 'sick'])))
+        else:
+            users = users.filter(User.work_status.in_(['active', 'remote']))
+
+        updated = users.update({'work_status': status}, synchronize_session=False)
+        state.value = slot
+        db_session.commit()
+
+        logger.info(f"Статусы обновлены ({slot} -> {status}): {updated} пользователей")
+        return updated
+    except IntegrityError:
+        # Отметку одновременно создал другой воркер — переход выполняет он
+        db_session.rollback()
+        return None
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка при обновлении статусов: {e}")
+        return None
+    finally:
+        db_session.close()
+
+def sync_work_status():
+    """Применение последней наступившей границы рабочего дня"""
+    boundary, status = latest_boundary()
+    if boundary is None:
+        return None
+    return apply_transition(boundary, status)
+
+def register_jobs(scheduler):
+    """Задачи статусного движка: переходы по расписанию и догоняющий запуск при старте"""
+    hours = f"{config.WORK_DAY_START_HOUR},{config.WORK_DAY_END_HOUR}"
+    scheduler.add_job(sync_work_status, 'cron', day_of_week='mon-fri', hour=hours, minute=0,
+                      id='work_status_transition', replace_existing=True)
+    scheduler.add_job(sync_work_status, id='work_status_catch_up', replace_existing=True)
@@ -0,0 +1,70 @@
+"""Постраничный вывод по ключу: строки без значения сортировки (NULL)"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from pagination import ListSpec, decode_cursor, encode_cursor, keyset_page
+
+Base = declarative_base()
+
+class Item(Base):
+    __tablename__ = 'items'
+    id = Column(Integer, primary_key=True)
+    due = Column(DateTime)
+
+SPEC = ListSpec(Item, Item.due)
+
+@pytest.fixture
+def db_session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    start = datetime(2026, 1, 1, 9, 30)
+    # NULL вперемешку с датами, есть одинаковые даты
+    for i in range(1, 24):
+        due = None if i % 3 == 0 else start + timedelta(days=i % 5)
+        session.add(Item(id=i, due=due))
+    session.commit()
+    yield session
+    session.close()
+
+def all_pages(db_session, limit):
+    seen, cursor = [], None
+    while True:
+        page = keyset_page(db_session.query(Item), SPEC, {'cursor': cursor}, limit=limit)
+        seen.extend(page.items)
+        if not page.has_more:
+            return seen
+        cursor = page.next_cursor
+
+@pytest.mark.parametrize('cursor_value', [None, datetime(2026, 1, 3, 9, 30, 15)])
+def test_cursor_round_trip(cursor_value):
+    assert decode_cursor(encode_cursor(cursor_value, 42)) == (cursor_value, 42)
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor('не курсор')
+
+@pytest.mark.parametrize('limit', [1, 2, 5, 7, 50])
+def test_pages_cover_rows_with_null_sort_once(db_session, limit):
+    rows = all_pages(db_session, limit)
+    ids = [row.id for row in rows]
+
+    assert sorted(ids) == list(range(1, 24))
+    assert len(ids) == len(set(ids))
+
+    # Сначала строки без даты (id по убыванию), затем даты по убыванию
+    nulls = [row.id for row in rows if row.due is None]
+    assert ids[:len(nulls)] == sorted(nulls, reverse=True)
+    keys = [(row.due, row.id) for row in rows[len(nulls):]]
+    assert keys == sorted(keys, reverse=True)
+
+def test_cursor_inside_null_rows(db_session):
+    page = keyset_page(db_session.query(Item), SPEC, {}, limit=2)
+    assert decode_cursor(page.next_cursor) == (None, page.items[-1].id)
+
+    next_page = keyset_page(db_session.query(Item), SPEC, {'cursor': page.next_cursor}, limit=2)
+    assert [row.id for row in next_page.items] == [15, 12]
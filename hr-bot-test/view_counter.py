@@ -0,0 +1,100 @@
+"""
+Буферизованные счётчики просмотров новостей и статей базы знаний
+
+Просмотр не пишет в БД: приращение копится в памяти процесса и раз в
+VIEW_FLUSH_SECONDS (или при переполнении буфера) записывается пачкой
+UPDATE ... SET views = views + n. Повторный просмотр того же материала тем
+же пользователем в течение VIEW_DEDUP_MINUTES не считается. При остановке
+процесса буфер сбрасывается (atexit и worker_exit в gunicorn).
+"""
+
+import atexit
+import logging
+import threading
+import time
+from sqlalchemy import bindparam, func, update
+import config
+from database import get_session, News, KnowledgeArticle
+
+logger = logging.getLogger(__name__)
+
+COUNTED_MODELS = {'news': News, 'knowledge_articles': KnowledgeArticle}
+
+_lock = threading.Lock()
+_pending = {}   # (таблица, id) -> несохранённые просмотры
+_seen = {}      # (таблица, id, зритель) -> время, до которого повтор не считается
+_wakeup = threading.Event()
+_flusher = None
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name='view-counter', daemon=True)
+        _flusher.start()
+
+def record_view(table, object_id, viewer=None):
+    """Учесть просмотр; возвращает False для повторного просмотра в окне дедупликации"""
+    now = time.monotonic()
+    with _lock:
+        if viewer is not None:
+            key = (table, object_id, viewer)
+            if _seen.get(key, 0) > now:
+                return False
+            _seen[key] = now + config.VIEW_DEDUP_MINUTES * 60
+
+        _pending[(table, object_id)] = _pending.get((table, object_id), 0) + 1
+        overflow = len(_pending) >= config.VIEW_BUFFER_MAX
+        _ensure_flusher()
+
+    if overflow:
+        _wakeup.set()
+    return True
+
+def pending_views(table, object_id):
+    """Просмотры процесса, ещё не записанные в БД"""
+    return _pending.get((table, object_id), 0)
+
+def flush():
+    """Записать накопленные просмотры в БД; при ошибке они возвращаются в буфер"""
+    now = time.monotonic()
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        for key in [key for key, until in _seen.items() if until <= now]:
+            del _seen[key]
+
+    if not batch:
+        return 0
+
+    db_session = get_session()
+    try:
+        for name, model in COUNTED_MODELS.items():
+            # Порядок по id, чтобы параллельные сбросы не блокировали друг друга
+            rows = [{'row_id': object_id, 'delta': count}
+                    for (key, object_id), count in sorted(batch.items()) if key == name]
+            if rows:
+                table = model.__table__
+                db_session.connection().execute(
+                    update(table).where(table.c.id == bindparam('row_id'))
+                    .values(views=func.coalesce(table.c.views, 0) + bindparam('delta')),
+                    rows
+                )
+        db_session.commit()
+        return sum(batch.values())
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка записи счётчиков просмотров: {e}")
+        with _lock:
+            for key, count in batch.items():
+                _pending[key] = _pending.get(key, 0) + count
+        return 0
+    finally:
+        db_session.close()
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(config.VIEW_FLUSH_SECONDS)
+        _wakeup.clear()
+        flush()
+
+atexit.register(flush)
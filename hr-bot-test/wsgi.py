@@ -0,0 +1,7 @@
+"""
+WSGI-точка входа для production-сервера: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import app
+
+__all__ = ['app']